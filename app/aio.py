@@ -0,0 +1,82 @@
+import asyncio
+import atexit
+import os
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import aiohttp
+
+# Connection pool of the shared HTTP session
+MAX_CONNECTIONS = 100
+MAX_CONNECTIONS_PER_HOST = 20
+DNS_CACHE_TTL = 300
+
+_loop = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+_session = None
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Get the event loop shared by the async clients of this process, starting it on first use"""
+    global _loop, _loop_pid, _session
+    if _loop is None or _loop_pid != os.getpid():
+        with _loop_lock:
+            if _loop is None or _loop_pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='aio-loop', daemon=True).start()
+                # A loop (and its session) inherited through fork has no running thread
+                _session = None
+                _loop, _loop_pid = loop, os.getpid()
+    return _loop
+
+
+def use_loop(loop: asyncio.AbstractEventLoop):
+    """Share an event loop that is already running (e.g. the async server's) instead of starting one"""
+    global _loop, _loop_pid, _session
+    with _loop_lock:
+        _session = None
+        _loop, _loop_pid = loop, os.getpid()
+
+
+def run(coro, timeout: float = None):
+    """
+    Run a coroutine on the shared loop from synchronous code and wait for its result.
+    Must not be called from the loop's own thread.
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, get_loop())
+    try:
+        return future.result(timeout)
+    except FutureTimeoutError:
+        future.cancel()
+        raise
+
+
+async def get_session() -> aiohttp.ClientSession:
+    """Get the pooled HTTP session of the shared loop (only call from coroutines running on it)"""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=MAX_CONNECTIONS,
+            limit_per_host=MAX_CONNECTIONS_PER_HOST,
+            ttl_dns_cache=DNS_CACHE_TTL
+        )
+        _session = aiohttp.ClientSession(connector=connector)
+    return _session
+
+
+async def close_session():
+    if _session is not None and not _session.closed:
+        await _session.close()
+
+
+@atexit.register
+def _shutdown():
+    # A borrowed loop (async server, tests) is already closed by its owner at this point
+    if _loop is None or _loop_pid != os.getpid() or not _loop.is_running():
+        return
+    if _session is not None and not _session.closed:
+        try:
+            run(close_session(), timeout=5)
+        except Exception:
+            pass
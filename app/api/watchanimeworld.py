@@ -1,12 +1,20 @@
 import logging
 import requests
 import random
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, FeatureNotFound, SoupStrainer
 from urllib.parse import urljoin, quote, urlencode
 import re
-from cachetools import TTLCache, cached
 import time
+import itertools
+import threading
 import urllib3
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+from app.cache_backend import cache_stats, make_cache
+from app.database import db
+from app.singleflight import SingleFlight
 from config import Config
 
 # Suppress SSL warnings for proxy requests
@@ -25,11 +33,84 @@ _USER_AGENTS = [
 BASE_URL = "https://watchanimeworld.net"
 TIMEOUT = 15
 
+
+def _resolve_html_parser(name: str) -> str:
+    """Fall back to the built-in parser if the configured one is not installed"""
+    try:
+        BeautifulSoup('', name)
+        return name
+    except FeatureNotFound:
+        logging.warning(f"HTML parser '{name}' is not available, falling back to html.parser")
+        return 'html.parser'
+
+
+# BeautifulSoup tree builder used for all scraping ('lxml' or 'html.parser')
+HTML_PARSER = _resolve_html_parser(Config.HTML_PARSER)
+
+# Only the parts of a page that are actually read get built into a tree
+_HOMEPAGE_STRAINER = SoupStrainer('section')
+_STREAMS_STRAINER = SoupStrainer('iframe')
+
+
+def make_soup(html: str, parse_only: SoupStrainer = None) -> BeautifulSoup:
+    """Parse HTML with the configured parser"""
+    return BeautifulSoup(html, HTML_PARSER, parse_only=parse_only)
+
+
+# Homepage snapshot is considered fresh for 15 minutes, after that it is
+# still served while a new one is fetched in the background
+HOMEPAGE_TTL = 900
+
+# Catalog sections available on the homepage (key -> section title)
+HOMEPAGE_SECTIONS = {
+    'newest_drops': 'Newest Drops',
+    'most_watched_shows': 'Most-Watched Shows',
+    'new_anime_arrivals': 'New Anime Arrivals',
+    'most_watched_films': 'Most-Watched Films',
+    'latest_anime_movies': 'Latest Anime Movies',
+}
+
+# Homepage section layouts (section class, title class)
+_HOMEPAGE_SECTION_LAYOUTS = [
+    ('widget_list_episodes', 'section-title'),
+    ('widget_list_movies_series', 'section-title'),
+    ('widget_top', 'widget-title'),
+]
+
 # TTL cache with 15 minutes expiration
-catalog_cache = TTLCache(maxsize=128, ttl=900)
-search_cache = TTLCache(maxsize=256, ttl=900)
-details_cache = TTLCache(maxsize=512, ttl=1800)
-streams_cache = TTLCache(maxsize=256, ttl=600)
+search_cache = make_cache('search', maxsize=256, ttl=900)
+details_cache = make_cache('details', maxsize=512, ttl=1800)
+
+# Episode iframe lists per (slug, season, episode). Episodes without streams
+# expire sooner, since they usually get mirrors shortly after release.
+STREAMS_TTL = 3600
+STREAMS_NEGATIVE_TTL = 300
+streams_cache = make_cache('streams', maxsize=512, ttl=STREAMS_TTL)
+
+# Episode lists per (post_id, season), so finished seasons are not fetched again
+season_cache = make_cache('seasons', maxsize=1024, ttl=1800)
+
+# Other seasons of a series are fetched concurrently, at most this many at once
+SEASON_CONCURRENCY = 4
+# How long get_anime_details waits for other seasons before returning what it has
+SEASON_DEADLINE = 8
+
+
+@dataclass(frozen=True)
+class HomepageSnapshot:
+    """
+    Immutable result of a single homepage fetch and parse
+    """
+    version: int
+    fetched_at: float
+    parse_time: float
+    sections: Mapping[str, tuple]
+
+    @property
+    def age(self) -> float:
+        """Seconds since the snapshot was fetched"""
+        return time.time() - self.fetched_at
+
 
 class WatchAnimeWorldAPI:
     """
@@ -54,7 +135,26 @@ class WatchAnimeWorldAPI:
         self.session.mount('http://', adapter)
         self.session.mount('https://', adapter)
 
+        self._homepage = None
+        self._homepage_lock = threading.Lock()
+        self._homepage_versions = itertools.count(1)
+
+        # All season requests go to the same host, so the pool size is the per-host limit
+        self._season_executor = ThreadPoolExecutor(max_workers=SEASON_CONCURRENCY)
+        self._season_futures = {}
+        self._season_lock = threading.Lock()
+
+        # Concurrent identical upstream requests share one fetch (and one parse)
+        self._fetches = SingleFlight()
+        self._parses = SingleFlight()
+
     def _get(self, url, **kwargs):
+        """GET shared between concurrent identical requests"""
+        params = kwargs.get('params')
+        key = (url, tuple(sorted(params.items())) if params else ())
+        return self._fetches.do(key, self._request, url, **kwargs)
+
+    def _request(self, url, **kwargs):
         """GET with rotating User-Agent, optionally through MediaFlow proxy"""
         user_agent = random.choice(_USER_AGENTS)
         self.session.headers['User-Agent'] = user_agent
@@ -76,88 +176,72 @@ class WatchAnimeWorldAPI:
         
         return self.session.get(url, **kwargs)
 
-    def _parse_section(self, soup, section_title):
-        """Parse a section from homepage by title"""
+    def _parse_section(self, section):
+        """Parse items from a single homepage section"""
         results = []
-        
-        try:
-            # Check widget_list_episodes sections
-            for section in soup.find_all('section', class_='widget_list_episodes'):
-                title_elem = section.find('h3', class_='section-title')
-                if title_elem and section_title.lower() in title_elem.text.lower():
-                    for slide in section.select('.swiper-slide'):
-                        article = slide.find('article')
-                        if not article:
-                            continue
-                        
-                        link = article.find('a', class_='lnk-blk')
-                        img = article.find('img')
-                        title = article.find('h2', class_='entry-title')
-                        
-                        if link and title:
-                            href = link.get('href', '')
-                            slug = href.rstrip('/').split('/')[-1]
-                            content_type = 'movie' if '/movies/' in href else 'series'
-                            
-                            results.append({
-                                'title': title.text.strip(),
-                                'slug': slug,
-                                'poster': img.get('src', '').replace('//', 'https://') if img else None,
-                                'type': content_type
-                            })
-            
-            # Check widget_list_movies_series sections
-            for section in soup.find_all('section', class_='widget_list_movies_series'):
-                title_elem = section.find('h3', class_='section-title')
-                if title_elem and section_title.lower() in title_elem.text.lower():
-                    for slide in section.select('.swiper-slide'):
-                        article = slide.find('article')
-                        if not article:
-                            continue
-                        
-                        link = article.find('a', class_='lnk-blk')
-                        img = article.find('img')
-                        title = article.find('h2', class_='entry-title')
-                        
-                        if link and title:
-                            href = link.get('href', '')
-                            slug = href.rstrip('/').split('/')[-1]
-                            content_type = 'movie' if '/movies/' in href else 'series'
-                            
-                            results.append({
-                                'title': title.text.strip(),
-                                'slug': slug,
-                                'poster': img.get('src', '').replace('//', 'https://') if img else None,
-                                'type': content_type
-                            })
-            
-            # Check widget_top sections (Most-Watched)
-            for section in soup.find_all('section', class_='widget_top'):
-                title_elem = section.find('h3', class_='widget-title')
-                if title_elem and section_title.lower() in title_elem.text.lower():
-                    for item in section.select('.top-picks__item'):
-                        link = item.find('a', class_='lnk-blk')
-                        img = item.find('img')
-                        
-                        if link and img:
-                            href = link.get('href', '')
-                            parts = href.rstrip('/').split('/')
-                            slug = parts[-1] if parts else ''
-                            alt_text = img.get('alt', '').replace('Image ', '')
-                            content_type = 'movie' if '/movies/' in href else 'series'
-                            
-                            results.append({
-                                'title': alt_text.strip(),
-                                'slug': slug,
-                                'poster': img.get('src', '').replace('//', 'https://') if img else None,
-                                'type': content_type
-                            })
-        except RecursionError:
-            logging.error(f"RecursionError in _parse_section for: {section_title}")
-            return []
-        
+
+        # widget_top sections (Most-Watched) use a different layout
+        if 'widget_top' in section.get('class', []):
+            for item in section.select('.top-picks__item'):
+                link = item.find('a', class_='lnk-blk')
+                img = item.find('img')
+
+                if link and img:
+                    href = link.get('href', '')
+                    parts = href.rstrip('/').split('/')
+                    slug = parts[-1] if parts else ''
+                    alt_text = img.get('alt', '').replace('Image ', '')
+                    content_type = 'movie' if '/movies/' in href else 'series'
+
+                    results.append({
+                        'title': alt_text.strip(),
+                        'slug': slug,
+                        'poster': img.get('src', '').replace('//', 'https://') if img else None,
+                        'type': content_type
+                    })
+            return results
+
+        for slide in section.select('.swiper-slide'):
+            article = slide.find('article')
+            if not article:
+                continue
+
+            link = article.find('a', class_='lnk-blk')
+            img = article.find('img')
+            title = article.find('h2', class_='entry-title')
+
+            if link and title:
+                href = link.get('href', '')
+                slug = href.rstrip('/').split('/')[-1]
+                content_type = 'movie' if '/movies/' in href else 'series'
+
+                results.append({
+                    'title': title.text.strip(),
+                    'slug': slug,
+                    'poster': img.get('src', '').replace('//', 'https://') if img else None,
+                    'type': content_type
+                })
         return results
 
+    def _parse_homepage(self, soup):
+        """Extract every known catalog section from the homepage in one pass"""
+        sections = {key: [] for key in HOMEPAGE_SECTIONS}
+
+        for section_class, title_class in _HOMEPAGE_SECTION_LAYOUTS:
+            for section in soup.find_all('section', class_=section_class):
+                title_elem = section.find('h3', class_=title_class)
+                if not title_elem:
+                    continue
+                section_title = title_elem.text.lower()
+                keys = [key for key, title in HOMEPAGE_SECTIONS.items() if title.lower() in section_title]
+                if not keys:
+                    continue
+                items = self._parse_section(section)
+                for key in keys:
+                    sections[key].extend(items)
+
+        return sections
+
     def _get_episodes_from_html(self, soup):
         """Extract episodes from HTML"""
         episodes = []
@@ -207,105 +291,208 @@ class WatchAnimeWorldAPI:
         resp = self._get(url, params=params, timeout=TIMEOUT)
         resp.raise_for_status()
         
-        soup = BeautifulSoup(resp.text, 'html.parser')
+        soup = make_soup(resp.text)
         return self._get_episodes_from_html(soup)
 
-    def get_newest_drops(self):
-        """Get Newest Drops section"""
+    def _load_season(self, post_id: str, season: int):
+        episodes = self._get_season_episodes(post_id, season)
+        season_cache.set((post_id, season), episodes)
+        return episodes
+
+    def _submit_season(self, post_id: str, season: int):
+        """Schedule a season fetch, reusing one that is already in flight"""
+        key = (post_id, season)
+        with self._season_lock:
+            future = self._season_futures.get(key)
+            if future is None:
+                future = self._season_executor.submit(self._load_season, post_id, season)
+                self._season_futures[key] = future
+                future.add_done_callback(lambda _: self._season_futures.pop(key, None))
+        return future
+
+    def _get_seasons(self, post_id: str, seasons: list):
+        """
+        Get episodes of several seasons concurrently.
+        Seasons that don't finish within SEASON_DEADLINE keep loading in the
+        background and are picked up from season_cache by the next request.
+        :return: tuple (episodes, complete)
+        """
+        episodes = []
+        pending = []
+        for season in seasons:
+            cached_episodes = season_cache.get((post_id, season))
+            if cached_episodes is not None:
+                episodes.extend(cached_episodes)
+            else:
+                pending.append(self._submit_season(post_id, season))
+
+        if not pending:
+            return episodes, True
+
+        done, not_done = wait(pending, timeout=SEASON_DEADLINE)
+        complete = not not_done
+        for future in done:
+            try:
+                episodes.extend(future.result())
+            except Exception as e:
+                logging.error(f"Error fetching season episodes for post {post_id}: {e}")
+                complete = False
+
+        if not_done:
+            logging.warning(f"{len(not_done)} season(s) of post {post_id} missed the deadline")
+        return episodes, complete
+
+    def _fetch_homepage(self):
+        """Download and parse the homepage into a new snapshot"""
+        resp = self._get(BASE_URL, timeout=TIMEOUT)
+        resp.raise_for_status()
+
+        started = time.perf_counter()
+        soup = make_soup(resp.text, _HOMEPAGE_STRAINER)
+        sections = self._parse_homepage(soup)
+        parse_time = time.perf_counter() - started
+
+        return HomepageSnapshot(
+            version=next(self._homepage_versions),
+            fetched_at=time.time(),
+            parse_time=parse_time,
+            sections=MappingProxyType({key: tuple(items) for key, items in sections.items()})
+        )
+
+    def _refresh_homepage(self):
         try:
-            resp = self._get(BASE_URL, timeout=TIMEOUT)
-            resp.raise_for_status()
-            soup = BeautifulSoup(resp.text, 'html.parser')
-            results = self._parse_section(soup, 'Newest Drops')
-            if results:  # Only cache non-empty results
-                catalog_cache['newest_drops'] = results
-            return results
+            snapshot = self._fetch_homepage()
         except RecursionError:
-            logging.error("RecursionError in get_newest_drops")
-            return catalog_cache.get('newest_drops', [])
+            logging.error("RecursionError while parsing homepage")
+            return self._homepage
         except Exception as e:
-            logging.error(f"Error in get_newest_drops: {e}")
-            return catalog_cache.get('newest_drops', [])
+            logging.error(f"Error fetching homepage: {e}")
+            return self._homepage
+
+        if not any(snapshot.sections.values()):
+            # Layout change or blocked request - don't replace good data with nothing
+            logging.error("Homepage snapshot has no sections, keeping previous one")
+            return self._homepage
+
+        self._homepage = snapshot
+        logging.info(
+            f"Homepage snapshot v{snapshot.version} parsed in {snapshot.parse_time * 1000:.1f}ms "
+            f"({sum(len(items) for items in snapshot.sections.values())} items)"
+        )
+        return snapshot
+
+    def refresh_homepage(self):
+        """Fetch a fresh homepage snapshot, keeping the previous one on failure"""
+        with self._homepage_lock:
+            return self._refresh_homepage()
+
+    def _revalidate_homepage(self):
+        with self._homepage_lock:
+            # Skip if a concurrent revalidation already replaced the snapshot
+            if self._homepage and self._homepage.age <= HOMEPAGE_TTL:
+                return
+            self._refresh_homepage()
+
+    def revalidate_homepage(self):
+        """Refresh the homepage snapshot in the background if nobody else is doing it"""
+        if self._homepage_lock.locked():
+            return
+        threading.Thread(target=self._revalidate_homepage, daemon=True).start()
+
+    def get_homepage_snapshot(self):
+        """
+        Get the current homepage snapshot.
+        Blocks only when there is no snapshot yet, stale snapshots are served
+        while a fresh one is fetched in the background.
+        """
+        snapshot = self._homepage
+        if snapshot is None:
+            with self._homepage_lock:
+                # Another request might have fetched it while we were waiting
+                snapshot = self._homepage or self._refresh_homepage()
+        elif snapshot.age > HOMEPAGE_TTL:
+            self.revalidate_homepage()
+        return snapshot
+
+    def _get_homepage_section(self, key):
+        snapshot = self.get_homepage_snapshot()
+        if not snapshot:
+            return []
+        return [dict(item) for item in snapshot.sections.get(key, ())]
+
+    def get_newest_drops(self):
+        """Get Newest Drops section"""
+        return self._get_homepage_section('newest_drops')
 
     def get_most_watched_shows(self):
         """Get Most-Watched Shows section"""
-        try:
-            resp = self._get(BASE_URL, timeout=TIMEOUT)
-            resp.raise_for_status()
-            soup = BeautifulSoup(resp.text, 'html.parser')
-            results = self._parse_section(soup, 'Most-Watched Shows')
-            if results:
-                catalog_cache['most_watched_shows'] = results
-            return results
-        except RecursionError:
-            logging.error("RecursionError in get_most_watched_shows")
-            return catalog_cache.get('most_watched_shows', [])
-        except Exception as e:
-            logging.error(f"Error in get_most_watched_shows: {e}")
-            return catalog_cache.get('most_watched_shows', [])
+        return self._get_homepage_section('most_watched_shows')
 
     def get_new_anime_arrivals(self):
         """Get New Anime Arrivals section"""
-        try:
-            resp = self._get(BASE_URL, timeout=TIMEOUT)
-            resp.raise_for_status()
-            soup = BeautifulSoup(resp.text, 'html.parser')
-            results = self._parse_section(soup, 'New Anime Arrivals')
-            if results:
-                catalog_cache['new_anime_arrivals'] = results
-            return results
-        except RecursionError:
-            logging.error("RecursionError in get_new_anime_arrivals")
-            return catalog_cache.get('new_anime_arrivals', [])
-        except Exception as e:
-            logging.error(f"Error in get_new_anime_arrivals: {e}")
-            return catalog_cache.get('new_anime_arrivals', [])
+        return self._get_homepage_section('new_anime_arrivals')
 
     def get_most_watched_films(self):
         """Get Most-Watched Films section"""
-        try:
-            resp = self._get(BASE_URL, timeout=TIMEOUT)
-            resp.raise_for_status()
-            soup = BeautifulSoup(resp.text, 'html.parser')
-            results = self._parse_section(soup, 'Most-Watched Films')
-            if results:
-                catalog_cache['most_watched_films'] = results
-            return results
-        except RecursionError:
-            logging.error("RecursionError in get_most_watched_films")
-            return catalog_cache.get('most_watched_films', [])
-        except Exception as e:
-            logging.error(f"Error in get_most_watched_films: {e}")
-            return catalog_cache.get('most_watched_films', [])
+        return self._get_homepage_section('most_watched_films')
 
     def get_latest_anime_movies(self):
         """Get Latest Anime Movies section"""
-        try:
-            resp = self._get(BASE_URL, timeout=TIMEOUT)
-            resp.raise_for_status()
-            soup = BeautifulSoup(resp.text, 'html.parser')
-            results = self._parse_section(soup, 'Latest Anime Movies')
-            if results:
-                catalog_cache['latest_anime_movies'] = results
-            return results
-        except RecursionError:
-            logging.error("RecursionError in get_latest_anime_movies")
-            return catalog_cache.get('latest_anime_movies', [])
-        except Exception as e:
-            logging.error(f"Error in get_latest_anime_movies: {e}")
-            return catalog_cache.get('latest_anime_movies', [])
+        return self._get_homepage_section('latest_anime_movies')
+
+    def stats(self) -> dict:
+        """Counters of upstream requests, caches and the current homepage snapshot"""
+        snapshot = self._homepage
+        return {
+            'fetches': self._fetches.stats(),
+            'parses': self._parses.stats(),
+            'caches': cache_stats(),
+            'homepage': {
+                'version': snapshot.version,
+                'age': snapshot.age,
+                'parse_time': snapshot.parse_time
+            } if snapshot else None
+        }
 
-    @cached(search_cache)
     def search_anime(self, query: str):
         """Search for anime"""
+        cached = search_cache.get(query)
+        if cached is not None:
+            return cached
+
+        url = f"{BASE_URL}/"
+        params = {'s': query}
+        results = self._parses.do((url, (('s', query),)), self._search_anime, url, params)
+        search_cache.set(query, results)
+        return results
+
+    def _parse_post_item(self, article):
+        """Parse a series/movie card from a post list (search results, archives)"""
+        link = article.find('a', class_='lnk-blk')
+        img = article.find('img')
+        title = article.find('h2', class_='entry-title')
+
+        if not (link and title):
+            return None
+
+        href = link.get('href', '')
+        slug = href.rstrip('/').split('/')[-1]
+        content_type = 'movie' if '/movies/' in href else 'series'
+
+        return {
+            'title': title.text.strip(),
+            'slug': slug,
+            'poster': img.get('src', '').replace('//', 'https://') if img else None,
+            'type': content_type
+        }
+
+    def _search_anime(self, url: str, params: dict):
+        query = params['s']
         try:
-            url = f"{BASE_URL}/"
-            params = {'s': query}
-            
             resp = self._get(url, params=params, timeout=TIMEOUT)
             resp.raise_for_status()
             
-            soup = BeautifulSoup(resp.text, 'html.parser')
+            soup = make_soup(resp.text)
             results = []
             
             # Search results are in #aa-movies section
@@ -313,24 +500,9 @@ class WatchAnimeWorldAPI:
             if search_section:
                 for li in search_section.select('ul.post-lst > li'):
                     article = li.find('article')
-                    if not article:
-                        continue
-                    
-                    link = article.find('a', class_='lnk-blk')
-                    img = article.find('img')
-                    title = article.find('h2', class_='entry-title')
-                    
-                    if link and title:
-                        href = link.get('href', '')
-                        slug = href.rstrip('/').split('/')[-1]
-                        content_type = 'movie' if '/movies/' in href else 'series'
-                        
-                        results.append({
-                            'title': title.text.strip(),
-                            'slug': slug,
-                            'poster': img.get('src', '').replace('//', 'https://') if img else None,
-                            'type': content_type
-                        })
+                    item = self._parse_post_item(article) if article else None
+                    if item:
+                        results.append(item)
             
             return results
         except RecursionError:
@@ -340,17 +512,77 @@ class WatchAnimeWorldAPI:
             logging.error(f"Error in search_anime: {e}")
             return []
 
-    @cached(details_cache)
+    def get_archive_page(self, content_type: str, page: int = 1):
+        """
+        Get one page of the series or movies archive, newest first
+        :param content_type: 'series' or 'movies'
+        :return: List of items, empty when the page does not exist
+        """
+        url = f"{BASE_URL}/{content_type}/page/{page}/" if page > 1 else f"{BASE_URL}/{content_type}/"
+        resp = self._get(url, timeout=TIMEOUT)
+        if resp.status_code == 404:
+            return []
+        resp.raise_for_status()
+
+        soup = make_soup(resp.text)
+        results = []
+        for li in soup.select('ul.post-lst > li'):
+            article = li.find('article')
+            item = self._parse_post_item(article) if article else None
+            if not item:
+                continue
+            post_id = re.match(r'post-(\d+)', article.get('id', ''))
+            item['post_id'] = post_id.group(1) if post_id else None
+            alt_text = article.find('img').get('alt', '').replace('Image ', '').strip() if article.find('img') else ''
+            item['alt_titles'] = [alt_text] if alt_text and alt_text != item['title'] else []
+            results.append(item)
+        return results
+
+    def get_season_info(self, slug: str):
+        """
+        Get post id and number of seasons of a series
+        :return: tuple (post_id, season_count)
+        """
+        resp = self._get(f"{BASE_URL}/series/{slug}", timeout=TIMEOUT)
+        resp.raise_for_status()
+
+        soup = make_soup(resp.text)
+        season_links = soup.select('.choose-season .sel-temp a')
+        post_id = season_links[0].get('data-post') if season_links else None
+        return post_id, max(len(season_links), 1)
+
     def get_anime_details(self, slug: str):
         """Get anime details by slug"""
-        for content_type in ['series', 'movies']:
+        cached = details_cache.get(slug)
+        if cached is not None:
+            return cached
+
+        details, complete = self._parses.do(
+            (f"{BASE_URL}/series/{slug}", ()), self._get_anime_details, slug
+        )
+        # Details with seasons still loading are rebuilt on the next request
+        if complete:
+            details_cache.set(slug, details)
+        return details
+
+    def _get_anime_details(self, slug: str):
+        """
+        Scrape anime details by slug
+        :return: tuple (details, complete)
+        """
+        content_types = ['series', 'movies']
+        entry = db.get_catalog_entry(slug)
+        if entry and entry['type'] == 'movie':
+            content_types.reverse()
+
+        for content_type in content_types:
             url = f"{BASE_URL}/{content_type}/{slug}"
             
             try:
                 resp = self._get(url, timeout=TIMEOUT)
                 resp.raise_for_status()
                 
-                soup = BeautifulSoup(resp.text, 'html.parser')
+                soup = make_soup(resp.text)
                 
                 title = soup.select_one('.entry-title, h1.entry-title')
                 description = soup.select_one('.description p')
@@ -369,6 +601,7 @@ class WatchAnimeWorldAPI:
                     runtime = duration_elem.text.strip()
                 
                 episodes = []
+                complete = True
                 if content_type == 'series':
                     episodes = self._get_episodes_from_html(soup)
                     
@@ -377,11 +610,13 @@ class WatchAnimeWorldAPI:
                         post_id = season_links[0].get('data-post')
                         if post_id:
                             current_season = int(soup.select_one('.n_s').text.strip()) if soup.select_one('.n_s') else 1
-                            for link in season_links:
-                                season_num = int(link.get('data-season', 0))
-                                if season_num != current_season:
-                                    season_eps = self._get_season_episodes(post_id, season_num)
-                                    episodes.extend(season_eps)
+                            other_seasons = [
+                                season_num for season_num in
+                                (int(link.get('data-season', 0)) for link in season_links)
+                                if season_num != current_season
+                            ]
+                            season_eps, complete = self._get_seasons(post_id, other_seasons)
+                            episodes.extend(season_eps)
                     
                     episodes.sort(key=lambda x: (x['season'], x['episode']))
                 else:
@@ -402,11 +637,11 @@ class WatchAnimeWorldAPI:
                     'runtime': runtime,
                     'episodes': episodes,
                     'type': 'movie' if content_type == 'movies' else 'series'
-                }
+                }, complete
             except:
                 continue
         
-        return None
+        return None, True
 
     def get_episode_streams(self, slug: str, season: int = None, episode: int = None):
         """Get stream URLs for an episode or movie"""
@@ -415,12 +650,19 @@ class WatchAnimeWorldAPI:
             url = f"{BASE_URL}/episode/{slug}-{season}x{episode}/"
         else:
             url = f"{BASE_URL}/movies/{slug}"
-        
+
+        cached = streams_cache.get((slug, season, episode))
+        if cached is not None:
+            return cached
+
+        return self._parses.do((url, ()), self._get_episode_streams, url, slug, season, episode)
+
+    def _get_episode_streams(self, url: str, slug: str, season: int, episode: int):
         try:
             resp = self._get(url, timeout=TIMEOUT)
             resp.raise_for_status()
             
-            soup = BeautifulSoup(resp.text, 'html.parser')
+            soup = make_soup(resp.text, _STREAMS_STRAINER)
             
             streams = []
             
@@ -432,13 +674,9 @@ class WatchAnimeWorldAPI:
                         'url': src if src.startswith('http') else urljoin(BASE_URL, src)
                     })
             
-            if streams:
-                return {'streams': streams}
-            else:
-                # Cache tylko puste odpowiedzi (brak streamów)
-                cache_key = f"{slug}_{season}_{episode}"
-                streams_cache[cache_key] = {'streams': []}
-                return {'streams': []}
+            result = {'streams': streams}
+            streams_cache.set((slug, season, episode), result, ttl=STREAMS_TTL if streams else STREAMS_NEGATIVE_TTL)
+            return result
         except:
             pass
         
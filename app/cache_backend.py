@@ -0,0 +1,356 @@
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+from cachetools import TLRUCache
+
+from config import Config
+
+_MISSING = object()
+
+# Bumped whenever the snapshot layout changes, older snapshots are ignored
+SNAPSHOT_VERSION = 1
+# Backend errors are logged for the first one and then every this many
+ERROR_LOG_EVERY = 1000
+
+
+class CacheBackend:
+    """
+    Base class of named key-value caches with per-entry TTL.
+    Subclasses implement _get, _set, _delete and _clear.
+    Backend errors (unwritable file, unreachable server) never reach the caller:
+    reads count as misses and writes are dropped.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def get(self, key, default=None) -> Any:
+        value = self._safe_get(key)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        """Store a value, expiring after `ttl` seconds (the cache's default TTL if not given)"""
+        try:
+            self._set(key, value, self.ttl if ttl is None else ttl)
+        except Exception as e:
+            self._log_error('write', e)
+
+    def delete(self, key):
+        try:
+            self._delete(key)
+        except Exception as e:
+            self._log_error('delete', e)
+
+    def clear(self):
+        try:
+            self._clear()
+        except Exception as e:
+            self._log_error('clear', e)
+
+    def __contains__(self, key) -> bool:
+        return self._safe_get(key) is not _MISSING
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        self.delete(key)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'backend': type(self).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else None,
+            'errors': self.errors
+        }
+
+    def _safe_get(self, key):
+        try:
+            return self._get(key)
+        except Exception as e:
+            self._log_error('read', e)
+            return _MISSING
+
+    def _log_error(self, action: str, error: Exception):
+        self.errors += 1
+        if self.errors == 1 or self.errors % ERROR_LOG_EVERY == 0:
+            logging.error(f"Cache '{self.name}' {action} failed ({self.errors} errors so far): {error}")
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, value, ttl: float):
+        raise NotImplementedError
+
+    def _delete(self, key):
+        raise NotImplementedError
+
+    def _clear(self):
+        raise NotImplementedError
+
+
+class MemoryCache(CacheBackend):
+    """
+    Per-process cache, LRU eviction past maxsize
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        super().__init__(name, maxsize, ttl)
+        # Values are stored as (value, expires_at)
+        self._data = TLRUCache(maxsize=maxsize, ttu=lambda key, item, now: item[1], timer=time.time)
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+        return _MISSING if item is None else item[0]
+
+    def _set(self, key, value, ttl: float):
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl)
+
+    def _delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def _clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def items(self):
+        """(key, value, expires_at) of all live entries"""
+        with self._lock:
+            self._data.expire()
+            return [(key, value, expires_at) for key, (value, expires_at) in self._data.items()]
+
+    def restore(self, items) -> int:
+        """Add (key, value, expires_at) entries that haven't expired yet"""
+        now = time.time()
+        restored = 0
+        with self._lock:
+            for key, value, expires_at in items:
+                if expires_at > now and key not in self._data:
+                    self._data[key] = (value, expires_at)
+                    restored += 1
+        return restored
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Cache shared by all worker processes through a local SQLite file.
+    Values are pickled, expired entries are skipped on read and purged
+    together with the oldest entries past maxsize every EVICT_EVERY writes.
+    """
+
+    EVICT_EVERY = 100
+
+    _connection = None
+    _connection_pid = None
+    _connection_lock = threading.Lock()
+
+    def __init__(self, name: str, maxsize: int, ttl: float, path: str):
+        super().__init__(name, maxsize, ttl)
+        self.path = path
+        self._writes = 0
+
+    def _db(self) -> sqlite3.Connection:
+        # One connection per process, connections can't be shared across fork
+        cls = SQLiteCache
+        if cls._connection is None or cls._connection_pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'name TEXT NOT NULL, key TEXT NOT NULL, value BLOB, expires_at REAL, '
+                'PRIMARY KEY (name, key))'
+            )
+            cls._connection = connection
+            cls._connection_pid = os.getpid()
+        return cls._connection
+
+    def _get(self, key):
+        with self._connection_lock:
+            row = self._db().execute(
+                'SELECT value FROM cache WHERE name = ? AND key = ? AND expires_at > ?',
+                (self.name, repr(key), time.time())
+            ).fetchone()
+        return _MISSING if row is None else pickle.loads(row[0])
+
+    def _set(self, key, value, ttl: float):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._connection_lock:
+            self._db().execute(
+                'INSERT INTO cache (name, key, value, expires_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (name, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at',
+                (self.name, repr(key), data, time.time() + ttl)
+            )
+        self._writes += 1
+        if self._writes % self.EVICT_EVERY == 0:
+            self._evict()
+
+    def _evict(self):
+        with self._connection_lock:
+            connection = self._db()
+            connection.execute('DELETE FROM cache WHERE name = ? AND expires_at <= ?', (self.name, time.time()))
+            count = connection.execute('SELECT COUNT(*) FROM cache WHERE name = ?', (self.name,)).fetchone()[0]
+            if count > self.maxsize:
+                # Entries closest to expiry go first
+                connection.execute(
+                    'DELETE FROM cache WHERE name = ? AND key IN '
+                    '(SELECT key FROM cache WHERE name = ? ORDER BY expires_at LIMIT ?)',
+                    (self.name, self.name, count - self.maxsize)
+                )
+
+    def _delete(self, key):
+        with self._connection_lock:
+            self._db().execute('DELETE FROM cache WHERE name = ? AND key = ?', (self.name, repr(key)))
+
+    def _clear(self):
+        with self._connection_lock:
+            self._db().execute('DELETE FROM cache WHERE name = ?', (self.name,))
+
+
+class RedisCache(CacheBackend):
+    """
+    Cache shared through Redis. Values are pickled and expire via Redis TTLs,
+    eviction past memory limits is left to the server's maxmemory policy.
+    """
+
+    # One client per server URL (tests register a stand-in here)
+    _clients = {}
+
+    def __init__(self, name: str, maxsize: int, ttl: float, url: str):
+        super().__init__(name, maxsize, ttl)
+        if url not in RedisCache._clients:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package")
+            RedisCache._clients[url] = redis.Redis.from_url(url)
+        self.client = RedisCache._clients[url]
+        self.prefix = f"awi:{name}:"
+
+    def _get(self, key):
+        data = self.client.get(self.prefix + repr(key))
+        return _MISSING if data is None else pickle.loads(data)
+
+    def _set(self, key, value, ttl: float):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self.client.set(self.prefix + repr(key), data, px=max(1, int(ttl * 1000)))
+
+    def _delete(self, key):
+        self.client.delete(self.prefix + repr(key))
+
+    def _clear(self):
+        keys = list(self.client.scan_iter(match=f"{self.prefix}*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+# All named caches of this process, by name
+caches = {}
+
+
+def make_cache(name: str, maxsize: int, ttl: float, shared: bool = True) -> CacheBackend:
+    """
+    Create a named cache on the backend selected by CACHE_BACKEND
+    :param shared: False keeps the cache in process memory regardless of the backend
+                   (for values that can't or shouldn't be serialized)
+    """
+    backend = Config.CACHE_BACKEND if shared else 'memory'
+    if backend == 'sqlite':
+        cache = SQLiteCache(name, maxsize, ttl, Config.CACHE_SQLITE_PATH)
+    elif backend == 'redis':
+        cache = RedisCache(name, maxsize, ttl, Config.CACHE_REDIS_URL)
+    else:
+        if backend != 'memory':
+            logging.warning(f"Unknown cache backend '{backend}', using memory")
+        cache = MemoryCache(name, maxsize, ttl)
+    caches[name] = cache
+    return cache
+
+
+def cache_stats() -> dict:
+    """Hit/miss counters of all named caches"""
+    return {name: cache.stats() for name, cache in caches.items()}
+
+
+def save_snapshot(path: str = None):
+    """
+    Dump the in-memory caches with their expiry times, so a recycled worker
+    starts warm. Shared backends survive worker restarts on their own.
+    """
+    path = path or Config.CACHE_SNAPSHOT_PATH
+    if not path:
+        return
+    snapshot = {
+        'version': SNAPSHOT_VERSION,
+        'saved_at': time.time(),
+        'caches': {name: cache.items() for name, cache in caches.items() if isinstance(cache, MemoryCache)}
+    }
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        # Also unpicklable values (TypeError, AttributeError), this runs on worker exit
+        logging.error(f"Error saving cache snapshot to {path}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def load_snapshot(path: str = None) -> int:
+    """
+    Restore the in-memory caches from a snapshot, skipping expired entries
+    :return: Number of restored entries
+    """
+    path = path or Config.CACHE_SNAPSHOT_PATH
+    if not path or not os.path.exists(path):
+        return 0
+    started = time.perf_counter()
+    try:
+        with open(path, 'rb') as f:
+            snapshot = pickle.load(f)
+    except Exception as e:
+        logging.error(f"Error loading cache snapshot from {path}: {e}")
+        return 0
+    if not isinstance(snapshot, dict) or snapshot.get('version') != SNAPSHOT_VERSION:
+        logging.warning(f"Ignoring cache snapshot {path} with an unknown version")
+        return 0
+
+    restored = 0
+    for name, items in snapshot['caches'].items():
+        cache = caches.get(name)
+        if isinstance(cache, MemoryCache):
+            restored += cache.restore(items)
+    logging.info(
+        f"Restored {restored} cache entries from {path} in {(time.perf_counter() - started) * 1000:.1f}ms "
+        f"(snapshot age {time.time() - snapshot['saved_at']:.0f}s)"
+    )
+    return restored
@@ -1,13 +1,29 @@
-from sqlalchemy import create_engine, Column, String, DateTime
+from sqlalchemy import create_engine, event, Column, String, DateTime, Integer, Boolean, Text, or_
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.pool import NullPool
-from typing import Optional, Tuple
+from typing import Optional, Tuple, List, Dict, Iterable
 from datetime import datetime, timedelta
+import atexit
+import logging
+import os
+import threading
 from config import Config
 
 Base = declarative_base()
 
+# Max number of bound parameters per batched statement, below SQLite's legacy limit of 999
+# (leaving room for the statement's other parameters)
+BATCH_VARIABLES = 900
+
+
+def _chunks(items: list, columns: int = 1):
+    """Batches of `items` whose `columns` parameters each fit in BATCH_VARIABLES"""
+    size = max(1, BATCH_VARIABLES // columns)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
 class Mapping(Base):
     __tablename__ = 'mappings'
     
@@ -21,6 +37,193 @@ class FailedMapping(Base):
     imdb_id = Column(String, primary_key=True)
     checked_at = Column(DateTime, default=datetime.utcnow)
 
+class CatalogEntry(Base):
+    __tablename__ = 'catalog_index'
+
+    slug = Column(String, primary_key=True)
+    type = Column(String)  # 'series' or 'movie'
+    title = Column(String)
+    alt_titles = Column(String)  # '|' separated
+    poster = Column(String)
+    poster_path = Column(String, index=True)  # TMDB-style file name, e.g. /abc.jpg
+    season_count = Column(Integer)
+    post_id = Column(String)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    def to_dict(self) -> dict:
+        return {
+            'slug': self.slug,
+            'type': self.type,
+            'title': self.title,
+            'alt_titles': self.alt_titles.split('|') if self.alt_titles else [],
+            'poster': self.poster,
+            'season_count': self.season_count,
+            'post_id': self.post_id
+        }
+
+
+class CrawlState(Base):
+    __tablename__ = 'crawl_state'
+
+    content_type = Column(String, primary_key=True)  # archive crawled: 'series' or 'movies'
+    last_page = Column(Integer)  # last archive page fully indexed
+    completed = Column(Boolean)  # whether the crawl reached the end of the archive (or known titles)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class TMDBResponse(Base):
+    __tablename__ = 'tmdb_cache'
+
+    key = Column(String, primary_key=True)  # API path with sorted query, without the API key
+    payload = Column(Text)  # JSON response body
+    expires_at = Column(DateTime, index=True)
+
+
+def poster_path_from_url(poster_url: Optional[str]) -> Optional[str]:
+    """Get the file part of a poster URL (/abc.jpg), as used in TMDB poster paths"""
+    if not poster_url:
+        return None
+    return '/' + poster_url.rstrip('/').rsplit('/', 1)[-1]
+
+
+# SQLite tuning - WAL lets readers run next to the (single) writer, and
+# writers wait for the lock instead of failing with "database is locked"
+SQLITE_BUSY_TIMEOUT = 30  # seconds
+SQLITE_MMAP_SIZE = 64 * 1024 * 1024
+SQLITE_CACHE_SIZE_KB = 16 * 1024
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT * 1000}')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}')
+    cursor.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.close()
+
+
+# Queued writes are flushed after this many seconds or once this many rows are waiting
+FLUSH_INTERVAL = 2.0
+FLUSH_SIZE = 200
+
+# Expired TMDB responses are purged once every this many stored responses
+TMDB_PURGE_EVERY = 500
+
+
+class WriteBehindQueue:
+    """
+    Collects mapping and failed-mapping writes from requests and flushes them
+    in batched upserts from a background thread. Queued rows, and the batch
+    being written, are visible to reads until they are committed.
+    Without DB_WRITE_BEHIND (serverless deployments, where nothing runs after
+    the response is sent) every write is flushed right away.
+    """
+
+    def __init__(self, database: 'Database'):
+        self.db = database
+        self._mappings = {}  # slug -> (tmdb_id, imdb_id)
+        self._slugs = {}  # imdb_id -> slug, for reads of pending mappings
+        self._failed = {}  # imdb_id -> checked_at
+        self._expired = {}  # imdb_id -> cutoff, failed mappings to clean up
+        # The batch being written by flush(), until it is committed
+        self._inflight_mappings = {}
+        self._inflight_slugs = {}
+        self._inflight_failed = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def __len__(self):
+        return len(self._mappings) + len(self._failed) + len(self._expired)
+
+    def _ensure_flusher(self):
+        # Threads don't survive fork, so each worker process starts its own
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(FLUSH_INTERVAL)
+            self._wakeup.clear()
+            self.flush()
+
+    def _queued(self):
+        if not Config.DB_WRITE_BEHIND:
+            self.flush()
+            return
+        self._ensure_flusher()
+        if len(self) >= FLUSH_SIZE:
+            self._wakeup.set()
+
+    def add_mapping(self, slug: str, tmdb_id: str, imdb_id: str):
+        with self._lock:
+            self._mappings[slug] = (tmdb_id, imdb_id)
+            self._slugs[imdb_id] = slug
+        self._queued()
+
+    def add_failed(self, imdb_id: str):
+        with self._lock:
+            self._failed[imdb_id] = datetime.utcnow()
+            self._expired.pop(imdb_id, None)
+        self._queued()
+
+    def add_expired(self, imdb_id: str, cutoff: datetime):
+        with self._lock:
+            self._expired[imdb_id] = cutoff
+        self._queued()
+
+    def get_mapping(self, slug: str) -> Optional[Tuple[str, str]]:
+        return self._mappings.get(slug) or self._inflight_mappings.get(slug)
+
+    def get_slug(self, imdb_id: str) -> Optional[str]:
+        return self._slugs.get(imdb_id) or self._inflight_slugs.get(imdb_id)
+
+    def is_failed(self, imdb_id: str) -> bool:
+        return imdb_id in self._failed or imdb_id in self._inflight_failed
+
+    def flush(self):
+        """Write all queued rows, keeping them queued if the write fails"""
+        with self._flush_lock:
+            with self._lock:
+                mappings, self._mappings = self._mappings, {}
+                failed, self._failed = self._failed, {}
+                expired, self._expired = self._expired, {}
+                self._inflight_mappings, self._inflight_failed = mappings, failed
+                self._inflight_slugs, self._slugs = self._slugs, {}
+            if not (mappings or failed or expired):
+                return
+
+            try:
+                if mappings:
+                    self.db.set_mappings(
+                        (slug, tmdb_id, imdb_id) for slug, (tmdb_id, imdb_id) in mappings.items()
+                    )
+                if failed:
+                    self.db.add_failed_mappings(failed)
+                if expired:
+                    self.db.delete_failed_mappings(expired)
+            except Exception as e:
+                logging.error(f"Error flushing {len(mappings) + len(failed) + len(expired)} queued writes: {e}")
+                with self._lock:
+                    # Rows queued meanwhile are newer, don't overwrite them
+                    for slug, row in mappings.items():
+                        self._mappings.setdefault(slug, row)
+                        self._slugs.setdefault(row[1], slug)
+                    for imdb_id, checked_at in failed.items():
+                        self._failed.setdefault(imdb_id, checked_at)
+                    for imdb_id, cutoff in expired.items():
+                        self._expired.setdefault(imdb_id, cutoff)
+            finally:
+                with self._lock:
+                    self._inflight_mappings, self._inflight_slugs, self._inflight_failed = {}, {}, {}
+
+
 class Database:
     def __init__(self):
         if Config.DB_TYPE == 'postgresql':
@@ -30,22 +233,31 @@ class Database:
                 max_overflow=5,
                 pool_pre_ping=True,
                 pool_recycle=1800,
-                connect_args={'sslmode': 'require'},
+                connect_args={'sslmode': Config.DB_SSLMODE},
                 echo=False
             )
         else:
             engine = create_engine(
                 f'sqlite:///{Config.DB_PATH}',
-                pool_size=3,
-                max_overflow=5,
+                pool_size=5,
+                max_overflow=10,
+                connect_args={'timeout': SQLITE_BUSY_TIMEOUT, 'check_same_thread': False},
                 echo=False
             )
+            event.listen(engine, 'connect', _set_sqlite_pragmas)
         
         Base.metadata.create_all(engine)
+        self.engine = engine
         session_factory = sessionmaker(bind=engine)
         self.Session = scoped_session(session_factory)
+        self.writes = WriteBehindQueue(self)
+        self._tmdb_writes = 0
+        atexit.register(self.writes.flush)
     
     def get_mapping(self, slug: str) -> Optional[Tuple[str, str]]:
+        pending = self.writes.get_mapping(slug)
+        if pending:
+            return pending
         session = self.Session()
         try:
             mapping = session.query(Mapping).filter_by(slug=slug).first()
@@ -54,52 +266,267 @@ class Database:
             session.close()
     
     def get_slug_by_imdb(self, imdb_id: str) -> Optional[str]:
+        return self.get_slugs_by_imdb([imdb_id]).get(imdb_id)
+    
+    def get_mappings(self, slugs: Iterable[str]) -> Dict[str, Tuple[str, str]]:
+        """Get mappings of many slugs at once (slug -> (tmdb_id, imdb_id))"""
+        slugs = list(set(slugs))
+        result = {}
+        if not slugs:
+            return result
         session = self.Session()
         try:
-            mapping = session.query(Mapping).filter_by(imdb_id=imdb_id).first()
-            return mapping.slug if mapping else None
+            for chunk in _chunks(slugs):
+                rows = session.query(Mapping.slug, Mapping.tmdb_id, Mapping.imdb_id).filter(Mapping.slug.in_(chunk))
+                for slug, tmdb_id, imdb_id in rows:
+                    result[slug] = (tmdb_id, imdb_id)
+            for slug in slugs:
+                pending = self.writes.get_mapping(slug)
+                if pending:
+                    result[slug] = pending
+            return result
         finally:
             session.close()
     
-    def set_mapping(self, slug: str, tmdb_id: str, imdb_id: str):
+    def get_slugs_by_imdb(self, imdb_ids: Iterable[str]) -> Dict[str, str]:
+        """Get slugs of many IMDB IDs at once (imdb_id -> slug), including queued mappings"""
+        result = {}
+        missing = []
+        for imdb_id in set(imdb_ids):
+            pending = self.writes.get_slug(imdb_id)
+            if pending:
+                result[imdb_id] = pending
+            else:
+                missing.append(imdb_id)
+        if not missing:
+            return result
         session = self.Session()
         try:
-            mapping = session.query(Mapping).filter_by(slug=slug).first()
-            if mapping:
-                mapping.tmdb_id = tmdb_id
-                mapping.imdb_id = imdb_id
-            else:
-                mapping = Mapping(slug=slug, tmdb_id=tmdb_id, imdb_id=imdb_id)
-                session.add(mapping)
+            for chunk in _chunks(missing):
+                rows = session.query(Mapping.imdb_id, Mapping.slug).filter(Mapping.imdb_id.in_(chunk))
+                for imdb_id, slug in rows:
+                    result.setdefault(imdb_id, slug)
+            return result
+        finally:
+            session.close()
+    
+    def _insert(self, table):
+        """INSERT statement supporting ON CONFLICT for the current dialect"""
+        if self.engine.dialect.name == 'postgresql':
+            return postgresql.insert(table)
+        return sqlite.insert(table)
+    
+    def _upsert(self, model, rows: List[dict], key: str):
+        """Insert or update rows with a single INSERT ... ON CONFLICT per batch"""
+        if not rows:
+            return
+        columns = [column for column in rows[0] if column != key]
+        session = self.Session()
+        try:
+            for chunk in _chunks(rows, len(rows[0])):
+                stmt = self._insert(model.__table__).values(chunk)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[key],
+                    set_={column: stmt.excluded[column] for column in columns}
+                )
+                session.execute(stmt)
             session.commit()
         finally:
             session.close()
     
+    def set_mapping(self, slug: str, tmdb_id: str, imdb_id: str):
+        self.set_mappings([(slug, tmdb_id, imdb_id)])
+    
+    def set_mappings(self, rows: Iterable[Tuple[str, str, str]]):
+        """Insert or update many (slug, tmdb_id, imdb_id) mappings with a single upsert per batch"""
+        # Last write for a slug wins, a single statement can't touch a row twice
+        values = {slug: {'slug': slug, 'tmdb_id': tmdb_id, 'imdb_id': imdb_id} for slug, tmdb_id, imdb_id in rows}
+        self._upsert(Mapping, list(values.values()), 'slug')
+    
+    def queue_mapping(self, slug: str, tmdb_id: str, imdb_id: str):
+        """Store a mapping in the background (visible to reads of this process right away)"""
+        self.writes.add_mapping(slug, tmdb_id, imdb_id)
+    
+    def queue_failed_mapping(self, imdb_id: str):
+        """Store a failed mapping in the background (visible to reads of this process right away)"""
+        self.writes.add_failed(imdb_id)
+    
     def is_failed_mapping(self, imdb_id: str, ttl_days: int = 30) -> bool:
+        if self.writes.is_failed(imdb_id):
+            return True
         session = self.Session()
         try:
             failed = session.query(FailedMapping).filter_by(imdb_id=imdb_id).first()
             if not failed:
                 return False
-            # Check if expired
-            if datetime.utcnow() - failed.checked_at > timedelta(days=ttl_days):
-                session.delete(failed)
-                session.commit()
+            # Check if expired, cleanup happens in the background in batches
+            cutoff = datetime.utcnow() - timedelta(days=ttl_days)
+            if failed.checked_at < cutoff:
+                self.writes.add_expired(imdb_id, cutoff)
                 return False
             return True
         finally:
             session.close()
     
     def add_failed_mapping(self, imdb_id: str):
+        self.add_failed_mappings({imdb_id: datetime.utcnow()})
+
+    def add_failed_mappings(self, failed: Dict[str, datetime]):
+        """Insert or update many failed mappings (imdb_id -> checked_at) with a single upsert per batch"""
+        rows = [{'imdb_id': imdb_id, 'checked_at': checked_at} for imdb_id, checked_at in failed.items()]
+        self._upsert(FailedMapping, rows, 'imdb_id')
+
+    def delete_failed_mappings(self, expired: Dict[str, datetime]):
+        """Delete failed mappings (imdb_id -> cutoff) that weren't re-checked since they expired"""
+        if not expired:
+            return
+        # All cutoffs are close to each other, the oldest one keeps recently re-checked rows
+        cutoff = min(expired.values())
         session = self.Session()
         try:
-            failed = session.query(FailedMapping).filter_by(imdb_id=imdb_id).first()
-            if failed:
-                failed.checked_at = datetime.utcnow()
-            else:
-                failed = FailedMapping(imdb_id=imdb_id)
-                session.add(failed)
+            for chunk in _chunks(list(expired)):
+                session.query(FailedMapping).filter(
+                    FailedMapping.imdb_id.in_(chunk),
+                    FailedMapping.checked_at < cutoff
+                ).delete(synchronize_session=False)
+            session.commit()
+        finally:
+            session.close()
+
+    def get_all_mappings(self) -> List[Tuple[str, str]]:
+        """All (slug, imdb_id) pairs"""
+        session = self.Session()
+        try:
+            return [(slug, imdb_id) for slug, imdb_id in session.query(Mapping.slug, Mapping.imdb_id) if imdb_id]
+        finally:
+            session.close()
+
+    def get_mapped_imdb_ids(self) -> List[str]:
+        session = self.Session()
+        try:
+            return [imdb_id for (imdb_id,) in session.query(Mapping.imdb_id) if imdb_id]
+        finally:
+            session.close()
+
+    def get_failed_mappings(self, since: datetime = None) -> List[Tuple[str, datetime]]:
+        session = self.Session()
+        try:
+            query = session.query(FailedMapping.imdb_id, FailedMapping.checked_at)
+            if since:
+                query = query.filter(FailedMapping.checked_at >= since)
+            return [(imdb_id, checked_at) for imdb_id, checked_at in query]
+        finally:
+            session.close()
+
+    def get_catalog_entry(self, slug: str) -> Optional[dict]:
+        session = self.Session()
+        try:
+            entry = session.query(CatalogEntry).filter_by(slug=slug).first()
+            return entry.to_dict() if entry else None
+        finally:
+            session.close()
+
+    def get_catalog_slugs(self, content_type: str = None) -> set:
+        session = self.Session()
+        try:
+            query = session.query(CatalogEntry.slug)
+            if content_type:
+                query = query.filter_by(type=content_type)
+            return {slug for (slug,) in query}
+        finally:
+            session.close()
+
+    def get_catalog_entries(self) -> List[dict]:
+        session = self.Session()
+        try:
+            return [entry.to_dict() for entry in session.query(CatalogEntry)]
+        finally:
+            session.close()
+
+    def find_catalog_by_posters(self, poster_paths: List[str]) -> List[dict]:
+        session = self.Session()
+        try:
+            entries = session.query(CatalogEntry).filter(CatalogEntry.poster_path.in_(poster_paths)).all()
+            return [entry.to_dict() for entry in entries]
+        finally:
+            session.close()
+
+    def search_catalog(self, title: str, limit: int = 20) -> List[dict]:
+        session = self.Session()
+        try:
+            entries = session.query(CatalogEntry).filter(or_(
+                CatalogEntry.title.icontains(title, autoescape=True),
+                CatalogEntry.alt_titles.icontains(title, autoescape=True)
+            )).limit(limit).all()
+            return [entry.to_dict() for entry in entries]
+        finally:
+            session.close()
+
+    def set_catalog_entry(self, slug: str, content_type: str, title: str, alt_titles: List[str] = None,
+                          poster: str = None, season_count: int = None, post_id: str = None):
+        self._upsert(CatalogEntry, [{
+            'slug': slug,
+            'type': content_type,
+            'title': title,
+            'alt_titles': '|'.join(alt_titles) if alt_titles else None,
+            'poster': poster,
+            'poster_path': poster_path_from_url(poster),
+            'season_count': season_count,
+            'post_id': post_id,
+            'updated_at': datetime.utcnow()
+        }], 'slug')
+
+    def get_crawl_state(self, content_type: str) -> Optional[Tuple[int, bool]]:
+        """(last page, completed) of the latest archive crawl, None if it was never crawled"""
+        session = self.Session()
+        try:
+            state = session.query(CrawlState).filter_by(content_type=content_type).first()
+            return (state.last_page, bool(state.completed)) if state else None
+        finally:
+            session.close()
+
+    def set_crawl_state(self, content_type: str, last_page: int, completed: bool):
+        self._upsert(CrawlState, [{
+            'content_type': content_type,
+            'last_page': last_page,
+            'completed': completed,
+            'updated_at': datetime.utcnow()
+        }], 'content_type')
+
+    def get_tmdb_response(self, key: str) -> Optional[str]:
+        session = self.Session()
+        try:
+            cached = session.query(TMDBResponse).filter_by(key=key).first()
+            if not cached or cached.expires_at < datetime.utcnow():
+                return None
+            return cached.payload
+        finally:
+            session.close()
+
+    def set_tmdb_response(self, key: str, payload: str, ttl: int):
+        self._upsert(TMDBResponse, [{
+            'key': key,
+            'payload': payload,
+            'expires_at': datetime.utcnow() + timedelta(seconds=ttl)
+        }], 'key')
+        # Rows are keyed per distinct query, purge the expired ones now and then
+        self._tmdb_writes += 1
+        if self._tmdb_writes % TMDB_PURGE_EVERY == 0:
+            self.delete_expired_tmdb_responses()
+
+    def delete_expired_tmdb_responses(self) -> int:
+        """Remove expired TMDB responses, returns the number of deleted rows"""
+        session = self.Session()
+        try:
+            deleted = session.query(TMDBResponse).filter(TMDBResponse.expires_at < datetime.utcnow()).delete(
+                synchronize_session=False
+            )
             session.commit()
+            return deleted
+        except Exception as e:
+            session.rollback()
+            logging.error(f"Error purging expired TMDB responses: {e}")
+            return 0
         finally:
             session.close()
 
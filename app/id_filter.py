@@ -0,0 +1,179 @@
+import logging
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional, Tuple
+
+from app.database import db
+
+# Same TTL as Database.is_failed_mapping
+FAILED_TTL_DAYS = 30
+# Incremental additions are merged into the sorted arrays past this size
+MERGE_THRESHOLD = 1024
+
+_IMDB_ID = re.compile(r'tt(\d+)$')
+
+
+def _utc_timestamp(naive_utc: datetime) -> int:
+    return int(naive_utc.replace(tzinfo=timezone.utc).timestamp())
+
+
+def imdb_to_int(imdb_id: str) -> Optional[int]:
+    """tt0123456 -> 123456, None for anything that isn't an IMDB id"""
+    match = _IMDB_ID.match(imdb_id or '')
+    return int(match.group(1)) if match else None
+
+
+class IdSet:
+    """
+    Compact set of IMDB ids - a sorted array of integers (with an optional
+    expiry timestamp per id) plus a small dict of recent additions
+    """
+
+    def __init__(self, entries: Iterable[Tuple[int, int]] = ()):
+        merged = dict(entries)
+        ids = array('Q', sorted(merged))
+        # (ids, expiry timestamps), always replaced together so readers never mix two versions
+        self._sorted = (ids, array('Q', (merged[i] for i in ids)))
+        self._added = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sorted[0]) + len(self._added)
+
+    def expiry(self, number: int) -> Optional[int]:
+        """Expiry timestamp of an id (0 = never), None if it isn't in the set"""
+        expires = self._added.get(number)
+        if expires is not None:
+            return expires
+        ids, expiries = self._sorted
+        i = bisect_left(ids, number)
+        if i < len(ids) and ids[i] == number:
+            return expiries[i]
+        return None
+
+    def add(self, number: int, expires: int = 0):
+        with self._lock:
+            self._added[number] = expires
+            if len(self._added) > MERGE_THRESHOLD:
+                self._merge()
+
+    def remove(self, number: int):
+        with self._lock:
+            self._added.pop(number, None)
+            ids, _ = self._sorted
+            i = bisect_left(ids, number)
+            if i < len(ids) and ids[i] == number:
+                # Ids can't be removed from the array, mark them as expired instead
+                self._added[number] = 1
+
+    def _merge(self):
+        """Fold the additions into the sorted arrays (with the lock held)"""
+        ids, expiries = self._sorted
+        merged = dict(zip(ids, expiries))
+        merged.update(self._added)
+        ids = array('Q', sorted(merged))
+        # Published before the additions are dropped, so no id is missing in between
+        self._sorted = (ids, array('Q', (merged[i] for i in ids)))
+        self._added = {}
+
+
+class IdFilter:
+    """
+    In-memory membership filter of IMDB ids known to be mapped or known not
+    to be anime, so those requests don't touch the database or the network
+    """
+
+    def __init__(self):
+        self.mapped = IdSet()
+        self.failed = IdSet()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.false_positives = 0
+        self.loaded_at = None
+
+    def load(self):
+        started = time.perf_counter()
+        cutoff = datetime.utcnow() - timedelta(days=FAILED_TTL_DAYS)
+        self.mapped = IdSet(
+            (number, 0) for number in map(imdb_to_int, db.get_mapped_imdb_ids()) if number
+        )
+        self.failed = IdSet(
+            (number, _utc_timestamp(checked_at + timedelta(days=FAILED_TTL_DAYS)))
+            for imdb_id, checked_at in db.get_failed_mappings(since=cutoff)
+            if (number := imdb_to_int(imdb_id))
+        )
+        self.loaded_at = time.time()
+        logging.info(
+            f"IMDB id filter loaded in {(time.perf_counter() - started) * 1000:.1f}ms "
+            f"({len(self.mapped)} mapped, {len(self.failed)} failed)"
+        )
+
+    def is_known_failed(self, imdb_id: str) -> bool:
+        """True if the id is known not to be anime (and the failure hasn't expired)"""
+        number = imdb_to_int(imdb_id)
+        expires = self.failed.expiry(number) if number else None
+        if expires is None:
+            self.misses += 1
+            return False
+        if expires and expires < time.time():
+            # Expired failure - has to be checked again
+            self.expired += 1
+            return False
+        self.hits += 1
+        return True
+
+    def is_known_mapped(self, imdb_id: str) -> bool:
+        number = imdb_to_int(imdb_id)
+        return bool(number) and self.mapped.expiry(number) is not None
+
+    def add_failed(self, imdb_id: str):
+        number = imdb_to_int(imdb_id)
+        if number:
+            self.failed.add(number, _utc_timestamp(datetime.utcnow() + timedelta(days=FAILED_TTL_DAYS)))
+
+    def add_mapped(self, imdb_id: str):
+        number = imdb_to_int(imdb_id)
+        if not number:
+            return
+        self.mapped.add(number)
+        expires = self.failed.expiry(number)
+        if expires is not None and (not expires or expires >= time.time()):
+            # Filter said "not anime" for an id that turned out to be mapped
+            self.false_positives += 1
+        if expires is not None:
+            self.failed.remove(number)
+
+    def stats(self) -> dict:
+        return {
+            'mapped': len(self.mapped),
+            'failed': len(self.failed),
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'false_positives': self.false_positives,
+            'loaded_at': self.loaded_at
+        }
+
+
+_filter = None
+_filter_lock = threading.Lock()
+
+
+def get_id_filter() -> IdFilter:
+    """Get the process-wide IMDB id filter, loading it on first use"""
+    global _filter
+    if _filter is None:
+        with _filter_lock:
+            if _filter is None:
+                id_filter = IdFilter()
+                try:
+                    id_filter.load()
+                except Exception as e:
+                    logging.error(f"Error loading IMDB id filter: {e}")
+                _filter = id_filter
+    return _filter
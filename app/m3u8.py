@@ -0,0 +1,115 @@
+import re
+from functools import lru_cache
+from typing import Optional
+
+_DEFAULT = re.compile(r'DEFAULT=(?:YES|NO)')
+_LANGUAGE = re.compile(r'LANGUAGE="([^"]+)"')
+_BANDWIDTH = re.compile(r'[:,]BANDWIDTH=(\d+)')
+_TARGET_DURATION = re.compile(r'^#EXT-X-TARGETDURATION:(\d+(?:\.\d+)?)', re.MULTILINE)
+
+
+def playlist_kind(content: str) -> str:
+    """'master' for variant playlists, 'vod' for complete media playlists, 'live' for growing ones"""
+    if '#EXT-X-STREAM-INF' in content:
+        return 'master'
+    return 'vod' if '#EXT-X-ENDLIST' in content else 'live'
+
+
+def target_duration(content: str) -> Optional[float]:
+    """Maximum segment duration of a media playlist in seconds"""
+    match = _TARGET_DURATION.search(content)
+    return float(match.group(1)) if match else None
+
+
+@lru_cache(maxsize=8)
+def _uri_attribute(prefix: str):
+    return re.compile(f'URI="({re.escape(prefix)}[^"]*)"')
+
+
+def _set_default(line: str, default: bool) -> str:
+    return _DEFAULT.sub('DEFAULT=YES' if default else 'DEFAULT=NO', line)
+
+
+def rewrite_playlist(content: str, base_url: str, preferred_lang: str = None,
+                     max_bandwidth: Optional[int] = None, prefix: str = '/hls/') -> str:
+    """
+    Rewrite a master or media playlist in a single pass over its lines:
+    - root-relative URIs starting with `prefix` (segment lines and URI="..." attributes)
+      are made absolute against `base_url`
+    - with `preferred_lang`, audio renditions of that language are moved first (right
+      after #EXT-X-VERSION) and made the default, the others are set DEFAULT=NO
+    - with `max_bandwidth`, variants above it are dropped (the lowest one is kept if
+      none would be left)
+    """
+    uri_attr = _uri_attribute(prefix)
+    uri_repl = f'URI="{base_url}\\1"'
+
+    out = []
+    preferred_tracks = []
+    other_tracks = []
+    audio_at = None  # where the audio renditions go
+    version_at = None
+    skipping_uri = False  # the next URI line belongs to a dropped variant
+    kept_variants = 0
+    lowest_dropped = None  # (bandwidth, tag line, uri line) of the cheapest dropped variant
+    dropped_at = None
+
+    for line in content.split('\n'):
+        if line.startswith(prefix):
+            line = base_url + line
+        elif 'URI="' in line:
+            line = uri_attr.sub(uri_repl, line)
+
+        if skipping_uri:
+            if line and not line.startswith('#'):
+                skipping_uri = False
+                if lowest_dropped[2] is None:
+                    lowest_dropped = (lowest_dropped[0], lowest_dropped[1], line)
+            continue
+
+        if line.startswith('#EXT-X-MEDIA:TYPE=AUDIO') and preferred_lang:
+            language = _LANGUAGE.search(line)
+            if language and language.group(1) == preferred_lang:
+                preferred_tracks.append(line)
+            else:
+                other_tracks.append((bool(language), line))
+            if audio_at is None:
+                audio_at = len(out)
+            continue
+
+        if line.startswith('#EXT-X-VERSION'):
+            out.append(line)
+            version_at = len(out)
+            continue
+
+        if max_bandwidth and line.startswith('#EXT-X-STREAM-INF:'):
+            bandwidth = _BANDWIDTH.search(line)
+            if bandwidth and int(bandwidth.group(1)) > max_bandwidth:
+                skipping_uri = True
+                if dropped_at is None:
+                    dropped_at = len(out)
+                if lowest_dropped is None or int(bandwidth.group(1)) < lowest_dropped[0]:
+                    lowest_dropped = (int(bandwidth.group(1)), line, None)
+                continue
+            kept_variants += 1
+
+        out.append(line)
+
+    inserts = []
+    if preferred_tracks or other_tracks:
+        if preferred_tracks:
+            tracks = [_set_default(line, True) for line in preferred_tracks]
+            tracks += [_set_default(line, False) if has_language else line for has_language, line in other_tracks]
+        else:
+            # Language not available, keep the playlist's own default
+            tracks = [line for _, line in other_tracks]
+        inserts.append((version_at if version_at is not None else audio_at, True, tracks))
+    if lowest_dropped and not kept_variants and lowest_dropped[2] is not None:
+        inserts.append((dropped_at, False, [lowest_dropped[1], lowest_dropped[2]]))
+
+    # Later positions first, so earlier ones stay valid. At the same position the audio
+    # renditions go in last, ending up before the fallback variant.
+    for position, _, lines in sorted(inserts, key=lambda insert: (-insert[0], insert[1])):
+        out[position:position] = lines
+
+    return '\n'.join(out)
@@ -1,18 +1,64 @@
-import requests
 import re
 from typing import Optional
-from cachetools import TTLCache
 from config import Config
+from app.cache_backend import make_cache
 from app.database import db
+from app.id_filter import get_id_filter
+from app.mapping_index import get_mapping_index
+from app.tmdb import tmdb_client
 
 # Cache for failed mapping attempts (1 hour TTL, max 500 entries)
-failed_mappings_cache = TTLCache(maxsize=500, ttl=3600)
+failed_mappings_cache = make_cache('failed_mappings', maxsize=500, ttl=3600)
 
 # Cache for successful slug->imdb mappings (1 hour TTL, max 1000 entries)
-slug_to_imdb_cache = TTLCache(maxsize=1000, ttl=3600)
+slug_to_imdb_cache = make_cache('slug_to_imdb', maxsize=1000, ttl=3600)
 
 # Cache for successful imdb->slug lookups (1 hour TTL, max 1000 entries)
-imdb_to_slug_cache = TTLCache(maxsize=1000, ttl=3600)
+imdb_to_slug_cache = make_cache('imdb_to_slug', maxsize=1000, ttl=3600)
+
+def mark_failed_mapping(imdb_id: str):
+    """Remember that an IMDB ID could not be mapped to a slug"""
+    failed_mappings_cache.set(imdb_id, True)
+    get_id_filter().add_failed(imdb_id)
+    db.queue_failed_mapping(imdb_id)
+
+def save_mapping(slug: str, tmdb_id: str, imdb_id: str):
+    """Store a slug <-> IMDB mapping"""
+    db.queue_mapping(slug, tmdb_id, imdb_id)
+    get_id_filter().add_mapped(imdb_id)
+    index = get_mapping_index()
+    if index:
+        index.add(slug, imdb_id)
+
+def cached_imdb_id(slug: str) -> Optional[str]:
+    """IMDB ID of a slug from the preloaded mapping index or the cache"""
+    index = get_mapping_index()
+    imdb_id = index.get_imdb(slug) if index else None
+    return imdb_id or slug_to_imdb_cache.get(slug)
+
+def cached_slug(imdb_id: str) -> Optional[str]:
+    """Slug of an IMDB ID from the preloaded mapping index or the cache"""
+    index = get_mapping_index()
+    slug = index.get_slug(imdb_id) if index else None
+    return slug or imdb_to_slug_cache.get(imdb_id)
+
+def is_known_non_anime(imdb_id: str) -> bool:
+    """Check if an IMDB ID is known not to be anime, consulting the cache and database only for unknown IDs"""
+    id_filter = get_id_filter()
+    if id_filter.is_known_failed(imdb_id):
+        return True
+    if id_filter.is_known_mapped(imdb_id):
+        return False
+
+    # Not seen by this worker yet - check what other workers learned, then the database (with TTL)
+    if failed_mappings_cache.get(imdb_id):
+        id_filter.add_failed(imdb_id)
+        return True
+    if db.is_failed_mapping(imdb_id):
+        failed_mappings_cache.set(imdb_id, True)
+        id_filter.add_failed(imdb_id)
+        return True
+    return False
 
 def get_imdb_id_from_tmdb(tmdb_id: str, content_type: str) -> Optional[str]:
     """Get IMDB ID from TMDB ID"""
@@ -20,16 +66,9 @@ def get_imdb_id_from_tmdb(tmdb_id: str, content_type: str) -> Optional[str]:
         return None
     
     media_type = 'tv' if content_type == 'series' else 'movie'
-    url = f"https://api.themoviedb.org/3/{media_type}/{tmdb_id}/external_ids"
-    params = {'api_key': Config.TMDB_API_KEY}
-    
-    try:
-        resp = requests.get(url, params=params, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
+    data = tmdb_client.get(f"/{media_type}/{tmdb_id}/external_ids", cache_kind='external_ids')
+    if data:
         return data.get('imdb_id')
-    except:
-        pass
     return None
 
 def get_tmdb_details_from_imdb(imdb_id: str) -> Optional[dict]:
@@ -37,27 +76,19 @@ def get_tmdb_details_from_imdb(imdb_id: str) -> Optional[dict]:
     if not Config.TMDB_API_KEY:
         return None
     
-    url = f"https://api.themoviedb.org/3/find/{imdb_id}"
-    params = {
-        'api_key': Config.TMDB_API_KEY,
-        'external_source': 'imdb_id'
-    }
+    params = {'external_source': 'imdb_id'}
+    data = tmdb_client.get(f"/find/{imdb_id}", params, cache_kind='find')
+    if not data:
+        return None
     
-    try:
-        resp = requests.get(url, params=params, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        
-        if data.get('movie_results'):
-            result = data['movie_results'][0]
-            result['media_type'] = 'movie'
-            return result
-        elif data.get('tv_results'):
-            result = data['tv_results'][0]
-            result['media_type'] = 'series'
-            return result
-    except:
-        pass
+    if data.get('movie_results'):
+        result = dict(data['movie_results'][0])
+        result['media_type'] = 'movie'
+        return result
+    elif data.get('tv_results'):
+        result = dict(data['tv_results'][0])
+        result['media_type'] = 'series'
+        return result
     return None
 
 def get_all_tmdb_posters(tmdb_id: str, content_type: str) -> list:
@@ -66,18 +97,11 @@ def get_all_tmdb_posters(tmdb_id: str, content_type: str) -> list:
         return []
     
     media_type = 'tv' if content_type == 'series' else 'movie'
-    url = f"https://api.themoviedb.org/3/{media_type}/{tmdb_id}/images"
-    params = {'api_key': Config.TMDB_API_KEY}
-    
-    try:
-        resp = requests.get(url, params=params, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        posters = data.get('posters', [])
-        return [p['file_path'] for p in posters if p.get('file_path')]
-    except:
-        pass
-    return []
+    data = tmdb_client.get(f"/{media_type}/{tmdb_id}/images", cache_kind='images')
+    if not data:
+        return []
+    posters = data.get('posters', [])
+    return [p['file_path'] for p in posters if p.get('file_path')]
 
 def search_tmdb(title: str, content_type: str, poster_url: str = None, year: str = None) -> Optional[dict]:
     """Search TMDB for title and optionally match by poster"""
@@ -85,45 +109,37 @@ def search_tmdb(title: str, content_type: str, poster_url: str = None, year: str
         return None
     
     media_type = 'tv' if content_type == 'series' else 'movie'
-    url = f"https://api.themoviedb.org/3/search/{media_type}"
-    params = {
-        'api_key': Config.TMDB_API_KEY,
-        'query': title
-    }
+    params = {'query': title}
     if year:
         params['year' if media_type == 'movie' else 'first_air_date_year'] = year
     
-    try:
-        resp = requests.get(url, params=params, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        results = data.get('results', [])
-        
-        if not results:
-            return None
-        
-        if len(results) == 1:
-            return results[0]
+    data = tmdb_client.get(f"/search/{media_type}", params, cache_kind='search')
+    if not data:
+        return None
+    results = data.get('results', [])
+    
+    if not results:
+        return None
+    
+    if len(results) == 1:
+        return results[0]
+    
+    # Match by poster if provided
+    if poster_url:
+        # First try to match by main poster_path
+        for result in results:
+            poster_path = result.get('poster_path')
+            if poster_path and poster_path in poster_url:
+                return result
         
-        # Match by poster if provided
-        if poster_url:
-            # First try to match by main poster_path
-            for result in results:
-                poster_path = result.get('poster_path')
-                if poster_path and poster_path in poster_url:
+        # If no match, try all posters for each result
+        for result in results:
+            all_posters = get_all_tmdb_posters(str(result['id']), content_type)
+            for poster_path in all_posters:
+                if poster_path in poster_url:
                     return result
-            
-            # If no match, try all posters for each result
-            for result in results:
-                all_posters = get_all_tmdb_posters(str(result['id']), content_type)
-                for poster_path in all_posters:
-                    if poster_path in poster_url:
-                        return result
-        
-        return results[0]
-    except:
-        pass
-    return None
+    
+    return results[0]
 
 def match_by_poster(tmdb_poster_path: str, search_results: list, tmdb_id: str = None, content_type: str = None) -> Optional[dict]:
     """Match WatchAnimeWorld search result by TMDB poster path"""
@@ -147,17 +163,49 @@ def match_by_poster(tmdb_poster_path: str, search_results: list, tmdb_id: str =
     
     return None
 
-def get_or_create_imdb_mapping(slug: str, title: str, content_type: str, poster_url: str = None, year: str = None) -> Optional[str]:
-    """Get IMDB ID for slug, creating mapping if needed (slug → IMDB)"""
+def match_in_catalog_index(title: str, poster_path: str, tmdb_id: str, content_type: str) -> Optional[dict]:
+    """Match TMDB item against the local catalog index (built by crawler.py)"""
+    if not poster_path:
+        return None
+
+    entries = db.find_catalog_by_posters([poster_path])
+    if entries:
+        return entries[0]
+
+    candidates = db.search_catalog(title)
+    if candidates:
+        return match_by_poster(poster_path, candidates, tmdb_id, content_type)
+    return None
+
+def prefetch_imdb_mappings(slugs: list) -> set:
+    """
+    Load known mappings of many slugs into the cache with a single query
+    :return: Slugs the database has no mapping for
+    """
+    missing = [slug for slug in slugs if slug and not cached_imdb_id(slug)]
+    if not missing:
+        return set()
+    mappings = db.get_mappings(missing)
+    for slug, (tmdb_id, imdb_id) in mappings.items():
+        slug_to_imdb_cache.set(slug, imdb_id)
+    return set(missing) - set(mappings)
+
+def get_or_create_imdb_mapping(slug: str, title: str, content_type: str, poster_url: str = None, year: str = None,
+                               check_db: bool = True) -> Optional[str]:
+    """
+    Get IMDB ID for slug, creating mapping if needed (slug → IMDB)
+    :param check_db: False when the slug is already known to have no mapping (see prefetch_imdb_mappings)
+    """
     # Check cache first
-    if slug in slug_to_imdb_cache:
-        return slug_to_imdb_cache[slug]
+    imdb_id = cached_imdb_id(slug)
+    if imdb_id:
+        return imdb_id
     
     # Check if mapping exists in DB
-    mapping = db.get_mapping(slug)
+    mapping = db.get_mapping(slug) if check_db else None
     if mapping:
         imdb_id = mapping[1]
-        slug_to_imdb_cache[slug] = imdb_id
+        slug_to_imdb_cache.set(slug, imdb_id)
         return imdb_id
     
     # Search TMDB
@@ -169,8 +217,8 @@ def get_or_create_imdb_mapping(slug: str, title: str, content_type: str, poster_
     imdb_id = get_imdb_id_from_tmdb(tmdb_id, content_type)
     
     if imdb_id:
-        db.set_mapping(slug, tmdb_id, imdb_id)
-        slug_to_imdb_cache[slug] = imdb_id
+        save_mapping(slug, tmdb_id, imdb_id)
+        slug_to_imdb_cache.set(slug, imdb_id)
         return imdb_id
     
     return None
@@ -179,30 +227,25 @@ def get_or_create_slug_mapping(imdb_id: str) -> Optional[str]:
     """Get slug for IMDB ID, creating mapping if needed (IMDB → slug)"""
     from app.routes import wawin_client
     
-    # Check if we already tried and failed (in-memory cache)
-    if imdb_id in failed_mappings_cache:
-        return None
-    
-    # Check if we already tried and failed (database with TTL)
-    if db.is_failed_mapping(imdb_id):
-        failed_mappings_cache[imdb_id] = True
+    # Check if we already tried and failed
+    if is_known_non_anime(imdb_id):
         return None
     
     # Check cache first
-    if imdb_id in imdb_to_slug_cache:
-        return imdb_to_slug_cache[imdb_id]
+    slug = cached_slug(imdb_id)
+    if slug:
+        return slug
     
     # Check if mapping exists in DB
     slug = db.get_slug_by_imdb(imdb_id)
     if slug:
-        imdb_to_slug_cache[imdb_id] = slug
+        imdb_to_slug_cache.set(imdb_id, slug)
         return slug
     
     # Get TMDB details from IMDB ID
     tmdb_details = get_tmdb_details_from_imdb(imdb_id)
     if not tmdb_details:
-        failed_mappings_cache[imdb_id] = True
-        db.add_failed_mapping(imdb_id)
+        mark_failed_mapping(imdb_id)
         return None
     
     title = tmdb_details.get('title') or tmdb_details.get('name')
@@ -210,30 +253,29 @@ def get_or_create_slug_mapping(imdb_id: str) -> Optional[str]:
     tmdb_id = str(tmdb_details['id'])
     
     if not title:
-        failed_mappings_cache[imdb_id] = True
-        db.add_failed_mapping(imdb_id)
+        mark_failed_mapping(imdb_id)
         return None
     
-    # Search on WatchAnimeWorld
-    search_results = wawin_client.search_anime(title)
-    if not search_results:
-        failed_mappings_cache[imdb_id] = True
-        db.add_failed_mapping(imdb_id)
-        return None
+    # Try the local catalog index first, search on WatchAnimeWorld only on a miss
+    matched = match_in_catalog_index(title, poster_path, tmdb_id, tmdb_details['media_type'])
+    if not matched:
+        search_results = wawin_client.search_anime(title)
+        if not search_results:
+            mark_failed_mapping(imdb_id)
+            return None
+        
+        # Match by poster (required)
+        matched = match_by_poster(poster_path, search_results, tmdb_id, tmdb_details['media_type'])
     
-    # Match by poster (required)
-    matched = match_by_poster(poster_path, search_results, tmdb_id, tmdb_details['media_type'])
     if not matched:
-        failed_mappings_cache[imdb_id] = True
-        db.add_failed_mapping(imdb_id)
+        mark_failed_mapping(imdb_id)
         return None
     
     slug = matched.get('slug')
     if slug:
-        db.set_mapping(slug, tmdb_id, imdb_id)
-        imdb_to_slug_cache[imdb_id] = slug
+        save_mapping(slug, tmdb_id, imdb_id)
+        imdb_to_slug_cache.set(imdb_id, slug)
         return slug
     
-    failed_mappings_cache[imdb_id] = True
-    db.add_failed_mapping(imdb_id)
+    mark_failed_mapping(imdb_id)
     return None
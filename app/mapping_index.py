@@ -0,0 +1,134 @@
+import logging
+import sys
+import threading
+import time
+from array import array
+from typing import Iterable, Optional, Tuple
+
+from app.database import db
+from app.id_filter import imdb_to_int
+from config import Config
+
+
+def _imdb_from_int(number: int) -> str:
+    return f"tt{number:07d}"
+
+
+class MappingIndex:
+    """
+    Read-only two-way slug <-> IMDB id index over the whole mappings table.
+    Slugs are packed into one bytes blob and ids into integer arrays, so the
+    index is a handful of objects that stay shared copy-on-write when loaded
+    before gunicorn forks. Mappings created later go into a per-worker delta.
+    """
+
+    def __init__(self, rows: Iterable[Tuple[str, str]] = ()):
+        by_slug = {}
+        # Ids that don't survive the int round trip (unusual padding) are kept as strings, by slug
+        self._odd_ids = {}
+        for slug, imdb_id in rows:
+            number = imdb_to_int(imdb_id)
+            if not slug or not number:
+                continue
+            by_slug[slug] = number
+            if _imdb_from_int(number) != imdb_id:
+                self._odd_ids[slug] = imdb_id
+
+        # Slug side: sorted slugs (blob + offsets) with their ids
+        slugs = sorted(slug.encode() for slug in by_slug)
+        self._blob = b''.join(slugs)
+        self._offsets = array('I', [0])
+        for slug in slugs:
+            self._offsets.append(self._offsets[-1] + len(slug))
+        self._slug_ids = array('Q', (by_slug[slug.decode()] for slug in slugs))
+
+        # IMDB side: sorted ids with the position of their slug
+        order = sorted(range(len(slugs)), key=self._slug_ids.__getitem__)
+        self._ids = array('Q', (self._slug_ids[i] for i in order))
+        self._id_slugs = array('I', order)
+
+        self._delta_imdb = {}  # slug -> imdb id
+        self._delta_slug = {}  # imdb id -> slug
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._slug_ids) + len(self._delta_imdb)
+
+    def _slug_at(self, i: int) -> bytes:
+        return self._blob[self._offsets[i]:self._offsets[i + 1]]
+
+    def get_imdb(self, slug: str) -> Optional[str]:
+        """IMDB id of a slug, None if it isn't mapped"""
+        imdb_id = self._delta_imdb.get(slug) or self._odd_ids.get(slug)
+        if imdb_id:
+            return imdb_id
+        key = slug.encode()
+        lo, hi = 0, len(self._slug_ids)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._slug_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self._slug_ids) and self._slug_at(lo) == key:
+            return _imdb_from_int(self._slug_ids[lo])
+        return None
+
+    def get_slug(self, imdb_id: str) -> Optional[str]:
+        """Slug mapped to an IMDB id, None if there is none"""
+        slug = self._delta_slug.get(imdb_id)
+        if slug:
+            return slug
+        number = imdb_to_int(imdb_id)
+        if not number:
+            return None
+        ids = self._ids
+        lo, hi = 0, len(ids)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if ids[mid] < number:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(ids) and ids[lo] == number:
+            return self._slug_at(self._id_slugs[lo]).decode()
+        return None
+
+    def add(self, slug: str, imdb_id: str):
+        """Record a mapping created after the index was built"""
+        with self._lock:
+            self._delta_imdb[slug] = imdb_id
+            self._delta_slug[imdb_id] = slug
+
+    def stats(self) -> dict:
+        arrays = (self._offsets, self._slug_ids, self._ids, self._id_slugs)
+        return {
+            'mappings': len(self._slug_ids),
+            'delta': len(self._delta_imdb),
+            'bytes': sys.getsizeof(self._blob) + sum(a.itemsize * len(a) for a in arrays)
+        }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_mapping_index() -> Optional[MappingIndex]:
+    """Get the process-wide mapping index (None unless PRELOAD_MAPPINGS is set), loading it on first use"""
+    global _index
+    if not Config.PRELOAD_MAPPINGS:
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                started = time.perf_counter()
+                try:
+                    index = MappingIndex(db.get_all_mappings())
+                except Exception as e:
+                    logging.error(f"Error loading mapping index: {e}")
+                    index = MappingIndex()
+                logging.info(
+                    f"Mapping index loaded in {(time.perf_counter() - started) * 1000:.1f}ms ({index.stats()})"
+                )
+                _index = index
+    return _index
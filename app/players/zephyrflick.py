@@ -1,13 +1,122 @@
+import asyncio
+import logging
 import re
-import requests
+from typing import Optional
+
+import aiohttp
+
+from app.aio import get_session
+from app.cache_backend import make_cache
 from app.routes.utils import get_random_agent
 from config import Config
 
-async def get_video_from_zephyrflick_player(player_url: str, preferred_lang: str = None):
+PLAYER_BASE_URL = "https://play.zephyrflick.top"
+API_URL = f"{PLAYER_BASE_URL}/player/index.php"
+
+# Extracted video source and subtitles per video id (the same video is embedded in
+# several episode pages and languages). Kept below the subtitle_mappings TTL, and in
+# process memory, as it is read and written on the event loop.
+VIDEO_CACHE_TTL = 1800
+# Results without subtitles because the player page failed are only kept briefly
+DEGRADED_CACHE_TTL = 60
+video_cache = make_cache('zephyrflick_videos', maxsize=512, ttl=VIDEO_CACHE_TTL, shared=False)
+
+# Extractions in flight per video id, so concurrent requests share them
+_extractions = {}
+
+
+async def _fetch_video_source(session: aiohttp.ClientSession, video_id: str, headers: dict, timeout: float) -> Optional[str]:
+    params = {
+        'data': video_id,
+        'do': 'getVideo'
+    }
+    async with session.post(API_URL, params=params, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+        resp.raise_for_status()
+        data = await resp.json(content_type=None)
+    return data.get('videoSource')
+
+
+async def _fetch_subtitles(session: aiohttp.ClientSession, player_url: str, headers: dict, timeout: float) -> list:
+    """Subtitle tracks of the player page as (language name, url) pairs"""
+    async with session.get(player_url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+        resp.raise_for_status()
+        html = await resp.text()
+
+    # Find playerjsSubtitle variable
+    subtitle_match = re.search(r'var playerjsSubtitle = "([^"]+)"', html)
+    if not subtitle_match:
+        return []
+
+    # Parse subtitle entries: [Language]url
+    tracks = []
+    for line in subtitle_match.group(1).split('\n'):
+        sub_match = re.match(r'\[([^\]]+)\](.+)', line.strip())
+        if sub_match:
+            tracks.append((sub_match.group(1), sub_match.group(2)))
+    return tracks
+
+
+async def _extract(video_id: str, player_url: str, timeout: float) -> Optional[dict]:
+    """Fetch the video source and the player page (for subtitles) concurrently"""
+    session = await get_session()
+    headers = {
+        'User-Agent': get_random_agent(),
+        'X-Requested-With': 'XMLHttpRequest',
+        'Referer': player_url
+    }
+    video_source, subtitles = await asyncio.gather(
+        _fetch_video_source(session, video_id, headers, timeout),
+        _fetch_subtitles(session, player_url, headers, timeout),
+        return_exceptions=True
+    )
+    if isinstance(video_source, BaseException):
+        logging.error(f"Error extracting Zephyrflick video: {video_source}")
+        return None
+    if not video_source:
+        return None
+
+    # Subtitles are optional, the video plays without them
+    degraded = isinstance(subtitles, BaseException)
+    if degraded:
+        logging.warning(f"Error fetching Zephyrflick subtitles of {video_id}: {subtitles}")
+    extracted = {
+        'video_source': video_source,
+        'subtitles': [] if degraded else subtitles
+    }
+    video_cache.set(video_id, extracted, DEGRADED_CACHE_TTL if degraded else None)
+    return extracted
+
+
+async def extract_video(video_id: str, player_url: str, timeout: float = 30) -> Optional[dict]:
+    """
+    Get the video source and subtitle tracks of a video, from the cache when possible
+    :return: dict {'video_source', 'subtitles': [(language name, url)]}, None on errors
+    """
+    extracted = video_cache.get(video_id)
+    if extracted is not None:
+        return extracted
+
+    task = _extractions.get(video_id)
+    if task is None:
+        task = asyncio.ensure_future(_extract(video_id, player_url, timeout))
+        _extractions[video_id] = task
+        task.add_done_callback(lambda _: _extractions.pop(video_id, None))
+    # Shielded, so a caller giving up doesn't cancel the extraction for the others
+    return await asyncio.shield(task)
+
+
+def _store_subtitle_mappings(subtitle_urls: dict):
+    from app.routes.proxy import subtitle_mappings
+    for subtitle_id, sub_url in subtitle_urls.items():
+        subtitle_mappings.set(subtitle_id, sub_url)
+
+
+async def get_video_from_zephyrflick_player(player_url: str, preferred_lang: str = None, timeout: float = 30):
     """
     Extract video URL and subtitles from Zephyrflick player
     :param player_url: Zephyrflick player URL
     :param preferred_lang: Preferred audio language (e.g. 'hin', 'eng', 'jpn')
+    :param timeout: Timeout of each upstream request in seconds
     :return: tuple (video_url, quality, headers, subtitles)
     """
     try:
@@ -15,84 +124,49 @@ async def get_video_from_zephyrflick_player(player_url: str, preferred_lang: str
         match = re.search(r'/video/([a-f0-9]+)', player_url)
         if not match:
             return None, None, None, []
-        
+
         video_id = match.group(1)
-        
-        api_headers = {
-            'User-Agent': get_random_agent(),
-            'X-Requested-With': 'XMLHttpRequest',
-            'Referer': player_url
-        }
-        
-        # Make POST request to get video source
-        api_url = f"https://play.zephyrflick.top/player/index.php"
-        params = {
-            'data': video_id,
-            'do': 'getVideo'
-        }
-        
-        resp = requests.post(api_url, params=params, headers=api_headers, timeout=30)
-        resp.raise_for_status()
-        
-        data = resp.json()
-        video_url = data.get('videoSource')
-        
-        if not video_url:
+        extracted = await extract_video(video_id, player_url, timeout)
+        if not extracted:
             return None, None, None, []
-        
+
         # Rewrite URL to use our proxy (with language if specified)
+        video_url = extracted['video_source']
         if preferred_lang:
-            video_url = video_url.replace('https://play.zephyrflick.top', f'{Config.PROTOCOL}://{Config.REDIRECT_URL}/{preferred_lang}')
+            video_url = video_url.replace(PLAYER_BASE_URL, f'{Config.PROTOCOL}://{Config.REDIRECT_URL}/{preferred_lang}')
         else:
-            video_url = video_url.replace('https://play.zephyrflick.top', f'{Config.PROTOCOL}://{Config.REDIRECT_URL}')
+            video_url = video_url.replace(PLAYER_BASE_URL, f'{Config.PROTOCOL}://{Config.REDIRECT_URL}')
 
         stream_headers = None
-        
-        # Get subtitles from player page
+
         subtitles = []
-        try:
-            page_resp = requests.get(player_url, headers=api_headers, timeout=30)
-            page_resp.raise_for_status()
-            
-            # Find playerjsSubtitle variable
-            subtitle_match = re.search(r'var playerjsSubtitle = "([^"]+)"', page_resp.text)
-            if subtitle_match:
-                subtitle_data = subtitle_match.group(1)
-                # Parse subtitle entries: [Language]url
-                for line in subtitle_data.split('\n'):
-                    line = line.strip()
-                    if not line:
-                        continue
-                    
-                    sub_match = re.match(r'\[([^\]]+)\](.+)', line)
-                    if sub_match:
-                        lang_name = sub_match.group(1)
-                        sub_url = sub_match.group(2)
-                        
-                        # Convert language name to ISO code
-                        lang_code = 'eng' if 'english' in lang_name.lower() else lang_name.lower()[:3]
-                        
-                        # Determine file extension from original URL
-                        file_ext = '.srt' if sub_url.endswith('.srt') else '.vtt'
-                        subtitle_id = f"{video_id}_{lang_code}{file_ext}"
-                        
-                        # Store mapping for proxy route
-                        from app.routes.proxy import subtitle_mappings
-                        subtitle_mappings[subtitle_id] = sub_url
-                        
-                        # Proxy subtitle URL through our server
-                        proxied_sub_url = f"{Config.PROTOCOL}://{Config.REDIRECT_URL}/subtitles/{subtitle_id}"
-                        
-                        subtitles.append({
-                            'id': f"{video_id}_{lang_code}",
-                            'url': proxied_sub_url,
-                            'lang': lang_code
-                        })
-        except:
-            pass
-        
+        subtitle_urls = {}
+        for lang_name, sub_url in extracted['subtitles']:
+            # Convert language name to ISO code
+            lang_code = 'eng' if 'english' in lang_name.lower() else lang_name.lower()[:3]
+
+            # Determine file extension from original URL
+            file_ext = '.srt' if sub_url.endswith('.srt') else '.vtt'
+            subtitle_id = f"{video_id}_{lang_code}{file_ext}"
+
+            # Store mapping for proxy route
+            subtitle_urls[subtitle_id] = sub_url
+
+            # Proxy subtitle URL through our server, as WebVTT (SRT files are converted by the proxy)
+            proxied_sub_url = f"{Config.PROTOCOL}://{Config.REDIRECT_URL}/subtitles/{video_id}_{lang_code}.vtt"
+
+            subtitles.append({
+                'id': f"{video_id}_{lang_code}",
+                'url': proxied_sub_url,
+                'lang': lang_code
+            })
+
+        if subtitle_urls:
+            # The mappings may live in a shared (file or network) cache, keep that I/O off the loop
+            await asyncio.get_running_loop().run_in_executor(None, _store_subtitle_mappings, subtitle_urls)
+
         return video_url, 'auto', stream_headers, subtitles
-        
+
     except Exception as e:
-        print(f"Error extracting Zephyrflick video: {e}")
+        logging.error(f"Error extracting Zephyrflick video: {e}")
         return None, None, None, []
@@ -0,0 +1,173 @@
+import gzip
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+from dataclasses import dataclass
+from typing import Mapping, Optional
+
+from cachetools import LRUCache
+
+from config import Config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are not worth compressing (same as Flask-Compress)
+MIN_COMPRESS_SIZE = 500
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+# Expired files are removed from the spill directory every this many spills
+SPILL_PRUNE_INTERVAL = 100
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    """Final body of a response with its compressed variants, by content coding"""
+    etag: str
+    variants: Mapping[str, bytes]
+    cache_time: int
+    expires_at: float
+    mimetype: str = 'application/json'
+
+    @property
+    def size(self) -> int:
+        return sum(len(body) for body in self.variants.values())
+
+
+class _SpillingLRUCache(LRUCache):
+    """LRUCache handing evicted entries to a callback"""
+
+    def __init__(self, maxsize, getsizeof, on_evict):
+        super().__init__(maxsize=maxsize, getsizeof=getsizeof)
+        self._on_evict = on_evict
+
+    def popitem(self):
+        key, entry = super().popitem()
+        self._on_evict(key, entry)
+        return key, entry
+
+
+class ResponseStore:
+    """
+    LRU store of serialized and pre-compressed responses, bounded by the
+    total size of the stored bodies.
+    With `spill_dir`, entries evicted from memory are written there (shared by
+    the workers) and read back on a memory miss until they expire.
+    """
+
+    def __init__(self, max_bytes: int, spill_dir: str = None):
+        getsizeof = lambda entry: entry.size
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            self._entries = _SpillingLRUCache(max_bytes, getsizeof, self._spill)
+        else:
+            self._entries = LRUCache(maxsize=max_bytes, getsizeof=getsizeof)
+        self._spill_dir = spill_dir
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.spills = 0
+
+    def get(self, key) -> Optional[StoredResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.time():
+                del self._entries[key]
+                entry = None
+        if entry is None and self._spill_dir:
+            entry = self._load_spilled(key)
+            if entry is not None:
+                self.disk_hits += 1
+                self._keep(key, entry)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, key, body: bytes, etag: str, cache_time: int, ttl: float,
+            mimetype: str = 'application/json') -> StoredResponse:
+        """Compress a body once and keep all variants for `ttl` seconds"""
+        variants = {'identity': body}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            variants['gzip'] = gzip.compress(body, GZIP_LEVEL)
+            if brotli is not None:
+                variants['br'] = brotli.compress(body, quality=BROTLI_QUALITY)
+        entry = StoredResponse(etag, variants, cache_time, time.time() + ttl, mimetype)
+        self._keep(key, entry)
+        return entry
+
+    def _keep(self, key, entry: StoredResponse):
+        with self._lock:
+            try:
+                self._entries[key] = entry
+            except ValueError:
+                # Larger than the whole store, serve it without keeping it in memory
+                if self._spill_dir:
+                    self._spill(key, entry)
+
+    def _spill_path(self, key) -> str:
+        return os.path.join(self._spill_dir, hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest())
+
+    def _spill(self, key, entry: StoredResponse):
+        path = self._spill_path(key)
+        if entry.expires_at <= time.time() or os.path.exists(path):
+            return
+        try:
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((key, entry), f, protocol=pickle.HIGHEST_PROTOCOL)
+            # The modification time is the expiry, for pruning without reading the files
+            os.utime(tmp_path, (entry.expires_at, entry.expires_at))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.error(f"Error spilling response to disk: {e}")
+            return
+        self.spills += 1
+        if self.spills % SPILL_PRUNE_INTERVAL == 0:
+            self._prune_spilled()
+
+    def _load_spilled(self, key) -> Optional[StoredResponse]:
+        try:
+            with open(self._spill_path(key), 'rb') as f:
+                stored_key, entry = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.error(f"Error reading spilled response: {e}")
+            return None
+        if stored_key != key or entry.expires_at <= time.time():
+            return None
+        return entry
+
+    def _prune_spilled(self):
+        now = time.time()
+        for file in os.scandir(self._spill_dir):
+            try:
+                if file.stat().st_mtime <= now:
+                    os.remove(file.path)
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        stats = {
+            'entries': len(self._entries),
+            'bytes': self._entries.currsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else None
+        }
+        if self._spill_dir:
+            stats['disk_hits'] = self.disk_hits
+            stats['spills'] = self.spills
+        return stats
+
+
+response_store = ResponseStore(Config.RESPONSE_STORE_MAX_BYTES)
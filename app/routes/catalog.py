@@ -1,15 +1,32 @@
+import logging
+import threading
 import urllib.parse
 import requests
-from flask import Blueprint, abort, url_for, request
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from flask import Blueprint, abort, url_for, request, g
 
 from . import wawin_client
-from app.routes.utils import cache
 from .manifest import MANIFEST
-from .utils import respond_with, log_error
-from app.mapper import get_or_create_imdb_mapping
+from .utils import respond_with, respond_with_stored, store_response, log_error
+from app.response_store import response_store
+from app.mapper import cached_imdb_id, get_or_create_imdb_mapping, prefetch_imdb_mappings
+from app.search_index import get_search_index
 
 catalog_bp = Blueprint('catalog', __name__)
 
+# Catalog items are mapped to IMDB ids concurrently, at most this many at once per worker
+MAPPING_WORKERS = 4
+# Items not mapped within this many seconds are left out and finished in the background
+CATALOG_DEADLINE = 20
+# CDN cache time of incomplete catalogs, so the completed one is picked up soon
+PARTIAL_CATALOG_CACHE_TIME = 60
+# Complete catalogs are served from the response store for this long
+CATALOG_STORE_TTL = 600
+
+_mapping_executor = ThreadPoolExecutor(max_workers=MAPPING_WORKERS)
+_mapping_futures = {}
+_mapping_lock = threading.Lock()
+
 
 def _is_valid_catalog(catalog_type: str, catalog_id: str):
     if catalog_type in MANIFEST['types']:
@@ -21,55 +38,135 @@ def _is_valid_catalog(catalog_type: str, catalog_id: str):
 @catalog_bp.route('/catalog/<catalog_type>/<catalog_id>/search=<search>.json')
 @catalog_bp.route('/<lang>/catalog/<catalog_type>/<catalog_id>.json')
 @catalog_bp.route('/<lang>/catalog/<catalog_type>/<catalog_id>/search=<search>.json')
-@cache.cached()
 def addon_catalog(catalog_type: str, catalog_id: str, search: str = None, lang: str = None):
     if not _is_valid_catalog(catalog_type, catalog_id):
         abort(404)
 
+    # The path holds the catalog, search query and language
+    stored = response_store.get(request.path)
+    if stored:
+        return respond_with_stored(stored)
+
     try:
         metas = []
         
         if catalog_id == 'newest_drops':
             results = wawin_client.get_newest_drops()
-            metas = [m for m in [wawin_to_meta(item) for item in results] if m]
+            metas = wawin_to_metas(results)
         elif catalog_id == 'most_watched_shows':
             results = wawin_client.get_most_watched_shows()
-            metas = [m for m in [wawin_to_meta(item) for item in results] if m]
+            metas = wawin_to_metas(results)
         elif catalog_id == 'new_arrivals':
             results = wawin_client.get_new_anime_arrivals()
-            metas = [m for m in [wawin_to_meta(item) for item in results] if m]
+            metas = wawin_to_metas(results)
         elif catalog_id == 'most_watched_films':
             results = wawin_client.get_most_watched_films()
-            metas = [m for m in [wawin_to_meta(item) for item in results] if m]
+            metas = wawin_to_metas(results)
         elif catalog_id == 'latest_movies':
             results = wawin_client.get_latest_anime_movies()
-            metas = [m for m in [wawin_to_meta(item) for item in results] if m]
+            metas = wawin_to_metas(results)
         elif catalog_id == 'search' and search:
             search = urllib.parse.unquote(search)
-            results = wawin_client.search_anime(search)
-            metas = [m for m in [wawin_to_meta(item) for item in results] if m]
+            results = search_titles(search)
+            metas = wawin_to_metas(results)
         
-        return respond_with({'metas': metas}, 3600)
+        if catalog_id != 'search' and metas:
+            # Keep the local search index up to date with titles seen on the homepage
+            get_search_index().add_many(results)
+        
+        if g.get('partial_catalog'):
+            return respond_with({'metas': metas}, PARTIAL_CATALOG_CACHE_TIME)
+        return respond_with_stored(store_response(request.path, {'metas': metas}, 3600, CATALOG_STORE_TTL))
     except Exception as e:
         log_error(e)
         return respond_with({'metas': []}, 3600)
 
 
-def wawin_to_meta(item: dict):
+def search_titles(query: str):
+    """Search the local title index, falling back to the site only without a confident hit"""
+    index = get_search_index()
+    results = index.search(query)
+    if not results:
+        results = wawin_client.search_anime(query)
+        index.add_many(results)
+    return results
+
+
+def _submit_mapping(item: dict, check_db: bool = True):
+    """Schedule mapping of an item, reusing one that is already in flight"""
     slug = item.get('slug')
-    title = item.get('title')
-    content_type = item.get('type', 'series')
-    poster = item.get('poster')
-    
+    with _mapping_lock:
+        future = _mapping_futures.get(slug)
+        if future is None:
+            future = _mapping_executor.submit(wawin_to_meta, item, check_db)
+            _mapping_futures[slug] = future
+            future.add_done_callback(lambda _: _mapping_futures.pop(slug, None))
+    return future
+
+
+def wawin_to_metas(items: list):
+    """
+    Map catalog items concurrently, keeping their order.
+    Items with a known mapping are answered right away, only the others go
+    to the mapping pool, so they don't queue behind slow TMDB lookups.
+    Items that miss CATALOG_DEADLINE are left out and keep mapping in the
+    background, the request is then marked as partial so it isn't cached.
+    """
+    if not items:
+        return []
+
+    # One query for all known mappings instead of one per item
+    try:
+        unmapped = prefetch_imdb_mappings([item.get('slug') for item in items])
+    except Exception as e:
+        log_error(e)
+        unmapped = set()
+
+    # Per item either its meta (known mapping) or the future mapping it
+    results = []
+    for item in items:
+        imdb_id = cached_imdb_id(item.get('slug'))
+        if imdb_id:
+            results.append(_to_meta(item, imdb_id))
+        else:
+            results.append(_submit_mapping(item, check_db=item.get('slug') not in unmapped))
+
+    futures = [result for result in results if isinstance(result, Future)]
+    done, not_done = wait(futures, timeout=CATALOG_DEADLINE)
+    if not_done:
+        logging.warning(f"{len(not_done)} catalog item(s) missed the mapping deadline")
+        g.partial_catalog = True
+
+    metas = []
+    for result in results:
+        if isinstance(result, Future):
+            if result not in done:
+                continue
+            try:
+                result = result.result()
+            except Exception as e:
+                log_error(e)
+                continue
+        if result:
+            metas.append(result)
+    return metas
+
+
+def _to_meta(item: dict, imdb_id: str) -> dict:
+    return {
+        'id': imdb_id,
+        'name': item.get('title'),
+        'type': item.get('type', 'series'),
+        'poster': item.get('poster')
+    }
+
+
+def wawin_to_meta(item: dict, check_db: bool = True):
     # Get or create IMDB mapping
-    imdb_id = get_or_create_imdb_mapping(slug, title, content_type, poster)
+    imdb_id = get_or_create_imdb_mapping(item.get('slug'), item.get('title'), item.get('type', 'series'),
+                                         item.get('poster'), check_db=check_db)
     
     if not imdb_id:
         return None
     
-    return {
-        'id': imdb_id,
-        'name': title,
-        'type': content_type,
-        'poster': poster
-    }
\ No newline at end of file
+    return _to_meta(item, imdb_id)
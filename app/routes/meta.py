@@ -1,14 +1,19 @@
 from urllib.parse import unquote
-from flask import Blueprint, abort
+from flask import Blueprint, abort, request
 
 from . import wawin_client
 from .manifest import MANIFEST
-from .utils import respond_with, log_error
+from .utils import respond_with, respond_with_stored, store_response, log_error
+from app.api.watchanimeworld import details_cache
 from app.database import db
-from app.mapper import imdb_to_slug_cache, failed_mappings_cache
+from app.mapper import cached_slug, imdb_to_slug_cache, is_known_non_anime
+from app.response_store import response_store
 
 meta_bp = Blueprint('meta', __name__)
 
+# Complete metas are served from the response store for as long as the details are cached
+META_STORE_TTL = 1800
+
 
 @meta_bp.route('/meta/<meta_type>/<meta_id>.json')
 @meta_bp.route('/<lang>/meta/<meta_type>/<meta_id>.json')
@@ -18,27 +23,26 @@ def addon_meta(meta_type: str, meta_id: str, lang: str = None):
     if meta_type not in MANIFEST['types']:
         abort(404)
 
+    # The path holds the type, id and language
+    stored = response_store.get(request.path)
+    if stored:
+        return respond_with_stored(stored)
+
     # meta_id is IMDB ID (e.g., tt13706018)
     if not meta_id.startswith('tt'):
         return respond_with({'meta': {}})
 
-    # Check if we know this is not anime (in-memory cache)
-    if meta_id in failed_mappings_cache:
-        return respond_with({'meta': {}})
-    
-    # Check if we know this is not anime (database with TTL)
-    if db.is_failed_mapping(meta_id):
-        failed_mappings_cache[meta_id] = True
+    # Check if we know this is not anime
+    if is_known_non_anime(meta_id):
         return respond_with({'meta': {}})
     
     # Check cache first
-    if meta_id in imdb_to_slug_cache:
-        slug = imdb_to_slug_cache[meta_id]
-    else:
+    slug = cached_slug(meta_id)
+    if not slug:
         # Find slug from IMDB ID
         slug = db.get_slug_by_imdb(meta_id)
         if slug:
-            imdb_to_slug_cache[meta_id] = slug
+            imdb_to_slug_cache.set(meta_id, slug)
     
     if not slug:
         return respond_with({'meta': {}})
@@ -73,7 +77,10 @@ def addon_meta(meta_type: str, meta_id: str, lang: str = None):
                 for ep in details.get('episodes', [])
             ]
         
-        return respond_with({'meta': meta}, 86400)
+        # Details with seasons still loading aren't cached, the meta isn't stored either
+        if slug not in details_cache:
+            return respond_with({'meta': meta}, 86400)
+        return respond_with_stored(store_response(request.path, {'meta': meta}, 86400, META_STORE_TTL))
     except Exception as e:
         log_error(e)
         return respond_with({'meta': {}})
@@ -1,61 +1,133 @@
-import re
+import os
+import time
 import requests
 from flask import Blueprint, Response, request, abort
 from urllib.parse import unquote
-from cachetools import TTLCache
 from config import Config
-from .utils import get_random_agent
+from app.cache_backend import make_cache
+from app.m3u8 import playlist_kind, rewrite_playlist, target_duration
+from app.response_store import ResponseStore
+from app.singleflight import SingleFlight
+from app.subtitles import srt_to_vtt
+from .utils import etag_matches, generate_etag, get_random_agent, respond_with_stored
 
 proxy_bp = Blueprint('proxy', __name__)
 
-# Store subtitle mappings with TTL (1 hour expiration, max 500 entries)
-subtitle_mappings = TTLCache(maxsize=500, ttl=3600)
+UPSTREAM_URL = 'https://play.zephyrflick.top'
 
-def reorder_audio_tracks(m3u8_content: str, preferred_lang: str) -> str:
+# (connect, read) timeouts per playlist type. Players poll media playlists every few
+# seconds, a slow response is worth less than a quick retry.
+PLAYLIST_TIMEOUTS = {
+    'master': (3.05, 10),
+    'media': (3.05, 5),
+}
+# Larger playlists are refused instead of being buffered
+MAX_PLAYLIST_BYTES = 4 * 1024 * 1024
+# Upstream headers passed through to clients (the ETag is our own, the body is rewritten)
+_PASSTHROUGH_HEADERS = ('Cache-Control', 'Last-Modified', 'Expires')
+
+# Upstream playlists per (path, query) and their rewritten variants per
+# (path, query, lang). Master and finished media playlists don't change,
+# live media playlists are kept for half a target duration.
+STATIC_PLAYLIST_TTL = 600
+MIN_LIVE_PLAYLIST_TTL = 1
+playlist_cache = make_cache('playlists', maxsize=256, ttl=STATIC_PLAYLIST_TTL)
+rewritten_playlist_cache = make_cache('rewritten_playlists', maxsize=512, ttl=STATIC_PLAYLIST_TTL)
+# Concurrent misses of the same playlist share one upstream fetch
+_playlist_fetches = SingleFlight()
+
+# Keep-alive connections to the player host, shared by all requests of the worker
+session = requests.Session()
+session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=32))
+
+# Store subtitle mappings with TTL (1 hour expiration, max 500 entries). Use a shared
+# CACHE_BACKEND with several workers, the subtitle request may not reach the worker that stored it.
+subtitle_mappings = make_cache('subtitle_mappings', maxsize=500, ttl=3600)
+
+# Subtitle files don't change for a video id. They are kept (pre-compressed) well
+# beyond their mapping, SRT files along with their WebVTT conversion.
+SUBTITLE_TIMEOUT = (3.05, 15)
+MAX_SUBTITLE_BYTES = 2 * 1024 * 1024
+SUBTITLE_STORE_TTL = 86400
+SUBTITLE_CACHE_TIME = 86400
+SUBTITLE_MIMETYPES = {'.srt': 'application/x-subrip', '.vtt': 'text/vtt'}
+subtitle_store = ResponseStore(Config.SUBTITLE_STORE_MAX_BYTES, Config.SUBTITLE_SPILL_DIR)
+_subtitle_fetches = SingleFlight()
+
+def playlist_type(path: str) -> str:
+    """'master' for variant playlists, 'media' for segment lists (guessed from the file name)"""
+    return 'master' if 'master' in path.rsplit('/', 1)[-1].lower() else 'media'
+
+
+class ResponseTooLarge(Exception):
+    pass
+
+
+def _read_limited(resp: requests.Response, limit: int) -> bytes:
+    if int(resp.headers.get('Content-Length') or 0) > limit:
+        raise ResponseTooLarge(resp.headers['Content-Length'])
+    body = bytearray()
+    for chunk in resp.iter_content(chunk_size=64 * 1024):
+        body.extend(chunk)
+        if len(body) > limit:
+            raise ResponseTooLarge(len(body))
+    return bytes(body)
+
+
+def _playlist_ttl(content: str) -> float:
+    if playlist_kind(content) != 'live':
+        return STATIC_PLAYLIST_TTL
+    return max(MIN_LIVE_PLAYLIST_TTL, (target_duration(content) or 2) / 2)
+
+
+def _fetch_playlist(key, original_url: str, path: str) -> dict:
+    headers = {
+        'User-Agent': get_random_agent(),
+        'Referer': f'{UPSTREAM_URL}/'
+    }
+    with session.get(original_url, headers=headers, timeout=PLAYLIST_TIMEOUTS[playlist_type(path)], stream=True) as resp:
+        resp.raise_for_status()
+        body = _read_limited(resp, MAX_PLAYLIST_BYTES)
+        passthrough = {name: resp.headers[name] for name in _PASSTHROUGH_HEADERS if name in resp.headers}
+        content = body.decode(resp.encoding or 'utf-8', errors='replace')
+
+    ttl = _playlist_ttl(content)
+    playlist = {'content': content, 'headers': passthrough, 'expires': time.time() + ttl}
+    playlist_cache.set(key, playlist, ttl=ttl)
+    return playlist
+
+
+def get_playlist(path: str, query_string: str) -> dict:
     """
-    Reorder audio tracks in m3u8 to set preferred language as DEFAULT=YES and first
+    Upstream playlist, fetched once per TTL
+    :return: dict {'content', 'headers', 'expires'}
     """
-    lines = m3u8_content.split('\n')
-    audio_tracks = []
-    other_lines = []
-    preferred_track = None
-    
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-        if line.startswith('#EXT-X-MEDIA:TYPE=AUDIO'):
-            # Extract language from track
-            lang_match = re.search(r'LANGUAGE="([^"]+)"', line)
-            if lang_match:
-                track_lang = lang_match.group(1)
-                if track_lang == preferred_lang:
-                    # Set as DEFAULT=YES
-                    line = re.sub(r'DEFAULT=(YES|NO)', 'DEFAULT=YES', line)
-                    preferred_track = line
-                else:
-                    # Set as DEFAULT=NO
-                    line = re.sub(r'DEFAULT=(YES|NO)', 'DEFAULT=NO', line)
-                    audio_tracks.append(line)
-            else:
-                audio_tracks.append(line)
-        else:
-            other_lines.append((i, line))
-        i += 1
-    
-    # Rebuild m3u8 with preferred track first
-    result = []
-    audio_inserted = False
-    
-    for idx, line in other_lines:
-        result.append(line)
-        # Insert audio tracks after #EXT-X-VERSION line
-        if line.startswith('#EXT-X-VERSION') and not audio_inserted:
-            if preferred_track:
-                result.append(preferred_track)
-            result.extend(audio_tracks)
-            audio_inserted = True
-    
-    return '\n'.join(result)
+    key = (path, query_string)
+    playlist = playlist_cache.get(key)
+    if playlist is None:
+        original_url = f"{UPSTREAM_URL}/cdn/hls/{path}"
+        if query_string:
+            original_url += f"?{query_string}"
+        playlist = _playlist_fetches.do(key, _fetch_playlist, key, original_url, path)
+    return playlist
+
+
+def playlist_stats() -> dict:
+    """Hit ratios of the playlist caches and coalesced upstream fetches"""
+    return {
+        'upstream': playlist_cache.stats(),
+        'rewritten': rewritten_playlist_cache.stats(),
+        'fetches': _playlist_fetches.stats()
+    }
+
+
+def _cors(response: Response) -> Response:
+    # Add CORS headers for Stremio Web
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    response.headers['Access-Control-Allow-Methods'] = 'GET, HEAD, OPTIONS'
+    response.headers['Access-Control-Allow-Headers'] = '*'
+    return response
+
 
 @proxy_bp.route('/cdn/hls/<path:path>')
 @proxy_bp.route('/<lang>/cdn/hls/<path:path>')
@@ -64,80 +136,88 @@ def proxy_hls(path, lang=None):
     Proxy HLS playlist and rewrite URLs to point to original server
     Optionally reorder audio tracks to set preferred language as default
     """
-    # Get original URL with query params
     query_string = request.query_string.decode('utf-8')
-    original_url = f"https://play.zephyrflick.top/cdn/hls/{path}"
-    if query_string:
-        original_url += f"?{query_string}"
     
     try:
-        headers = {
-            'User-Agent': get_random_agent(),
-            'Referer': 'https://play.zephyrflick.top/'
-        }
-        
-        resp = requests.get(original_url, headers=headers, timeout=30)
-        resp.raise_for_status()
-        
-        content = resp.text
+        playlist = get_playlist(path, query_string)
         
-        # Reorder audio tracks if language specified
-        if lang:
-            content = reorder_audio_tracks(content, lang)
+        key = (path, query_string, lang)
+        rewritten = rewritten_playlist_cache.get(key)
+        if rewritten is None:
+            # Absolute segment URIs and the preferred audio track first, in one pass
+            content = rewrite_playlist(playlist['content'], UPSTREAM_URL, lang, Config.HLS_MAX_BANDWIDTH or None)
+            # Validator of the body actually sent, it depends on the rewrite settings too
+            rewritten = {'content': content, 'etag': generate_etag(content.encode())}
+            rewritten_playlist_cache.set(key, rewritten, ttl=max(1, playlist['expires'] - time.time()))
         
-        # Rewrite relative URLs to absolute URLs pointing to original server
-        content = re.sub(
-            r'URI="(/hls/[^"]+)"',
-            r'URI="https://play.zephyrflick.top\1"',
-            content
-        )
-        content = re.sub(
-            r'^(/hls/.+)$',
-            r'https://play.zephyrflick.top\1',
-            content,
-            flags=re.MULTILINE
-        )
-        
-        response = Response(content, mimetype='application/vnd.apple.mpegurl')
-        # Add CORS headers for Stremio Web
-        response.headers['Access-Control-Allow-Origin'] = '*'
-        response.headers['Access-Control-Allow-Methods'] = 'GET, HEAD, OPTIONS'
-        response.headers['Access-Control-Allow-Headers'] = '*'
-        return response
+        if etag_matches(rewritten['etag']):
+            response = Response(status=304, headers=playlist['headers'])
+        else:
+            response = Response(rewritten['content'], mimetype='application/vnd.apple.mpegurl',
+                                headers=playlist['headers'])
+        response.set_etag(rewritten['etag'])
+        return _cors(response)
     except Exception as e:
         print(f"Error proxying HLS: {e}")
         abort(502)
 
+def _subtitle_source(subtitle_id: str):
+    """
+    Mapped upstream file of a subtitle id; .vtt ids fall back to the SRT file of the same track
+    :return: tuple (source id, upstream url), the url is None for unknown ids
+    """
+    original_url = subtitle_mappings.get(subtitle_id)
+    if original_url:
+        return subtitle_id, original_url
+    stem, ext = os.path.splitext(subtitle_id)
+    if ext == '.vtt':
+        srt_id = f'{stem}.srt'
+        return srt_id, subtitle_mappings.get(srt_id)
+    return subtitle_id, None
+
+
+def _fetch_subtitle(source_id: str, original_url: str) -> dict:
+    """
+    Download a subtitle file into the subtitle store, converting SRT files to WebVTT once
+    :return: dict {subtitle id: StoredResponse}
+    """
+    headers = {
+        'User-Agent': get_random_agent(),
+        'Referer': f'{UPSTREAM_URL}/'
+    }
+    with session.get(original_url, headers=headers, timeout=SUBTITLE_TIMEOUT, stream=True) as resp:
+        resp.raise_for_status()
+        body = _read_limited(resp, MAX_SUBTITLE_BYTES)
+
+    bodies = {source_id: body}
+    stem, ext = os.path.splitext(source_id)
+    if ext == '.srt':
+        bodies[f'{stem}.vtt'] = srt_to_vtt(body)
+
+    stored = {}
+    for subtitle_id, body in bodies.items():
+        mimetype = SUBTITLE_MIMETYPES.get(os.path.splitext(subtitle_id)[1], 'text/vtt')
+        stored[subtitle_id] = subtitle_store.put(subtitle_id, body, generate_etag(body), SUBTITLE_CACHE_TIME,
+                                                 SUBTITLE_STORE_TTL, mimetype)
+    return stored
+
+
 @proxy_bp.route('/subtitles/<subtitle_id>')
 def proxy_subtitle(subtitle_id):
     """
     Proxy subtitle files with correct content-type
+    Served from the subtitle store with ETags and Range support; .vtt ids of SRT tracks are converted
     """
-    original_url = subtitle_mappings.get(subtitle_id)
-    if not original_url:
-        abort(404)
-    
-    try:
-        headers = {
-            'User-Agent': get_random_agent(),
-            'Referer': 'https://play.zephyrflick.top/'
-        }
-        
-        resp = requests.get(original_url, headers=headers, timeout=30)
-        resp.raise_for_status()
-        
-        # Determine content type based on file extension
-        if subtitle_id.endswith('.srt'):
-            content_type = 'application/x-subrip'
-        else:
-            content_type = 'text/vtt'
-        
-        response = Response(resp.content, mimetype=content_type)
-        # Add CORS headers
-        response.headers['Access-Control-Allow-Origin'] = '*'
-        response.headers['Access-Control-Allow-Methods'] = 'GET, HEAD, OPTIONS'
-        response.headers['Access-Control-Allow-Headers'] = '*'
-        return response
-    except Exception as e:
-        print(f"Error proxying subtitle: {e}")
-        abort(502)
+    stored = subtitle_store.get(subtitle_id)
+    if stored is None:
+        source_id, original_url = _subtitle_source(subtitle_id)
+        if not original_url:
+            abort(404)
+
+        try:
+            stored = _subtitle_fetches.do(source_id, _fetch_subtitle, source_id, original_url)[subtitle_id]
+        except Exception as e:
+            print(f"Error proxying subtitle: {e}")
+            abort(502)
+
+    return _cors(respond_with_stored(stored, SUBTITLE_CACHE_TIME, accept_ranges=True))
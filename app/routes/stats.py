@@ -0,0 +1,31 @@
+import os
+
+from flask import Blueprint
+
+from . import wawin_client
+from .proxy import playlist_stats, subtitle_store
+from .utils import respond_with
+from app.id_filter import get_id_filter
+from app.mapping_index import get_mapping_index
+from app.response_store import response_store
+
+stats_bp = Blueprint('stats', __name__)
+
+
+@stats_bp.route('/stats.json')
+def addon_stats():
+    """
+    Cache hit ratios and counters of this worker, for monitoring
+    :return: JSON response (never cached)
+    """
+    index = get_mapping_index()
+    return respond_with({
+        'pid': os.getpid(),
+        # Upstream request coalescing, homepage snapshot and all named caches
+        'scraper': wawin_client.stats(),
+        'id_filter': get_id_filter().stats(),
+        'mapping_index': index.stats() if index else None,
+        'response_store': response_store.stats(),
+        'playlists': playlist_stats(),
+        'subtitles': subtitle_store.stats()
+    }, use_etag=False)
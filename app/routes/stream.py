@@ -1,47 +1,77 @@
+import asyncio
+import logging
+import time
 import urllib.parse
+from typing import Optional
 from flask import Blueprint, abort
 from .manifest import MANIFEST
 
 from app.routes import wawin_client
 from app.routes.utils import respond_with
+from app.aio import run as run_async
+from app.cache_backend import make_cache
 from app.database import db
 from app.mapper import get_or_create_slug_mapping
 
 stream_bp = Blueprint('stream', __name__)
 
+# Resolved player output per (slug, season, episode, lang). Must stay below the
+# subtitle_mappings TTL in proxy.py, otherwise cached subtitle URLs would 404.
+RESOLVED_STREAMS_TTL = 1800
+RESOLVED_NEGATIVE_TTL = 120
+# Resolved URLs are dropped this many seconds before the upstream link expires
+EXPIRY_MARGIN = 60
+_EXPIRY_PARAMS = ('expires', 'expire', 'exp', 'e')
 
-def process_stream_sync(stream_data, preferred_lang=None):
+resolved_streams_cache = make_cache('resolved_streams', maxsize=512, ttl=RESOLVED_STREAMS_TTL)
+
+# Timeout of each upstream request of a source
+SOURCE_TIMEOUT = 10
+# Sources not resolved within this many seconds are left out of the response,
+# the complete list is cached once they finish
+STREAMS_DEADLINE = 12
+# CDN cache time of incomplete stream lists
+PARTIAL_STREAMS_CACHE_TIME = 30
+
+
+def _source_ttl(url: str) -> int:
+    """Seconds a resolved stream URL can be reused, based on its expiry parameter if it has one"""
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
+    for param in _EXPIRY_PARAMS:
+        value = query.get(param, [''])[0]
+        if value.isdigit():
+            remaining = int(value) - int(time.time()) - EXPIRY_MARGIN
+            return max(0, min(remaining, RESOLVED_STREAMS_TTL))
+    return RESOLVED_STREAMS_TTL
+
+
+def _streams_ttl(streams: list) -> int:
+    if not streams:
+        return RESOLVED_NEGATIVE_TTL
+    return min(_source_ttl(stream['url']) for stream in streams)
+
+
+async def resolve_source(stream_data, preferred_lang=None) -> Optional[dict]:
     """Process a single stream source"""
     from app.players.zephyrflick import get_video_from_zephyrflick_player
-    import asyncio
-    import nest_asyncio
-    
+
     player = stream_data.get('player')
     url = stream_data.get('url')
-    
+
     if player == 'zephyrflick':
         try:
-            # Allow nested event loops
-            nest_asyncio.apply()
-            
-            try:
-                loop = asyncio.get_event_loop()
-            except RuntimeError:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-            
-            video_url, quality, headers, subtitles = loop.run_until_complete(
-                get_video_from_zephyrflick_player(url, preferred_lang)
+            video_url, quality, headers, subtitles = await get_video_from_zephyrflick_player(
+                url, preferred_lang, timeout=SOURCE_TIMEOUT
             )
         except Exception as e:
-            print(f"Error processing stream: {e}")
+            logging.error(f"Error processing stream: {e}")
             return None
     else:
         return None
-    
+
     if not video_url:
         return None
-    
+
     stream_obj = {
         'title': f'[{player}][{quality}]',
         'url': video_url,
@@ -49,19 +79,93 @@ def process_stream_sync(stream_data, preferred_lang=None):
             'notWebReady': True  # HLS without CORS - not playable in Stremio Web
         }
     }
-    
+
     if headers:
         stream_obj['behaviorHints']['proxyHeaders'] = headers
-    
+
     if subtitles:
         stream_obj['subtitles'] = [
             {'id': sub.get('id', sub['url']), 'url': sub['url'], 'lang': sub['lang']}
             for sub in subtitles
         ]
-    
+
     return stream_obj
 
 
+def _collect_streams(tasks: list) -> list:
+    """Results of finished source tasks, in source order"""
+    streams = []
+    for task in tasks:
+        if not task.done() or task.cancelled():
+            continue
+        if task.exception():
+            logging.error(f"Error processing stream: {task.exception()}")
+            continue
+        if task.result():
+            streams.append(task.result())
+    return streams
+
+
+def _cache_streams(cache_key, streams: list) -> int:
+    ttl = _streams_ttl(streams)
+    if ttl:
+        resolved_streams_cache.set(cache_key, {'streams': streams, 'expires': time.time() + ttl}, ttl=ttl)
+    return ttl
+
+
+async def _cache_when_done(cache_key, tasks: list):
+    await asyncio.wait(tasks)
+    # The cache may be shared (file or network), keep that I/O off the loop
+    await asyncio.get_running_loop().run_in_executor(None, _cache_streams, cache_key, _collect_streams(tasks))
+
+
+async def resolve_streams_async(sources: list, preferred_lang: str, cache_key):
+    """
+    Resolve all sources concurrently.
+    Sources that miss STREAMS_DEADLINE keep resolving in the background and
+    the complete list is cached when they are done.
+    :return: tuple (streams, complete)
+    """
+    tasks = [asyncio.ensure_future(resolve_source(source, preferred_lang)) for source in sources]
+    if not tasks:
+        return [], True
+    _, pending = await asyncio.wait(tasks, timeout=STREAMS_DEADLINE)
+    if pending:
+        logging.warning(f"{len(pending)} stream source(s) missed the deadline")
+        asyncio.ensure_future(_cache_when_done(cache_key, tasks))
+    return _collect_streams(tasks), not pending
+
+
+def resolve_streams(sources: list, preferred_lang: str, cache_key):
+    """Synchronous resolve_streams_async, on the shared event loop"""
+    return run_async(resolve_streams_async(sources, preferred_lang, cache_key))
+
+
+def parse_content_id(content_id: str):
+    """
+    tt13706018:3:2 for series or tt13706018 for movies
+    :return: tuple (imdb_id, season, episode), imdb_id is None for invalid ids
+    """
+    parts = urllib.parse.unquote(content_id).split(":")
+    if not parts[0].startswith('tt'):
+        return None, None, None
+    if len(parts) == 3:
+        return parts[0], int(parts[1]), int(parts[2])
+    # Movies don't have season/episode
+    return parts[0], None, None
+
+
+def cached_streams(cache_key):
+    """
+    Resolved streams still in the cache
+    :return: tuple (streams, remaining seconds), None on a miss
+    """
+    cached = resolved_streams_cache.get(cache_key)
+    if not cached:
+        return None
+    return cached['streams'], max(1, int(cached['expires'] - time.time()))
+
+
 @stream_bp.route('/stream/<content_type>/<content_id>.json')
 @stream_bp.route('/<lang>/stream/<content_type>/<content_id>.json')
 def addon_stream(content_type: str, content_id: str, lang: str = None):
@@ -72,41 +176,32 @@ def addon_stream(content_type: str, content_id: str, lang: str = None):
     :param lang: Optional preferred audio language (e.g. 'hin', 'eng', 'jpn')
     :return: JSON response
     """
-    content_id = urllib.parse.unquote(content_id)
-    parts = content_id.split(":")
-
     if content_type not in MANIFEST['types']:
         abort(404)
 
-    if len(parts) < 1 or not parts[0].startswith('tt'):
+    imdb_id, season, episode = parse_content_id(content_id)
+    if not imdb_id:
         return respond_with({'streams': []}, use_etag=False)
 
-    imdb_id = parts[0]
-    
     # Find or create slug mapping from IMDB ID
     slug = get_or_create_slug_mapping(imdb_id)
     if not slug:
         return respond_with({'streams': []}, use_etag=False)
-    
-    # For series: tt13706018:3:2, for movies: tt13706018
-    if len(parts) == 3:
-        season = int(parts[1])
-        episode = int(parts[2])
-    else:
-        # Movies don't have season/episode
-        season = None
-        episode = None
+
+    cache_key = (slug, season, episode, lang)
+    cached = cached_streams(cache_key)
+    if cached:
+        streams, remaining = cached
+        return respond_with({'streams': streams}, remaining, use_etag=False)
 
     try:
         data = wawin_client.get_episode_streams(slug, season, episode)
-        streams = []
-        
-        for stream_data in data.get('streams', []):
-            stream = process_stream_sync(stream_data, lang)
-            if stream:
-                streams.append(stream)
-        
-        return respond_with({'streams': streams}, use_etag=False)
+        streams, complete = resolve_streams(data.get('streams', []), lang, cache_key)
+        if not complete:
+            return respond_with({'streams': streams}, PARTIAL_STREAMS_CACHE_TIME, use_etag=False)
+
+        ttl = _cache_streams(cache_key, streams)
+        return respond_with({'streams': streams}, ttl, use_etag=False)
     except Exception as e:
-        print(f"Error getting streams: {e}")
+        logging.error(f"Error getting streams: {e}")
         return respond_with({'streams': []}, use_etag=False)
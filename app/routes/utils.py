@@ -1,10 +1,13 @@
 import logging
 import random
-from flask import jsonify, flash, make_response, url_for, redirect, Response, request
-from flask_caching import Cache
+from flask import flash, make_response, url_for, redirect, Response, request
 import json
 import hashlib
-cache = Cache()
+from app.response_store import StoredResponse, response_store
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 def handle_error(err) -> Response:
@@ -41,33 +44,100 @@ def log_error(err):
         logging.error(f"An unexpected error occurred: {err}\n")
 
 
-def generate_etag(data: dict) -> str:
-    data_str = json.dumps(data, sort_keys=True)
-    return hashlib.md5(data_str.encode()).hexdigest()
+def dump_json(data) -> bytes:
+    """
+    Serialize a payload with sorted keys, using orjson when it is installed
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            # Types orjson doesn't know, e.g. mapping proxies
+            pass
+    return json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def generate_etag(body: bytes) -> str:
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def etag_matches(etag: str) -> bool:
+    """
+    Check If-None-Match, ignoring the ':gzip'-style suffix Flask-Compress adds to compressed variants
+    """
+    if request.if_none_match.star_tag:
+        return True
+    return any(tag.split(':')[0] == etag for tag in request.if_none_match.as_set())
 
 
 # Enable CORS
 def respond_with(data: dict, cache_time: int = None, client_cache_time: int = 0, use_etag: bool = True) -> Response:
     """
-    Respond with CORS headers to the client
+    Respond with CORS headers to the client.
+    The payload is serialized once, the ETag is derived from the same bytes.
     """
+    body = dump_json(data)
     if use_etag:
-        etag = generate_etag(data)
-        if request.headers.get('If-None-Match') == etag:
-            return Response(status=304)
+        etag = generate_etag(body)
+        if etag_matches(etag):
+            resp = Response(status=304)
+        else:
+            resp = Response(body, mimetype='application/json')
+        resp.set_etag(etag)
+    else:
+        resp = Response(body, mimetype='application/json')
+    return _add_headers(resp, cache_time, client_cache_time)
+
+
+def store_response(key, data: dict, cache_time: int, ttl: float) -> StoredResponse:
+    """
+    Serialize and compress a payload once, keeping it in the response store for `ttl` seconds
+    """
+    body = dump_json(data)
+    return response_store.put(key, body, generate_etag(body), cache_time, ttl)
+
+
+def respond_with_stored(stored: StoredResponse, client_cache_time: int = 0, accept_ranges: bool = False) -> Response:
+    """
+    Respond with the stored variant matching Accept-Encoding, or 304 if the client has it.
+    With `accept_ranges`, Range requests get parts of the uncompressed body.
+    """
+    offered = [encoding for encoding in ('br', 'gzip') if encoding in stored.variants] + ['identity']
+    encoding = request.accept_encodings.best_match(offered, default='identity')
+    if accept_ranges and request.range is not None:
+        encoding = 'identity'
+    if etag_matches(stored.etag):
+        resp = Response(status=304)
+    else:
+        resp = Response(stored.variants[encoding], mimetype=stored.mimetype)
+        if encoding != 'identity':
+            # Flask-Compress leaves responses with a Content-Encoding alone
+            resp.headers['Content-Encoding'] = encoding
+    resp.set_etag(stored.etag if encoding == 'identity' else f"{stored.etag}:{encoding}")
+    if accept_ranges and encoding == 'identity' and resp.status_code == 200:
+        resp.make_conditional(request, accept_ranges=True, complete_length=len(stored.variants['identity']))
+    resp.vary.add('Accept-Encoding')
+    return _add_headers(resp, stored.cache_time, client_cache_time)
+
 
-    resp = jsonify(data)
+def response_headers(cache_time: int = None, client_cache_time: int = 0) -> dict:
+    """
+    CORS and CDN cache headers of addon responses
+    """
+    headers = {}
     if cache_time:
-        resp.headers['Cache-Control'] = f'public, s-max-age={cache_time}, max-age={client_cache_time}'
-        resp.headers['CDN-Cache-Control'] = f'public, s-maxage={cache_time}, maxage={cache_time}'
-        resp.headers['Vercel-CDN-Cache-Control'] = f'public, s-maxage={cache_time}'
-        resp.headers['Cloudflare-CDN-Cache-Control'] = f'public, maxage={cache_time}'
-    
-    if use_etag:
-        resp.headers['ETag'] = etag
+        headers['Cache-Control'] = f'public, s-max-age={cache_time}, max-age={client_cache_time}'
+        headers['CDN-Cache-Control'] = f'public, s-maxage={cache_time}, maxage={cache_time}'
+        headers['Vercel-CDN-Cache-Control'] = f'public, s-maxage={cache_time}'
+        headers['Cloudflare-CDN-Cache-Control'] = f'public, maxage={cache_time}'
     
-    resp.headers['Access-Control-Allow-Origin'] = "*"
-    resp.headers['Access-Control-Allow-Headers'] = '*'
+    headers['Access-Control-Allow-Origin'] = "*"
+    headers['Access-Control-Allow-Headers'] = '*'
+    return headers
+
+
+def _add_headers(resp: Response, cache_time: int = None, client_cache_time: int = 0) -> Response:
+    resp.headers.update(response_headers(cache_time, client_cache_time))
     return resp
 
 
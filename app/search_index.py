@@ -0,0 +1,203 @@
+import atexit
+import heapq
+import json
+import logging
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import List, Optional
+
+from app.database import db
+from config import Config
+
+# Share of query trigrams a title has to contain to count as a confident hit
+MIN_SCORE = 0.8
+# Persist the index after this many new titles
+SAVE_EVERY = 50
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def _normalize(text: str) -> str:
+    return _NON_ALNUM.sub(' ', text.lower()).strip()
+
+
+def _trigrams(normalized: str) -> set:
+    # Padded only at the start, so a partially typed last word still matches in full
+    padded = f"  {normalized}"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleIndex:
+    """
+    In-memory trigram index over known titles, with prefix matching
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._items = {}  # slug -> catalog item
+        self._docs = {}  # doc id -> (slug, normalized title)
+        self._slug_docs = defaultdict(list)
+        self._postings = defaultdict(set)  # trigram -> doc ids
+        self._next_doc = 0
+        self._unsaved = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, item: dict, alt_titles: List[str] = ()):
+        """Add or update a catalog item ({'slug', 'title', 'poster', 'type'})"""
+        with self._lock:
+            self._add(item, alt_titles)
+        self._save_if_due()
+
+    def add_many(self, items: List[dict], save: bool = True):
+        """
+        Add or update catalog items under a single lock
+        :param save: False leaves persisting to the caller (bulk loads save once at the end)
+        """
+        with self._lock:
+            for item in items:
+                self._add(item)
+        if save:
+            self._save_if_due()
+
+    def _add(self, item: dict, alt_titles: List[str] = ()):
+        slug = item.get('slug')
+        if not slug or not item.get('title'):
+            return
+
+        existing = self._items.get(slug, {})
+        entry = {
+            'slug': slug,
+            'title': item['title'],
+            'poster': item.get('poster') or existing.get('poster'),
+            'type': item.get('type', 'series'),
+            # Homepage and search items have no alternative titles, keep the indexed ones
+            'alt_titles': list(alt_titles or item.get('alt_titles') or existing.get('alt_titles', []))
+        }
+        if self._items.get(slug) == entry:
+            return
+        self._remove(slug)
+        self._items[slug] = entry
+        for title in [entry['title']] + entry['alt_titles']:
+            normalized = _normalize(title)
+            if not normalized:
+                continue
+            doc_id = self._next_doc
+            self._next_doc += 1
+            self._docs[doc_id] = (slug, normalized)
+            self._slug_docs[slug].append(doc_id)
+            for gram in _trigrams(normalized):
+                self._postings[gram].add(doc_id)
+        self._unsaved += 1
+
+    def _save_if_due(self):
+        if self.path and self._unsaved >= SAVE_EVERY:
+            self.save()
+
+    def _remove(self, slug: str):
+        for doc_id in self._slug_docs.pop(slug, []):
+            _, normalized = self._docs.pop(doc_id)
+            for gram in _trigrams(normalized):
+                docs = self._postings.get(gram)
+                if docs is not None:
+                    docs.discard(doc_id)
+                    if not docs:
+                        del self._postings[gram]
+        self._items.pop(slug, None)
+
+    def search(self, query: str, limit: int = 20, min_score: float = MIN_SCORE) -> List[dict]:
+        """
+        Find titles containing (most of) the query, best matches first
+        :return: Catalog items, empty if there is no confident hit
+        """
+        normalized = _normalize(query)
+        grams = _trigrams(normalized) if normalized else set()
+        if not grams:
+            return []
+
+        # Additions change the postings in place, read them under the lock
+        with self._lock:
+            # Rarest trigrams first. A title in none of the first `scanned` postings can't reach
+            # min_score, so only those are counted, the others are just looked up per candidate.
+            postings = sorted((self._postings.get(gram, ()) for gram in grams), key=len)
+            needed = next((hits for hits in range(1, len(grams) + 1) if hits / len(grams) >= min_score), None)
+            if needed is None:
+                return []
+            scanned = len(postings) - needed + 1
+            counts = Counter()
+            for docs in postings[:scanned]:
+                counts.update(docs)
+            candidates = counts.keys()
+            for docs in postings[scanned:]:
+                counts.update(candidates & docs)
+
+            best = {}
+            for doc_id, hits in counts.items():
+                if hits < needed:
+                    continue
+                slug, title = self._docs[doc_id]
+                # Prefer titles starting with the query, then shorter (closer) titles
+                rank = (hits, title.startswith(normalized), -len(title))
+                if slug not in best or rank > best[slug]:
+                    best[slug] = rank
+
+            ranked = heapq.nlargest(limit, best, key=best.get)
+            return [
+                {key: self._items[slug][key] for key in ('title', 'slug', 'poster', 'type')}
+                for slug in ranked
+            ]
+
+    def load(self):
+        """Load persisted titles, if there are any"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                items = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Error loading search index from {self.path}: {e}")
+            return
+        self.add_many(items, save=False)
+        # Nothing new, the file already has these
+        self._unsaved = 0
+
+    def save(self):
+        """Persist titles to disk (postings are rebuilt on load)"""
+        if not self.path:
+            return
+        with self._lock:
+            items = list(self._items.values())
+            self._unsaved = 0
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(items, f, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.error(f"Error saving search index to {self.path}: {e}")
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_search_index() -> TitleIndex:
+    """Get the process-wide title index, loading it on first use"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = TitleIndex(Config.SEARCH_INDEX_PATH or None)
+                index.load()
+                # Titles indexed by crawler.py, saved once if they added anything
+                index.add_many(db.get_catalog_entries(), save=False)
+                if index.path:
+                    if index._unsaved:
+                        index.save()
+                    atexit.register(index.save)
+                _index = index
+    return _index
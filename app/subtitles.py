@@ -0,0 +1,14 @@
+import re
+
+# SRT cue timings use a comma before the milliseconds, WebVTT a dot
+_SRT_TIMING = re.compile(r'^(\d+:\d{2}:\d{2}),(\d{3})\s*-->\s*(\d+:\d{2}:\d{2}),(\d{3})', re.MULTILINE)
+
+
+def srt_to_vtt(srt: bytes) -> bytes:
+    """
+    Convert an SRT subtitle file to WebVTT.
+    Cue numbers are kept (they are valid cue identifiers), formatting tags are left as they are.
+    """
+    text = srt.decode('utf-8-sig', errors='replace').replace('\r\n', '\n').replace('\r', '\n')
+    text = _SRT_TIMING.sub(r'\1.\2 --> \3.\4', text.strip('\n'))
+    return f'WEBVTT\n\n{text}\n'.encode()
@@ -0,0 +1,139 @@
+import json
+import logging
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlencode
+
+import requests
+from app.cache_backend import make_cache
+from app.database import db
+from config import Config
+
+TMDB_API_URL = "https://api.themoviedb.org/3"
+TIMEOUT = 10
+MAX_RETRIES = 3
+
+# Response cache TTLs (seconds) per endpoint kind
+CACHE_TTLS = {
+    'find': 7 * 86400,
+    'search': 86400,
+    'external_ids': 30 * 86400,
+    'images': 7 * 86400,
+}
+DEFAULT_CACHE_TTL = 86400
+
+# Hot responses are also kept in memory, in front of the database cache
+# (which is already shared between workers)
+memory_cache = make_cache('tmdb', maxsize=1000, ttl=3600, shared=False)
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter - allows bursts of `capacity` requests and
+    `rate` requests per second on average
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be made"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class TMDBClient:
+    """
+    TMDB API client with a pooled keep-alive session, rate limiting,
+    retries on 429/5xx and a persistent response cache
+    """
+
+    def __init__(self, api_key: str, rate_limit: float = 20):
+        self.api_key = api_key
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=20)
+        self.session.mount('https://', adapter)
+        self.limiter = TokenBucket(rate_limit)
+
+    def get(self, path: str, params: dict = None, cache_kind: str = None) -> Optional[dict]:
+        """
+        GET a TMDB API path, answering from the response cache when possible
+        :param path: API path, e.g. /find/tt0000001
+        :param cache_kind: Endpoint kind used to pick the cache TTL ('find', 'search', ...)
+        :return: Decoded JSON response, None on errors
+        """
+        if not self.api_key:
+            return None
+
+        params = params or {}
+        key = f"{path}?{urlencode(sorted(params.items()))}"
+
+        data = memory_cache.get(key)
+        if data is not None:
+            return data
+
+        try:
+            payload = db.get_tmdb_response(key)
+        except Exception as e:
+            logging.error(f"Error reading TMDB cache: {e}")
+            payload = None
+        if payload is not None:
+            data = json.loads(payload)
+            memory_cache.set(key, data)
+            return data
+
+        data = self._request(path, params)
+        if data is None:
+            return None
+
+        memory_cache.set(key, data)
+        try:
+            db.set_tmdb_response(key, json.dumps(data), CACHE_TTLS.get(cache_kind, DEFAULT_CACHE_TTL))
+        except Exception as e:
+            logging.error(f"Error writing TMDB cache: {e}")
+        return data
+
+    def _request(self, path: str, params: dict) -> Optional[dict]:
+        url = f"{TMDB_API_URL}{path}"
+        params = dict(params, api_key=self.api_key)
+
+        for attempt in range(MAX_RETRIES):
+            self.limiter.acquire()
+            try:
+                resp = self.session.get(url, params=params, timeout=TIMEOUT)
+            except requests.RequestException as e:
+                logging.error(f"TMDB request to {path} failed: {e}")
+                delay = 0.5 * 2 ** attempt
+            else:
+                if resp.status_code != 429 and resp.status_code < 500:
+                    if not resp.ok:
+                        return None
+                    try:
+                        return resp.json()
+                    except ValueError:
+                        return None
+
+                retry_after = resp.headers.get('Retry-After', '')
+                delay = float(retry_after) if retry_after.isdigit() else 0.5 * 2 ** attempt
+                logging.warning(f"TMDB returned {resp.status_code} for {path}")
+
+            if attempt < MAX_RETRIES - 1:
+                time.sleep(delay)
+
+        return None
+
+
+tmdb_client = TMDBClient(Config.TMDB_API_KEY, Config.TMDB_RATE_LIMIT)
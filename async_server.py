@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+aiohttp server, an alternative to gunicorn + gevent:
+    python async_server.py
+This is not an async port of the addon. Only stream resolution runs natively
+on the event loop, sharing it (and the HTTP connection pool) with the player
+extractors. The scraper, TMDB and database clients are blocking and run on a
+thread pool, and all other routes (catalog, meta, HLS and subtitle proxies)
+are the Flask app served by aiohttp-wsgi on the same pool, so both modes
+answer the same URLs with the same headers.
+"""
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+from aiohttp_wsgi import WSGIHandler
+from werkzeug.http import parse_accept_header
+
+from app.aio import close_session, use_loop
+from app.cache_backend import save_snapshot
+from app.database import db
+from app.mapper import get_or_create_slug_mapping
+from app.response_store import MIN_COMPRESS_SIZE
+from app.routes import wawin_client
+from app.routes.manifest import MANIFEST
+from app.routes.stream import (PARTIAL_STREAMS_CACHE_TIME, _cache_streams, cached_streams, parse_content_id,
+                               resolve_streams_async)
+from app.routes.utils import dump_json, generate_etag, response_headers
+from run import app as flask_app
+
+# Threads for blocking calls (scraping, TMDB, database, Flask routes)
+BLOCKING_WORKERS = 32
+
+
+def json_response(request: web.Request, data: dict, cache_time: int = None, use_etag: bool = True) -> web.Response:
+    """
+    Same as respond_with: gzip when the client accepts it, with a distinct ETag per encoding
+    """
+    body = dump_json(data)
+    encoding = 'identity'
+    if len(body) >= MIN_COMPRESS_SIZE:
+        accepted = parse_accept_header(request.headers.get('Accept-Encoding'))
+        encoding = accepted.best_match(['gzip', 'identity'], default='identity')
+    headers = response_headers(cache_time)
+    headers['Vary'] = 'Accept-Encoding'
+    if use_etag:
+        etag = generate_etag(body)
+        headers['ETag'] = f'"{etag}"' if encoding == 'identity' else f'"{etag}:{encoding}"'
+        if any(tag.strip(' "').split(':')[0] == etag for tag in request.headers.get('If-None-Match', '').split(',')):
+            return web.Response(status=304, headers=headers)
+    resp = web.Response(body=body, content_type='application/json', headers=headers)
+    if encoding == 'gzip':
+        resp.enable_compression(web.ContentCoding.gzip)
+    return resp
+
+
+async def blocking(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+async def addon_manifest(request: web.Request) -> web.Response:
+    return json_response(request, MANIFEST, 7200)
+
+
+async def addon_stream(request: web.Request) -> web.Response:
+    """Native version of app.routes.stream.addon_stream"""
+    if request.match_info['content_type'] not in MANIFEST['types']:
+        raise web.HTTPNotFound()
+    lang = request.match_info.get('lang')
+
+    imdb_id, season, episode = parse_content_id(request.match_info['content_id'])
+    if not imdb_id:
+        return json_response(request, {'streams': []}, use_etag=False)
+
+    slug = await blocking(get_or_create_slug_mapping, imdb_id)
+    if not slug:
+        return json_response(request, {'streams': []}, use_etag=False)
+
+    cache_key = (slug, season, episode, lang)
+    cached = await blocking(cached_streams, cache_key)
+    if cached:
+        streams, remaining = cached
+        return json_response(request, {'streams': streams}, remaining, use_etag=False)
+
+    try:
+        data = await blocking(wawin_client.get_episode_streams, slug, season, episode)
+        streams, complete = await resolve_streams_async(data.get('streams', []), lang, cache_key)
+        if not complete:
+            return json_response(request, {'streams': streams}, PARTIAL_STREAMS_CACHE_TIME, use_etag=False)
+
+        ttl = await blocking(_cache_streams, cache_key, streams)
+        return json_response(request, {'streams': streams}, ttl, use_etag=False)
+    except Exception as e:
+        logging.error(f"Error getting streams: {e}")
+        return json_response(request, {'streams': []}, use_etag=False)
+
+
+async def on_startup(aio_app: web.Application):
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=BLOCKING_WORKERS))
+    # Extractors and their HTTP session run on the server's loop
+    use_loop(loop)
+
+
+async def on_cleanup(aio_app: web.Application):
+    await blocking(db.writes.flush)
+    await blocking(save_snapshot)
+    await close_session()
+
+
+def create_app() -> web.Application:
+    aio_app = web.Application()
+    aio_app.router.add_get('/manifest.json', addon_manifest)
+    aio_app.router.add_get('/{lang}/manifest.json', addon_manifest)
+    aio_app.router.add_get('/stream/{content_type}/{content_id}.json', addon_stream)
+    aio_app.router.add_get('/{lang}/stream/{content_type}/{content_id}.json', addon_stream)
+    # Everything else is served by the Flask app, on the loop's default executor
+    aio_app.router.add_route('*', '/{path_info:.*}', WSGIHandler(flask_app.wsgi_app).handle_request)
+    aio_app.on_startup.append(on_startup)
+    aio_app.on_cleanup.append(on_cleanup)
+    return aio_app
+
+
+if __name__ == '__main__':
+    web.run_app(create_app(), host='0.0.0.0', port=int(os.getenv('PORT', '5000')))
@@ -11,22 +11,49 @@ class Config:
     """
     FLASK_HOST = os.getenv('FLASK_RUN_HOST', "localhost")
     FLASK_PORT = os.getenv('FLASK_RUN_PORT', "5000")
-    CACHE_TYPE = 'SimpleCache'
-    CACHE_DEFAULT_TIMEOUT = 600
+
+    # Cache backend: 'memory' (per worker), or 'sqlite' / 'redis' to share caches between workers
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+    CACHE_SQLITE_PATH = os.getenv('CACHE_SQLITE_PATH', 'cache.db')
+    CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    # In-memory caches are dumped here when a worker exits and restored on startup (empty to disable)
+    CACHE_SNAPSHOT_PATH = os.getenv('CACHE_SNAPSHOT_PATH', 'cache_snapshot.pickle')
+    # Memory for pre-compressed meta and catalog responses, per worker
+    RESPONSE_STORE_MAX_BYTES = int(os.getenv('RESPONSE_STORE_MAX_BYTES', str(32 * 1024 * 1024)))
+    # Memory for proxied subtitle files per worker, and a directory for the ones that don't fit (empty to disable)
+    SUBTITLE_STORE_MAX_BYTES = int(os.getenv('SUBTITLE_STORE_MAX_BYTES', str(16 * 1024 * 1024)))
+    SUBTITLE_SPILL_DIR = os.getenv('SUBTITLE_SPILL_DIR', '')
 
     DEBUG = os.getenv('FLASK_DEBUG', 'False')
     
     # TMDB API Key
     TMDB_API_KEY = os.getenv('TMDB_API_KEY', '')
+    # Max TMDB requests per second per worker
+    TMDB_RATE_LIMIT = float(os.getenv('TMDB_RATE_LIMIT', '20'))
     
     # MediaFlow Proxy (for bypassing geo/IP blocks on scraping requests)
     SCRAPER_PROXY_URL = os.getenv('SCRAPER_PROXY_URL', '')
     SCRAPER_PROXY_PASSWORD = os.getenv('SCRAPER_PROXY_PASSWORD', '')
     
+    # HTML parser used for scraping: 'lxml' (fast, C-based) or 'html.parser' (built-in)
+    HTML_PARSER = os.getenv('HTML_PARSER', 'lxml')
+
+    # Variants above this bandwidth (bits/s) are dropped from proxied HLS playlists (0 keeps all)
+    HLS_MAX_BANDWIDTH = int(os.getenv('HLS_MAX_BANDWIDTH', '0'))
+
+    # Local title search index file (empty to keep it in memory only)
+    SEARCH_INDEX_PATH = os.getenv('SEARCH_INDEX_PATH', 'search_index.json')
+
     # Database configuration
     DB_TYPE = os.getenv('DB_TYPE', 'sqlite')  # 'sqlite' or 'postgresql'
     DB_PATH = os.getenv('DB_PATH', 'mappings.db')  # For SQLite
     DB_CONNECTION_STRING = os.getenv('DATABASE_URL', '')  # For PostgreSQL
+    DB_SSLMODE = os.getenv('DB_SSLMODE', 'require')  # For PostgreSQL, 'disable' for a local server
+    # Load the whole mappings table into a compact index (before forking, with gunicorn)
+    PRELOAD_MAPPINGS = os.getenv('PRELOAD_MAPPINGS', 'False') in ['1', 'True', 'true']
+    # Write mappings in batches from a background thread. Off by default on Vercel, where
+    # the process may be frozen right after the response and queued rows would be lost.
+    DB_WRITE_BEHIND = os.getenv('DB_WRITE_BEHIND', 'False' if os.getenv('VERCEL') else 'True') in ['1', 'True', 'true']
 
     # Env dependent configs
     if DEBUG in ['1', 'True', 'true']:
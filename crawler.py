@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Crawler script building the local catalog index of series and movies
+Run this periodically (e.g., via cron) - only new titles are fetched unless --full is given
+"""
+import time
+from app.api.watchanimeworld import WatchAnimeWorldAPI
+from app.database import db
+from config import Config
+
+# Delay between upstream requests, to stay polite with the site
+REQUEST_DELAY = 1.0
+
+def crawl_archive(client: WatchAnimeWorldAPI, content_type: str, full: bool = False, max_pages: int = None):
+    """
+    Walk the series or movies archive newest first and index unknown titles.
+    An incremental crawl stops at the first page without any new title, but
+    only if the previous crawl got to the end. After an interrupted crawl
+    (error, --max-pages, killed) the new titles on top are indexed, then the
+    crawl resumes at the last page the previous one finished and goes on to
+    the end of the archive.
+    """
+    entry_type = 'movie' if content_type == 'movies' else 'series'
+    known = db.get_catalog_slugs(entry_type)
+    state = db.get_crawl_state(content_type)
+    # Never crawled (with state tracking) or interrupted: walk to the end
+    to_the_end = full or state is None or not state[1]
+    resume_page = state[0] if state and not state[1] else 0
+    if resume_page:
+        print(f"  Previous {content_type} crawl stopped after page {resume_page}, resuming there")
+    # Marked complete again only once this crawl gets to the end
+    db.set_crawl_state(content_type, resume_page, False)
+    added = 0
+    page = 1
+    completed = False
+
+    while max_pages is None or page <= max_pages:
+        try:
+            items = client.get_archive_page(content_type, page)
+        except Exception as e:
+            print(f"✗ Error fetching {content_type} page {page}: {e}")
+            break
+
+        if not items:
+            completed = True
+            break
+
+        new_items = [item for item in items if full or item['slug'] not in known]
+        if not new_items:
+            if not to_the_end:
+                # Everything past here was indexed by the previous (completed) crawl
+                completed = True
+                break
+            if page < resume_page:
+                # Caught up with the new titles, skip to where the previous crawl stopped. New
+                # titles only push older ones to later pages, so nothing unindexed is skipped.
+                page = resume_page
+                continue
+
+        for item in new_items:
+            post_id = item.get('post_id')
+            season_count = None
+            if item['type'] == 'series':
+                try:
+                    post_id, season_count = client.get_season_info(item['slug'])
+                    time.sleep(REQUEST_DELAY)
+                except Exception as e:
+                    print(f"✗ Error fetching seasons of {item['slug']}: {e}")
+
+            db.set_catalog_entry(
+                item['slug'],
+                item['type'],
+                item['title'],
+                alt_titles=item.get('alt_titles'),
+                poster=item.get('poster'),
+                season_count=season_count,
+                post_id=post_id
+            )
+            known.add(item['slug'])
+            added += 1
+
+        print(f"  {content_type} page {page}: {len(new_items)} indexed")
+        db.set_crawl_state(content_type, max(page, resume_page), False)
+        page += 1
+        time.sleep(REQUEST_DELAY)
+
+    last_page = max(page - 1, resume_page)
+    db.set_crawl_state(content_type, last_page, completed)
+    if completed:
+        print(f"✓ Indexed {added} {content_type}")
+    else:
+        print(f"✓ Indexed {added} {content_type}, stopped after page {last_page} (the next run resumes there)")
+    return added
+
+if __name__ == '__main__':
+    import sys
+
+    print("Catalog Crawler")
+    print(f"Database type: {Config.DB_TYPE}\n")
+
+    args = sys.argv[1:]
+    if '--help' in args:
+        print("Usage:")
+        print("  python crawler.py                  # Index new series and movies")
+        print("  python crawler.py --full           # Re-index the whole archive")
+        print("  python crawler.py --series         # Only series")
+        print("  python crawler.py --movies         # Only movies")
+        print("  python crawler.py --max-pages 5    # Stop after 5 archive pages per type")
+        sys.exit(0)
+
+    full = '--full' in args
+    max_pages = int(args[args.index('--max-pages') + 1]) if '--max-pages' in args else None
+
+    content_types = ['series', 'movies']
+    if '--series' in args:
+        content_types = ['series']
+    elif '--movies' in args:
+        content_types = ['movies']
+
+    client = WatchAnimeWorldAPI()
+    for content_type in content_types:
+        crawl_archive(client, content_type, full=full, max_pages=max_pages)
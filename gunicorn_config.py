@@ -19,6 +19,8 @@ max_requests = 5000
 max_requests_jitter = 500
 timeout = 60
 keepalive = 2
+# Import the app in the master before forking, so the mapping index is shared copy-on-write
+preload_app = os.getenv('PRELOAD_MAPPINGS', 'False') in ['1', 'True', 'true']
 
 # Logging
 accesslog = '-'
@@ -40,3 +42,28 @@ tmp_upload_dir = None
 # SSL (if needed)
 # keyfile = None
 # certfile = None
+
+
+# Server hooks
+def when_ready(server):
+    """Keep the garbage collector from touching (and copying) preloaded objects in the workers"""
+    import gc
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """Drop database connections inherited from the master and restore the latest cache snapshot"""
+    if not server.cfg.preload_app:
+        return
+    from app.cache_backend import load_snapshot
+    from app.database import db
+    db.engine.dispose(close=False)
+    load_snapshot()
+
+
+def worker_exit(server, worker):
+    """Write out queued database writes and snapshot the caches before the worker goes away"""
+    from app.cache_backend import save_snapshot
+    from app.database import db
+    db.writes.flush()
+    save_snapshot()
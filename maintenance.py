@@ -40,18 +40,28 @@ def cleanup_all_failed_mappings():
     finally:
         session.close()
 
+def cleanup_expired_tmdb_responses():
+    """Remove expired TMDB responses (the cache is keyed per query and keeps growing otherwise)"""
+    deleted = db.delete_expired_tmdb_responses()
+    print(f"✓ Cleaned up {deleted} expired TMDB responses")
+    return deleted
+
 def show_stats():
     """Show database statistics"""
     session = db.Session()
     try:
-        from app.database import Mapping
+        from app.database import Mapping, CatalogEntry, TMDBResponse
         
         total_mappings = session.query(Mapping).count()
         total_failed = session.query(FailedMapping).count()
+        total_indexed = session.query(CatalogEntry).count()
+        total_tmdb = session.query(TMDBResponse).count()
         
         print("\n=== Database Statistics ===")
         print(f"Total successful mappings: {total_mappings}")
         print(f"Total failed mappings: {total_failed}")
+        print(f"Total indexed titles: {total_indexed}")
+        print(f"Total cached TMDB responses: {total_tmdb}")
         
         if total_failed > 0:
             oldest = session.query(FailedMapping).order_by(
@@ -79,6 +89,7 @@ if __name__ == '__main__':
     if len(sys.argv) > 1 and sys.argv[1] == '--clean':
         days = int(sys.argv[2]) if len(sys.argv) > 2 else 30
         cleanup_old_failed_mappings(days)
+        cleanup_expired_tmdb_responses()
         show_stats()
     elif len(sys.argv) > 1 and sys.argv[1] == '--clean-all':
         cleanup_all_failed_mappings()
@@ -86,6 +97,6 @@ if __name__ == '__main__':
     else:
         print("Usage:")
         print("  python maintenance.py              # Show statistics only")
-        print("  python maintenance.py --clean      # Clean mappings older than 30 days")
+        print("  python maintenance.py --clean      # Clean mappings older than 30 days and expired TMDB responses")
         print("  python maintenance.py --clean 60   # Clean mappings older than 60 days")
         print("  python maintenance.py --clean-all  # Clean ALL failed mappings (after domain change)")
@@ -7,7 +7,9 @@ from app.routes.manifest import manifest_blueprint
 from app.routes.meta import meta_bp
 from app.routes.stream import stream_bp
 from app.routes.proxy import proxy_bp
-from app.routes.utils import cache
+from app.routes.stats import stats_bp
+from app.cache_backend import load_snapshot
+from app.mapping_index import get_mapping_index
 from config import Config
 
 app = Flask(__name__, template_folder='./templates', static_folder='./static')
@@ -17,11 +19,18 @@ app.register_blueprint(catalog_bp)
 app.register_blueprint(meta_bp)
 app.register_blueprint(stream_bp)
 app.register_blueprint(proxy_bp)
+app.register_blueprint(stats_bp)
 
 Compress(app)
-cache.init_app(app)
 
-logging.basicConfig(format='%(asctime)s %(message)s')
+logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO)
+
+# Start warm after a worker restart
+load_snapshot()
+
+if Config.PRELOAD_MAPPINGS:
+    # With gunicorn's preload_app this runs once in the master, workers share the index
+    get_mapping_index()
 
 
 @app.route('/')
@@ -0,0 +1,97 @@
+"""
+Helpers of the benchmarks (tests marked `benchmark`, run with `pytest --benchmark -s`)
+"""
+import gc
+import os
+import resource
+import time
+from typing import Callable, Iterable, List
+
+
+def timed(fn: Callable, *args) -> float:
+    """Seconds one call takes"""
+    started = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - started
+
+
+def latencies(fn: Callable, calls: Iterable) -> List[float]:
+    """Seconds each call takes, for every tuple of arguments in `calls`"""
+    return [timed(fn, *args) for args in calls]
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def rss_mb() -> float:
+    """Current resident memory of this process in MB"""
+    with open(f'/proc/{os.getpid()}/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def private_mb() -> float:
+    """Memory of this process not shared with any other (e.g. pages copied since a fork) in MB"""
+    with open(f'/proc/{os.getpid()}/smaps_rollup') as f:
+        fields = dict(line.split(':', 1) for line in f if line.startswith('Private_'))
+    return sum(int(value.split()[0]) for value in fields.values()) / 1024
+
+
+def _in_fork(measure: Callable[[], float]) -> float:
+    """Result of `measure` run in a forked process"""
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.write(write, str(measure()).encode())
+        finally:
+            os._exit(0)
+    os.close(write)
+    os.waitpid(pid, 0)
+    with os.fdopen(read) as f:
+        return float(f.read() or 'nan')
+
+
+def forked_private_mb(fn: Callable) -> float:
+    """
+    Private memory a forked worker gains while running `fn`, the pages of
+    objects loaded before the fork that it ends up copying. The collector is
+    frozen first, as gunicorn_config.when_ready does.
+    """
+    def measure():
+        before = private_mb()
+        fn()
+        return private_mb() - before
+
+    gc.freeze()
+    try:
+        return _in_fork(measure)
+    finally:
+        gc.unfreeze()
+
+
+def forked_peak_mb(fn: Callable) -> float:
+    """
+    Peak resident memory growth of a forked process running `fn`, including
+    what C libraries allocate (tracemalloc only sees Python objects)
+    """
+    def measure():
+        before = rss_mb()
+        fn()
+        return peak_rss_mb() - before
+
+    return _in_fork(measure)
+
+
+def report(title: str, columns: List[str], rows: List[list]):
+    """Print a results table"""
+    cells = [columns] + [[f'{value:.3f}' if isinstance(value, float) else str(value) for value in row] for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(columns))]
+    print(f'\n{title}')
+    for row in cells:
+        print('  ' + '  '.join(cell.rjust(width) for cell, width in zip(row, widths)))
@@ -0,0 +1,47 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Keep the app's database, caches and index files out of the working tree.
+# Set before the app modules are imported, Config reads the environment once.
+_tmp = tempfile.mkdtemp(prefix='awi-tests-')
+os.environ.setdefault('DB_TYPE', 'sqlite')
+os.environ['DB_PATH'] = os.path.join(_tmp, 'mappings.db')
+os.environ['CACHE_BACKEND'] = 'memory'
+os.environ['CACHE_SNAPSHOT_PATH'] = ''
+os.environ['SEARCH_INDEX_PATH'] = ''
+os.environ['PRELOAD_MAPPINGS'] = 'False'
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def pytest_addoption(parser):
+    parser.addoption('--benchmark', action='store_true', help='run the benchmarks (print their results with -s)')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'benchmark: slow measurement, only run with --benchmark')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--benchmark'):
+        return
+    skip = pytest.mark.skip(reason='benchmark, run with --benchmark')
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    """A Database on an empty SQLite file"""
+    from app import database
+    from config import Config
+
+    monkeypatch.setattr(Config, 'DB_TYPE', 'sqlite')
+    monkeypatch.setattr(Config, 'DB_PATH', str(tmp_path / 'mappings.db'))
+    db = database.Database()
+    yield db
+    db.engine.dispose()
@@ -0,0 +1,48 @@
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import async_server
+
+
+def _get(path: str, headers: dict):
+    async def main():
+        async with TestClient(TestServer(async_server.create_app())) as client:
+            resp = await client.get(path, headers=headers, auto_decompress=False)
+            return resp.status, resp.headers, await resp.read()
+
+    return asyncio.run(main())
+
+
+def test_manifest_encodings_have_distinct_etags():
+    status, identity_headers, body = _get('/manifest.json', {'Accept-Encoding': 'identity'})
+    assert status == 200
+    assert body.startswith(b'{')
+    assert 'Content-Encoding' not in identity_headers
+
+    status, gzip_headers, body = _get('/manifest.json', {'Accept-Encoding': 'gzip'})
+    assert status == 200
+    assert gzip_headers['Content-Encoding'] == 'gzip'
+    assert body[:2] == b'\x1f\x8b'
+
+    for headers in (identity_headers, gzip_headers):
+        assert headers['Vary'] == 'Accept-Encoding'
+    assert gzip_headers['ETag'] == identity_headers['ETag'][:-1] + ':gzip"'
+
+
+def test_manifest_revalidates_with_either_etag():
+    _, headers, _ = _get('/manifest.json', {'Accept-Encoding': 'gzip'})
+    status, _, body = _get('/manifest.json', {'Accept-Encoding': 'identity', 'If-None-Match': headers['ETag']})
+    assert status == 304
+    assert body == b''
+
+
+def test_flask_routes_are_served_through_wsgi():
+    status, headers, body = _get('/stats.json?verbose=1', {'Accept-Encoding': 'identity'})
+    assert status == 200
+    assert headers['Content-Type'] == 'application/json'
+    assert int(headers['Content-Length']) == len(body)
+    assert b'"pid"' in body
+
+    status, _, _ = _get('/catalog/unknown/unknown.json', {})
+    assert status == 404
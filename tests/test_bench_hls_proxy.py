@@ -0,0 +1,153 @@
+"""
+Load test of the HLS playlist proxy against a local stub of the player host.
+Simulated viewers fetch the master playlist once, then poll a live or a
+finished media playlist with If-None-Match, as players do. The proxy is
+compared with itself without playlist caches and connection reuse, where
+every miss opens a new connection (concurrent misses still share a fetch).
+"""
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+from flask import Flask
+
+from app.routes import proxy
+from bench import percentile, report
+
+pytestmark = pytest.mark.benchmark
+
+VIEWERS = 32
+DURATION = 3
+TARGET_DURATION = 4
+
+MASTER = '\n'.join(
+    ['#EXTM3U', '#EXT-X-VERSION:4'] +
+    [f'#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="audio",NAME="{lang}",LANGUAGE="{lang}",DEFAULT={default},'
+     f'URI="/hls/episode/audio_{lang}.m3u8"'
+     for lang, default in (('ja', 'YES'), ('en', 'NO'), ('hi', 'NO'))] +
+    [line for height, bandwidth in ((360, 800_000), (480, 1_400_000), (720, 2_800_000), (1080, 5_000_000))
+     for line in (f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={height * 16 // 9}x{height},AUDIO="audio"',
+                  f'/hls/episode/{height}p.m3u8')]
+)
+# A 24 minute episode in 2 second segments
+VOD = '\n'.join(
+    ['#EXTM3U', '#EXT-X-VERSION:4', '#EXT-X-TARGETDURATION:2', '#EXT-X-PLAYLIST-TYPE:VOD'] +
+    [line for i in range(720) for line in ('#EXTINF:2.000,', f'/hls/episode/720p/segment{i}.ts')] +
+    ['#EXT-X-ENDLIST']
+)
+
+
+def _live() -> str:
+    sequence = int(time.time() / TARGET_DURATION)
+    return '\n'.join(
+        ['#EXTM3U', '#EXT-X-VERSION:4', f'#EXT-X-TARGETDURATION:{TARGET_DURATION}',
+         f'#EXT-X-MEDIA-SEQUENCE:{sequence}'] +
+        [line for i in range(sequence, sequence + 6)
+         for line in (f'#EXTINF:{TARGET_DURATION}.000,', f'/hls/live/720p/segment{i}.ts')]
+    )
+
+
+class _Upstream(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    fetches = Counter()
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        _Upstream.fetches[path] += 1
+        if path.endswith('master.m3u8'):
+            body = MASTER
+        elif '/live/' in path:
+            body = _live()
+        else:
+            body = VOD
+        body = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.apple.mpegurl')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'max-age=2')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _NoCache:
+    def get(self, key, default=None):
+        return default
+
+    def set(self, key, value, ttl=None):
+        pass
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Upstream)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(proxy, 'UPSTREAM_URL', f'http://127.0.0.1:{server.server_port}')
+    # Share the pool settings of the https mount
+    monkeypatch.setattr(proxy, 'session', requests.Session())
+    proxy.session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=32))
+    proxy.playlist_cache.clear()
+    proxy.rewritten_playlist_cache.clear()
+    _Upstream.fetches.clear()
+    yield _Upstream.fetches
+    server.shutdown()
+    server.server_close()
+
+
+def _viewer(app, playlist: str, deadline: float, results: list):
+    client = app.test_client()
+    assert client.get('/hi/cdn/hls/episode/master.m3u8').status_code == 200
+    etag = None
+    while time.perf_counter() < deadline:
+        headers = {'If-None-Match': etag} if etag else {}
+        started = time.perf_counter()
+        resp = client.get(f'/hi/cdn/hls/{playlist}', headers=headers)
+        results.append((time.perf_counter() - started, resp.status_code))
+        etag = resp.headers.get('ETag') or etag
+
+
+def _load(upstream) -> list:
+    app = Flask(__name__)
+    app.register_blueprint(proxy.proxy_bp)
+    results = []
+    deadline = time.perf_counter() + DURATION
+    viewers = [
+        threading.Thread(target=_viewer, args=(app, 'live/720p.m3u8' if i % 2 else 'episode/720p.m3u8', deadline, results))
+        for i in range(VIEWERS)
+    ]
+    for viewer in viewers:
+        viewer.start()
+    for viewer in viewers:
+        viewer.join()
+    fetches = sum(upstream.values())
+    latencies = [latency for latency, _ in results]
+    statuses = Counter(status for _, status in results)
+    return [len(results), f'{len(results) / DURATION:.0f}', percentile(latencies, 50) * 1000,
+            percentile(latencies, 99) * 1000, statuses[304], sum(statuses.values()) - statuses[200] - statuses[304],
+            fetches]
+
+
+def test_playlist_proxy_load(upstream, monkeypatch):
+    rows = [['proxy'] + _load(upstream)]
+
+    upstream.clear()
+    monkeypatch.setattr(proxy, 'playlist_cache', _NoCache())
+    monkeypatch.setattr(proxy, 'rewritten_playlist_cache', _NoCache())
+    monkeypatch.setattr(proxy, 'session', requests)
+    rows.append(['no caches or pooling'] + _load(upstream))
+
+    report(f'{VIEWERS} viewers polling for {DURATION}s', ['', 'requests', 'rps', 'p50 ms', 'p99 ms', '304s',
+                                                           'errors', 'upstream'], rows)
+    pooled, uncached = rows
+    assert pooled[6] == uncached[6] == 0
+    # One fetch per playlist and TTL, plus the master playlist
+    assert pooled[7] <= 2 + DURATION * 2
+    assert pooled[5] > 0
+    assert pooled[1] > uncached[1]
@@ -0,0 +1,97 @@
+"""
+Parse time and peak memory of the scrapers per page type and HTML parser,
+over the saved fixtures. The fixtures are trimmed, so each page is also
+measured padded to a typical full size with markup the scrapers don't read
+(menus, widgets, scripts).
+
+Peak memory is given twice: the Python objects (tracemalloc, the soup itself)
+and the growth of the resident set of a forked process, which includes the
+parser's C allocations but is blurred by memory the allocator reuses.
+"""
+import tracemalloc
+
+import pytest
+
+from app.api import watchanimeworld
+from app.api.watchanimeworld import WatchAnimeWorldAPI
+from bench import forked_peak_mb, latencies, percentile, report
+from test_html_parsers import PARSERS, _Response, _fixture
+
+pytestmark = pytest.mark.benchmark
+
+ROUNDS = 50
+FULL_PAGE_BYTES = 200_000
+
+_BOILERPLATE = (
+    '<div class="widget"><h3 class="widget-title">Genres</h3><ul class="menu">'
+    + ''.join(f'<li class="menu-item"><a href="https://watchanimeworld.net/category/genre-{i}/">Genre {i}</a></li>'
+              for i in range(20))
+    + '</ul></div><script type="text/javascript">var config = {"ajaxurl": "/wp-admin/admin-ajax.php"};</script>\n'
+)
+
+# page type -> (fixture per URL substring, scraper method, arguments)
+PAGES = {
+    'homepage': ({'watchanimeworld.net': 'homepage'}, '_fetch_homepage', ()),
+    'series': ({'admin-ajax.php': 'season_ajax', '/series/': 'series'}, '_get_anime_details', ('title-name-1',)),
+    'search': ({'watchanimeworld.net/': 'search'}, '_search_anime', (f'{watchanimeworld.BASE_URL}/', {'s': 'title'})),
+    'archive': ({'/series/': 'archive'}, 'get_archive_page', ('series', 2)),
+    'episode': ({'/episode/': 'episode'}, '_get_episode_streams',
+                (f'{watchanimeworld.BASE_URL}/episode/title-name-1-1x1/', 'title-name-1', 1, 1)),
+}
+
+
+def _padded(html: str) -> str:
+    padding = _BOILERPLATE * max(0, (FULL_PAGE_BYTES - len(html)) // len(_BOILERPLATE))
+    return html.replace('</body>', f'{padding}</body>') if '</body>' in html else html + padding
+
+
+def _scraper(monkeypatch, parser: str, page: str, full_size: bool):
+    pages, method, args = PAGES[page]
+    bodies = {part: _padded(_fixture(name)) if full_size else _fixture(name) for part, name in pages.items()}
+
+    def get(url, **kwargs):
+        for part, body in bodies.items():
+            if part in url:
+                return _Response(body)
+        raise AssertionError(f'Unexpected request to {url}')
+
+    monkeypatch.setattr(watchanimeworld, 'HTML_PARSER', parser)
+    api = WatchAnimeWorldAPI()
+    monkeypatch.setattr(api, '_get', get)
+
+    def scrape():
+        watchanimeworld.season_cache.clear()
+        return getattr(api, method)(*args)
+
+    return scrape, sum(len(body) for body in bodies.values())
+
+
+def _python_peak_mb(fn) -> float:
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.parametrize('full_size', [False, True], ids=['fixture', 'full size'])
+def test_parse_time_and_memory(monkeypatch, full_size):
+    rows = []
+    for page in PAGES:
+        results = {}
+        for parser in PARSERS:
+            scrape, size = _scraper(monkeypatch, parser, page, full_size)
+            result = scrape()
+            # Homepage snapshots carry their fetch time, only the sections are compared
+            results[parser] = dict(result.sections) if page == 'homepage' else result
+            values = latencies(scrape, [()] * ROUNDS)
+            rows.append([page, f'{size // 1024} KB', parser, percentile(values, 50) * 1000,
+                         percentile(values, 99) * 1000, _python_peak_mb(scrape), forked_peak_mb(scrape)])
+        # Same data whatever the parser
+        assert results['lxml'] == results['html.parser']
+
+    report(f'Scrapers over {"full size" if full_size else "fixture"} pages (ms, MB)',
+           ['page', 'size', 'parser', 'p50', 'p99', 'python peak', 'rss peak'], rows)
+    by_parser = {parser: [row for row in rows if row[2] == parser] for parser in PARSERS}
+    assert sum(row[3] for row in by_parser['lxml']) < sum(row[3] for row in by_parser['html.parser'])
@@ -0,0 +1,108 @@
+"""
+Memory per worker and lookup latency of the preloaded mapping index against
+the current design (1000-entry caches in front of one query per miss) and
+plain dicts, over a 100k-row mappings table. Worker memory is what a forked
+process copies while serving the lookups, the loaded size is shared.
+"""
+import random
+import tracemalloc
+
+import pytest
+
+from app.cache_backend import MemoryCache
+from app.mapping_index import MappingIndex
+from bench import forked_private_mb, latencies, percentile, report
+
+pytestmark = pytest.mark.benchmark
+
+ROWS = 100_000
+LOOKUPS = 20_000
+
+
+def _allocated_mb(build):
+    tracemalloc.start()
+    try:
+        result = build()
+        return result, tracemalloc.get_traced_memory()[0] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+class _CachedQueries:
+    """What each worker does today, see app.mapper"""
+
+    def __init__(self, db):
+        self.db = db
+        self.slug_to_imdb = MemoryCache('bench_slug_to_imdb', maxsize=1000, ttl=3600)
+        self.imdb_to_slug = MemoryCache('bench_imdb_to_slug', maxsize=1000, ttl=3600)
+
+    def get_imdb(self, slug):
+        imdb_id = self.slug_to_imdb.get(slug)
+        if imdb_id is None:
+            mapping = self.db.get_mapping(slug)
+            if mapping:
+                imdb_id = mapping[1]
+                self.slug_to_imdb.set(slug, imdb_id)
+        return imdb_id
+
+    def get_slug(self, imdb_id):
+        slug = self.imdb_to_slug.get(imdb_id)
+        if slug is None:
+            slug = self.db.get_slug_by_imdb(imdb_id)
+            if slug:
+                self.imdb_to_slug.set(imdb_id, slug)
+        return slug
+
+
+class _Dicts:
+    """Naive preload: two dicts, whose objects a worker copies as it touches them"""
+
+    def __init__(self, rows):
+        self.by_slug = dict(rows)
+        self.by_imdb = {imdb_id: slug for slug, imdb_id in self.by_slug.items()}
+
+    def get_imdb(self, slug):
+        return self.by_slug.get(slug)
+
+    def get_slug(self, imdb_id):
+        return self.by_imdb.get(imdb_id)
+
+
+def test_mapping_index(fresh_db):
+    fresh_db.set_mappings((f'title-name-{i}', str(i), f'tt{1_000_000 + i * 7}') for i in range(ROWS))
+    rng = random.Random(0)
+    # A tenth of the lookups are for titles that aren't mapped
+    numbers = [rng.randrange(ROWS * 10 // 9) for _ in range(LOOKUPS)]
+    slugs = [f'title-name-{i}' for i in numbers]
+    imdb_ids = [f'tt{1_000_000 + i * 7}' for i in numbers]
+
+    designs = {
+        'cache + query': (_CachedQueries(fresh_db), 0.0),
+        'dicts': _allocated_mb(lambda: _Dicts(fresh_db.get_all_mappings())),
+        'mapping index': _allocated_mb(lambda: MappingIndex(fresh_db.get_all_mappings())),
+    }
+    results = []
+    for name, (design, loaded) in designs.items():
+        def serve():
+            if isinstance(design, _CachedQueries):
+                # As gunicorn_config.post_fork
+                fresh_db.engine.dispose(close=False)
+            for slug, imdb_id in zip(slugs, imdb_ids):
+                design.get_imdb(slug)
+                design.get_slug(imdb_id)
+
+        worker = forked_private_mb(serve)
+        to_imdb = latencies(design.get_imdb, [(slug,) for slug in slugs])
+        to_slug = latencies(design.get_slug, [(imdb_id,) for imdb_id in imdb_ids])
+        results.append([name, loaded, worker,
+                        percentile(to_imdb, 50) * 1e6, percentile(to_imdb, 99) * 1e6,
+                        percentile(to_slug, 50) * 1e6, percentile(to_slug, 99) * 1e6])
+        assert design.get_imdb('title-name-5') == 'tt1000035'
+        assert design.get_slug('tt1000035') == 'title-name-5'
+
+    report(f'{ROWS} mappings, {LOOKUPS} lookups each way (MB, µs)',
+           ['design', 'loaded', 'worker', 'to imdb p50', 'p99', 'to slug p50', 'p99'], results)
+    cached, dicts, index = results
+    assert index[1] < dicts[1] / 2
+    assert index[2] < dicts[2]
+    assert index[3] < cached[3] and index[5] < cached[5]
@@ -0,0 +1,108 @@
+"""
+Queries per second and latency of the local title index at 10k+ titles, with
+typed-as-you-go queries (growing prefixes of known titles, some misspelled,
+plus misses). The upstream fallback is represented by parsing one search
+results page, which it costs on top of the network round trip.
+"""
+import random
+import time
+
+import pytest
+
+from app.api import watchanimeworld
+from app.api.watchanimeworld import WatchAnimeWorldAPI
+from app.search_index import TitleIndex, _normalize
+from bench import latencies, percentile, report
+from test_html_parsers import _Response, _fixture
+
+pytestmark = pytest.mark.benchmark
+
+SIZES = [10_000, 50_000]
+QUERIES = 2_000
+
+_SYLLABLES = ['ka', 'ki', 'ku', 'ko', 'sa', 'shi', 'su', 'ta', 'chi', 'to', 'na', 'no', 'ha', 'hi', 'mi', 'mo', 'ra',
+              'ri', 'ro', 'ya', 'yu', 'ga', 'ji', 'zu', 'da', 'be', 'po', 'ren', 'kan', 'sen', 'tan', 'gin']
+
+
+def _titles(count: int) -> list:
+    """Distinct titles of 2-5 words over a vocabulary of a few thousand words, common words more likely"""
+    rng = random.Random(count)
+    vocabulary = sorted({''.join(rng.choices(_SYLLABLES, k=rng.randint(2, 4))) for _ in range(8_000)})
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    rng.shuffle(vocabulary)
+    titles = set()
+    while len(titles) < count:
+        title = ' '.join(rng.choices(vocabulary, weights, k=rng.randint(2, 5))).title()
+        if rng.random() < 0.3:
+            title += f' Season {rng.randint(2, 6)}'
+        titles.add(title)
+    return sorted(titles)
+
+
+def _queries(titles: list) -> list:
+    """
+    Prefixes of random titles as they are typed (from 3 letters on), a tenth of
+    them with a typo and a tenth unknown words
+    """
+    rng = random.Random(1)
+    queries = []
+    while len(queries) < QUERIES:
+        kind = rng.random()
+        if kind < 0.1:
+            queries.append(rng.choice(['zzyzx', 'qwerty uiop', 'xylophone', 'nonexistent title']))
+            continue
+        title = rng.choice(titles)
+        query = title[:rng.randint(3, len(title))]
+        if kind < 0.2 and len(query) >= 12:
+            i = rng.randrange(1, len(query))
+            query = query[:i] + 'x' + query[i + 1:]
+        queries.append(query)
+    return queries
+
+
+def _scan(titles: list, query: str) -> list:
+    """Naive baseline: substring test over every title (finds no misspelled titles)"""
+    normalized = _normalize(query)
+    return [title for title in titles if normalized in title][:20]
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_search_index(size):
+    titles = _titles(size)
+    index = TitleIndex()
+    items = [{'slug': f'title-{i}', 'title': title, 'type': 'series'} for i, title in enumerate(titles)]
+    started = time.perf_counter()
+    index.add_many(items)
+    build = time.perf_counter() - started
+
+    queries = _queries(titles)
+    normalized = [_normalize(title) for title in titles]
+    methods = {
+        'index': index.search,
+        'linear scan': lambda query: _scan(normalized, query),
+    }
+    rows = []
+    for name, search in methods.items():
+        values = latencies(search, [(query,) for query in queries])
+        found = sum(bool(search(query)) for query in queries)
+        rows.append([name, found, f'{len(values) / sum(values):.0f}', percentile(values, 50) * 1000,
+                     percentile(values, 99) * 1000])
+
+    report(f'{size} titles (index built in {build:.2f}s), {len(queries)} queries',
+           ['search', 'found', 'qps', 'p50 ms', 'p99 ms'], rows)
+    index_found, scan_found = rows[0][1], rows[1][1]
+    # Typed prefixes and misspellings, only the unknown words are missing
+    assert index_found > scan_found
+    assert index_found >= len(queries) * 0.85
+    assert rows[0][4] < 50
+
+
+def test_upstream_page_parse(monkeypatch):
+    """What a miss costs on top of the network: one search page, parsed"""
+    html = _fixture('search')
+    api = WatchAnimeWorldAPI()
+    monkeypatch.setattr(api, '_get', lambda url, **kwargs: _Response(html))
+    assert api._search_anime(f'{watchanimeworld.BASE_URL}/', {'s': 'title'})
+    values = latencies(lambda: api._search_anime(f'{watchanimeworld.BASE_URL}/', {'s': 'title'}), [()] * 200)
+    report('Upstream search page parse (network not included)', ['parser', 'p50 ms', 'p99 ms'],
+           [[watchanimeworld.HTML_PARSER, percentile(values, 50) * 1000, percentile(values, 99) * 1000]])
@@ -0,0 +1,85 @@
+"""
+Cost of turning catalog and meta payloads into a response: the former
+pipeline (sorted json.dumps + md5 for the ETag, jsonify, gzip on every
+request) against dump_json/respond_with and a response store hit.
+"""
+import gzip
+import hashlib
+import json
+
+import pytest
+from flask import Flask, jsonify
+
+from app.response_store import ResponseStore
+from app.routes.utils import dump_json, generate_etag, respond_with, respond_with_stored
+from bench import latencies, percentile, report
+
+pytestmark = pytest.mark.benchmark
+
+ROUNDS = 200
+# Flask-Compress default
+GZIP_LEVEL = 6
+
+
+def _meta(episodes: int) -> dict:
+    """A long series, as /meta returns it"""
+    return {'meta': {
+        'id': 'tt0388629', 'type': 'series', 'name': 'Title & Name – The Series',
+        'poster': 'https://image.tmdb.org/t/p/w500/poster.jpg',
+        'background': 'https://image.tmdb.org/t/p/original/background.jpg',
+        'description': 'A long description of the series. ' * 20,
+        'genres': ['Action', 'Adventure', 'Fantasy'], 'releaseInfo': '1999-', 'runtime': '24 min',
+        'videos': [{
+            'id': f'tt0388629:{1 + e // 100}:{1 + e % 100}',
+            'title': f'Episode {e + 1} – “The title of the episode”',
+            'season': 1 + e // 100, 'episode': 1 + e % 100,
+            'released': f'20{10 + e // 100}-01-{1 + e % 28:02d}T00:00:00.000Z',
+            'thumbnail': f'https://image.tmdb.org/t/p/w300/still{e}.jpg',
+            'overview': 'What happens in this episode, in a couple of sentences. ' * 3,
+        } for e in range(episodes)],
+    }}
+
+
+def _catalog(items: int) -> dict:
+    return {'metas': [{
+        'id': f'tt{1_000_000 + i}', 'type': 'series', 'name': f'Title & Name {i}',
+        'poster': f'https://image.tmdb.org/t/p/w500/poster{i}.jpg',
+    } for i in range(items)]}
+
+
+def _before(data):
+    """Serialize for the ETag, serialize again for the body, compress per request"""
+    hashlib.md5(json.dumps(data, sort_keys=True).encode()).hexdigest()
+    return gzip.compress(jsonify(data).get_data(), GZIP_LEVEL)
+
+
+def _json_fallback(data):
+    """dump_json without orjson"""
+    return json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+@pytest.mark.parametrize('name, data', [
+    ('catalog, 100 items', _catalog(100)),
+    ('meta, 100 episodes', _meta(100)),
+    ('meta, 1000 episodes', _meta(1000)),
+])
+def test_serializers(name, data):
+    assert json.loads(dump_json(data)) == json.loads(_json_fallback(data)) == data
+    body = dump_json(data)
+    stored = ResponseStore(max_bytes=2 ** 26).put('bench', body, generate_etag(body), 3600, 3600)
+    with Flask(__name__).test_request_context(headers={'Accept-Encoding': 'gzip'}):
+        pipelines = {
+            'json + md5 + jsonify + gzip': lambda: _before(data),
+            'json.dumps (no orjson)': lambda: _json_fallback(data),
+            'dump_json': lambda: dump_json(data),
+            'respond_with + gzip': lambda: gzip.compress(respond_with(data).get_data(), GZIP_LEVEL),
+            'respond_with_stored': lambda: respond_with_stored(stored),
+        }
+        results = {pipeline: latencies(fn, [()] * ROUNDS) for pipeline, fn in pipelines.items()}
+
+    report(f'{name}, {len(body) // 1024} KB (ms)', ['pipeline', 'p50', 'p99'],
+           [[pipeline, percentile(values, 50) * 1000, percentile(values, 99) * 1000]
+            for pipeline, values in results.items()])
+    p50 = {pipeline: percentile(values, 50) for pipeline, values in results.items()}
+    assert p50['respond_with + gzip'] < p50['json + md5 + jsonify + gzip']
+    assert p50['respond_with_stored'] < p50['respond_with + gzip']
@@ -0,0 +1,199 @@
+import fnmatch
+import os
+import threading
+import time
+
+import pytest
+
+from app import cache_backend
+
+
+def test_unpicklable_values_dont_break_the_snapshot(tmp_path, monkeypatch):
+    cache = cache_backend.MemoryCache('snapshot_test', maxsize=10, ttl=60)
+    monkeypatch.setattr(cache_backend, 'caches', {'snapshot_test': cache})
+    cache.set('lock', threading.Lock())
+    path = tmp_path / 'snapshot.pickle'
+
+    cache_backend.save_snapshot(str(path))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_snapshot_round_trip(tmp_path, monkeypatch):
+    cache = cache_backend.MemoryCache('snapshot_test', maxsize=10, ttl=60)
+    monkeypatch.setattr(cache_backend, 'caches', {'snapshot_test': cache})
+    cache.set('key', {'value': 1})
+    cache.set('expired', 'gone', ttl=-1)
+    path = str(tmp_path / 'snapshot.pickle')
+    cache_backend.save_snapshot(path)
+
+    cache.clear()
+    assert cache_backend.load_snapshot(path) == 1
+    assert cache.get('key') == {'value': 1}
+
+
+class FakeRedis:
+    """Local stand-in of a Redis server: the client calls RedisCache makes, with millisecond expiry"""
+
+    def __init__(self):
+        self.data = {}  # key -> (value, expires_at)
+        self.down = False
+
+    def _check(self):
+        if self.down:
+            raise ConnectionError('Connection refused')
+
+    def get(self, key):
+        self._check()
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.time():
+            del self.data[key]
+            return None
+        return value
+
+    def set(self, key, value, px=None):
+        self._check()
+        self.data[key] = (value, time.time() + px / 1000 if px else None)
+
+    def delete(self, *keys):
+        self._check()
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, match='*'):
+        self._check()
+        return [key for key in list(self.data) if fnmatch.fnmatchcase(key, match)]
+
+
+@pytest.fixture
+def memory_caches():
+    return lambda name, maxsize=100, ttl=60: cache_backend.MemoryCache(name, maxsize, ttl)
+
+
+@pytest.fixture
+def sqlite_caches(tmp_path, monkeypatch):
+    # The connection is per process, point it at a fresh file
+    monkeypatch.setattr(cache_backend.SQLiteCache, '_connection', None)
+    yield lambda name, maxsize=100, ttl=60: cache_backend.SQLiteCache(name, maxsize, ttl, str(tmp_path / 'cache.db'))
+    if cache_backend.SQLiteCache._connection is not None:
+        cache_backend.SQLiteCache._connection.close()
+
+
+@pytest.fixture
+def redis_caches(monkeypatch):
+    monkeypatch.setitem(cache_backend.RedisCache._clients, 'redis://stand-in', FakeRedis())
+    return lambda name, maxsize=100, ttl=60: cache_backend.RedisCache(name, maxsize, ttl, 'redis://stand-in')
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'redis'])
+def make(request):
+    """Factory of named caches on each backend"""
+    return request.getfixturevalue(f'{request.param}_caches')
+
+
+def test_values_round_trip(make):
+    cache = make('round_trip')
+    value = {'title': 'Title & Name', 'episodes': [(1, 1), (1, 2)], 'poster': None}
+    cache.set('key', value)
+    cache.set(('slug', 1, 2), [1, 2, 3])
+    assert cache.get('key') == value
+    assert cache[('slug', 1, 2)] == [1, 2, 3]
+    assert cache.get('missing', 'default') == 'default'
+    assert 'key' in cache and 'missing' not in cache
+    with pytest.raises(KeyError):
+        cache['missing']
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['errors']) == (2, 2, 0)
+    assert stats['hit_ratio'] == 0.5
+
+
+def test_entries_expire(make):
+    cache = make('expiry', ttl=0.01)
+    cache.set('default_ttl', 1)
+    cache.set('own_ttl', 2, ttl=60)
+    time.sleep(0.05)
+    assert cache.get('default_ttl') is None
+    assert cache.get('own_ttl') == 2
+
+
+def test_delete_and_clear_stay_within_the_name(make):
+    cache, other = make('first'), make('second')
+    for c in (cache, other):
+        c.set('a', 1)
+        c.set('b', 2)
+    del cache['a']
+    assert cache.get('a') is None and other.get('a') == 1
+    cache.clear()
+    assert cache.get('b') is None and other.get('b') == 2
+
+
+def test_backend_errors_are_misses(make, monkeypatch):
+    cache = make('errors')
+    cache.set('key', 'value')
+
+    def broken(*args):
+        raise OSError('backend is gone')
+
+    monkeypatch.setattr(cache, '_get', broken)
+    monkeypatch.setattr(cache, '_set', broken)
+    cache.set('other', 'value')
+    assert cache.get('key', 'default') == 'default'
+    assert 'key' not in cache
+    assert cache.stats()['misses'] == 1
+    assert cache.stats()['errors'] == 3
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = cache_backend.MemoryCache('lru', maxsize=3, ttl=60)
+    for key in 'abc':
+        cache.set(key, key)
+    cache.get('a')
+    cache.set('d', 'd')
+    assert [cache.get(key) for key in 'abcd'] == ['a', None, 'c', 'd']
+
+
+def test_sqlite_cache_evicts_entries_closest_to_expiry(sqlite_caches):
+    cache = sqlite_caches('eviction', maxsize=10)
+    cache.set('expired', 0, ttl=-1)
+    for i in range(cache.EVICT_EVERY - 1):
+        cache.set(i, i, ttl=60 + i)
+    assert cache.get('expired') is None
+    # The latest entries (expiring last) are kept
+    assert [cache.get(i) for i in range(cache.EVICT_EVERY - 11, cache.EVICT_EVERY - 1)] == \
+        list(range(cache.EVICT_EVERY - 11, cache.EVICT_EVERY - 1))
+    assert cache.get(0) is None
+    count = cache._db().execute("SELECT COUNT(*) FROM cache WHERE name = 'eviction'").fetchone()[0]
+    assert count == 10
+
+
+def test_sqlite_cache_is_shared_across_processes(sqlite_caches):
+    cache = sqlite_caches('shared')
+    assert cache.get('from_child') is None
+    pid = os.fork()
+    if pid == 0:
+        # A worker with its own connection
+        try:
+            sqlite_caches('shared').set('from_child', {'pid': os.getpid()})
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    assert cache.get('from_child') == {'pid': pid}
+
+
+def test_redis_cache_sets_server_side_expiry(redis_caches):
+    cache = redis_caches('expiry', ttl=60)
+    cache.set('key', 'value')
+    cache.set('short', 'value', ttl=0)
+    (key, (_, expires_at)), = [(k, v) for k, v in cache.client.data.items() if k.endswith("'key'")]
+    assert key == "awi:expiry:'key'"
+    assert 59 < expires_at - time.time() <= 60
+    # Redis rejects a zero TTL, the shortest one is a millisecond
+    assert cache.client.data["awi:expiry:'short'"][1] > 0
+
+
+def test_unreachable_redis_counts_errors(redis_caches):
+    cache = redis_caches('unreachable')
+    cache.client.down = True
+    cache.set('key', 'value')
+    assert cache.get('key') is None
+    cache.clear()
+    assert cache.stats()['errors'] == 3
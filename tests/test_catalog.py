@@ -0,0 +1,48 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask, g
+
+from app import mapper
+from app.database import db
+from app.mapper import slug_to_imdb_cache
+from app.routes import catalog
+
+
+def test_cached_items_dont_wait_for_cold_mappings(monkeypatch):
+    release = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(catalog, '_mapping_executor', executor)
+    monkeypatch.setattr(catalog, 'CATALOG_DEADLINE', 0.2)
+    # Cold TMDB lookups that occupy the whole pool
+    monkeypatch.setattr(catalog, 'get_or_create_imdb_mapping', lambda *args, **kwargs: release.wait(5) and None)
+
+    cached = [{'slug': f'cached-{i}', 'title': f'Cached {i}', 'type': 'series', 'poster': None} for i in range(20)]
+    cold = [{'slug': f'cold-{i}', 'title': f'Cold {i}', 'type': 'series', 'poster': None} for i in range(8)]
+    for i, item in enumerate(cached):
+        slug_to_imdb_cache.set(item['slug'], f'tt{1000 + i}')
+
+    try:
+        with Flask(__name__).app_context():
+            metas = catalog.wawin_to_metas(cold + cached)
+            assert g.get('partial_catalog')
+    finally:
+        release.set()
+        executor.shutdown()
+
+    assert [meta['id'] for meta in metas] == [f'tt{1000 + i}' for i in range(20)]
+    assert metas[0] == {'id': 'tt1000', 'name': 'Cached 0', 'type': 'series', 'poster': None}
+
+
+def test_unmapped_items_skip_the_per_slug_lookup(monkeypatch):
+    db.set_mappings([('known-title', '1', 'tt0000001')])
+    lookups = []
+    monkeypatch.setattr(db, 'get_mapping', lambda slug: lookups.append(slug))
+    monkeypatch.setattr(mapper, 'search_tmdb', lambda *args: None)
+
+    items = [{'slug': slug, 'title': slug, 'type': 'series', 'poster': None} for slug in ('known-title', 'new-title')]
+    with Flask(__name__).app_context():
+        metas = catalog.wawin_to_metas(items)
+
+    assert [meta['id'] for meta in metas] == ['tt0000001']
+    assert lookups == []
@@ -0,0 +1,18 @@
+from app import database
+
+
+def test_expired_tmdb_responses_are_purged(fresh_db, monkeypatch):
+    monkeypatch.setattr(database, 'TMDB_PURGE_EVERY', 3)
+    fresh_db.set_tmdb_response('/search/tv?query=a', '{}', ttl=-10)
+    fresh_db.set_tmdb_response('/search/tv?query=b', '{}', ttl=-10)
+    assert fresh_db.get_tmdb_response('/search/tv?query=a') is None
+
+    # The third write purges the expired rows
+    fresh_db.set_tmdb_response('/search/tv?query=c', '{"results": []}', ttl=3600)
+    session = fresh_db.Session()
+    try:
+        assert [key for (key,) in session.query(database.TMDBResponse.key)] == ['/search/tv?query=c']
+    finally:
+        session.close()
+    assert fresh_db.get_tmdb_response('/search/tv?query=c') == '{"results": []}'
+    assert fresh_db.delete_expired_tmdb_responses() == 0
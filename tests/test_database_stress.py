@@ -0,0 +1,88 @@
+"""
+Concurrent writers and readers on one SQLite file, the way gunicorn workers
+(processes) with gevent/threads use it. Writers must wait for each other
+instead of failing with "database is locked", and no write may be lost.
+"""
+import multiprocessing
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from app import database
+from config import Config
+
+PROCESSES = 4
+THREADS = 4
+BATCHES = 15
+BATCH_SIZE = 20
+
+
+def _slug(process: int, thread: int, batch: int, row: int) -> str:
+    return f'slug-{process}-{thread}-{batch}-{row}'
+
+
+def _imdb_id(process: int, thread: int, batch: int, row: int) -> str:
+    return f'tt{process}{thread:02d}{batch:03d}{row:03d}'
+
+
+def _hammer(process: int) -> tuple:
+    """Write and read from THREADS threads of a fresh process, return (operations, errors)"""
+    db = database.Database()
+    errors = []
+    operations = [0] * THREADS
+
+    def run(thread: int):
+        for batch in range(BATCHES):
+            rows = [(_slug(process, thread, batch, row), str(row), _imdb_id(process, thread, batch, row))
+                    for row in range(BATCH_SIZE)]
+            try:
+                db.set_mappings(rows)
+                db.add_failed_mappings({f'{imdb_id}f': datetime.utcnow() for _, _, imdb_id in rows})
+                # Queued writes go through the background flusher
+                db.queue_mapping(f'queued-{process}-{thread}-{batch}', str(batch), f'tq{process}{thread}{batch}')
+                assert db.get_mapping(rows[0][0]) == (rows[0][1], rows[0][2])
+                assert len(db.get_mappings(slug for slug, _, _ in rows)) == BATCH_SIZE
+                assert db.is_failed_mapping(f'{rows[-1][2]}f')
+            except Exception as e:
+                errors.append(f'{type(e).__name__}: {e}')
+            operations[thread] += 2 * BATCH_SIZE + 4
+
+    threads = [threading.Thread(target=run, args=(thread,)) for thread in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    db.writes.flush()
+    db.engine.dispose()
+    return sum(operations), errors
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='needs fork')
+def test_concurrent_processes_and_threads(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'DB_TYPE', 'sqlite')
+    monkeypatch.setattr(Config, 'DB_PATH', str(tmp_path / 'stress.db'))
+    db = database.Database()
+
+    started = time.perf_counter()
+    with multiprocessing.get_context('fork').Pool(PROCESSES) as pool:
+        results = pool.map(_hammer, range(PROCESSES))
+    elapsed = time.perf_counter() - started
+
+    errors = [error for _, process_errors in results for error in process_errors]
+    assert errors == []
+
+    mappings = dict(db.get_all_mappings())
+    failed = {imdb_id for imdb_id, _ in db.get_failed_mappings()}
+    for process in range(PROCESSES):
+        for thread in range(THREADS):
+            for batch in range(BATCHES):
+                assert f'queued-{process}-{thread}-{batch}' in mappings
+                for row in range(BATCH_SIZE):
+                    assert mappings[_slug(process, thread, batch, row)] == _imdb_id(process, thread, batch, row)
+                    assert f'{_imdb_id(process, thread, batch, row)}f' in failed
+
+    operations = sum(count for count, _ in results)
+    print(f'\n{operations} operations from {PROCESSES} processes x {THREADS} threads '
+          f'in {elapsed:.2f}s ({operations / elapsed:.0f}/s)')
@@ -0,0 +1,123 @@
+"""
+The configurable HTML parsers must scrape identical data from the same pages.
+Fixtures are trimmed copies of the site's page layouts.
+"""
+import os
+
+import pytest
+
+from app.api import watchanimeworld
+from app.api.watchanimeworld import WatchAnimeWorldAPI, make_soup
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+PARSERS = ['lxml', 'html.parser']
+
+
+def _fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES, f'{name}.html'), encoding='utf-8') as f:
+        return f.read()
+
+
+class _Response:
+    status_code = 200
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def raise_for_status(self):
+        pass
+
+
+@pytest.fixture
+def scrape(monkeypatch):
+    """Run a scraper method with the given parser against fixture pages (by URL substring)"""
+    for cache in (watchanimeworld.search_cache, watchanimeworld.details_cache,
+                  watchanimeworld.streams_cache, watchanimeworld.season_cache):
+        cache.clear()
+
+    def run(parser: str, pages: dict, method: str, *args):
+        def get(url, **kwargs):
+            for part, name in pages.items():
+                if part in url:
+                    return _Response(_fixture(name))
+            raise AssertionError(f'Unexpected request to {url}')
+
+        monkeypatch.setattr(watchanimeworld, 'HTML_PARSER', parser)
+        api = WatchAnimeWorldAPI()
+        monkeypatch.setattr(api, '_get', get)
+        return getattr(api, method)(*args)
+
+    return run
+
+
+def _both(run) -> list:
+    results = [run(parser) for parser in PARSERS]
+    assert results[0] == results[1]
+    return results[0]
+
+
+def test_homepage_sections(scrape):
+    sections = _both(lambda parser: scrape(parser, {'watchanimeworld.net': 'homepage'}, '_fetch_homepage').sections)
+    assert len(sections['newest_drops']) == 6
+    assert len(sections['new_anime_arrivals']) == 5
+    assert [item['type'] for item in sections['latest_anime_movies']] == ['movie'] * 4
+    assert len(sections['most_watched_shows']) == 5
+    # The item without a link is skipped
+    assert len(sections['most_watched_films']) == 3
+    assert sections['newest_drops'][0] == {
+        'title': 'Title & Name 1: Part – series',
+        'slug': 'title-name-1',
+        'poster': 'https://image.tmdb.org/t/p/w500/poster1.jpg',
+        'type': 'series'
+    }
+
+
+def test_series_details_with_other_seasons(scrape):
+    pages = {'admin-ajax.php': 'season_ajax', '/series/': 'series'}
+    details, complete = _both(lambda parser: scrape(parser, pages, '_get_anime_details', 'title-name-1'))
+    assert complete
+    assert details['title'] == 'Title & Name 1'
+    assert details['genres'] == ['Action', 'Adventure', 'Fantasy']
+    assert (details['year'], details['runtime']) == ('2023', '24 min')
+    assert [(ep['season'], ep['episode']) for ep in details['episodes']] == \
+        [(1, e) for e in range(1, 13)] + [(2, e) for e in range(1, 11)]
+    assert details['episodes'][0]['thumbnail'] == 'https://image.tmdb.org/t/p/w300/still11.jpg'
+
+
+def test_season_info(scrape):
+    info = _both(lambda parser: scrape(parser, {'/series/': 'series'}, 'get_season_info', 'title-name-1'))
+    assert info == ('4321', 2)
+
+
+def test_search_results(scrape):
+    results = _both(lambda parser: scrape(parser, {'?': 'search', 'watchanimeworld.net/': 'search'},
+                                          '_search_anime', f'{watchanimeworld.BASE_URL}/', {'s': 'title'}))
+    assert [item['slug'] for item in results] == [f'title-name-{i}' for i in range(30, 39)]
+    assert results[-1]['type'] == 'movie'
+
+
+def test_archive_page(scrape):
+    results = _both(lambda parser: scrape(parser, {'/series/': 'archive'}, 'get_archive_page', 'series', 2))
+    assert results[0]['post_id'] == '1030'
+    assert results[0]['alt_titles'] == ['Title & Name 30']
+    assert 'not-a-result' in [item['slug'] for item in results]
+
+
+def test_episode_streams(scrape):
+    result = _both(lambda parser: scrape(parser, {'/episode/': 'episode'}, '_get_episode_streams',
+                                         f'{watchanimeworld.BASE_URL}/episode/title-name-1-1x1/',
+                                         'title-name-1', 1, 1))
+    assert result == {'streams': [
+        {'player': 'zephyrflick', 'url': 'https://play.zephyrflick.top/video/0a1b2c3d4e5f'},
+        {'player': 'zephyrflick', 'url': 'https://watchanimeworld.net/video/zephyrflick/98765'},
+    ]}
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+def test_strainers_keep_the_scraped_parts(parser, monkeypatch):
+    """Partial parsing (SoupStrainer) must not lose anything the full tree has"""
+    monkeypatch.setattr(watchanimeworld, 'HTML_PARSER', parser)
+    html = _fixture('homepage')
+    api = WatchAnimeWorldAPI()
+    assert api._parse_homepage(make_soup(html, watchanimeworld._HOMEPAGE_STRAINER)) == \
+        api._parse_homepage(make_soup(html))
@@ -0,0 +1,45 @@
+import threading
+
+from app import id_filter
+from app.id_filter import IdSet
+
+
+def test_concurrent_additions_survive_merges(monkeypatch):
+    monkeypatch.setattr(id_filter, 'MERGE_THRESHOLD', 16)
+    ids = IdSet((number, 0) for number in range(0, 1000, 2))
+    errors = []
+    stop = threading.Event()
+
+    def writer(start: int):
+        for number in range(start, 9_000, 8):
+            ids.add(number, number)
+
+    def reader():
+        # Ids present from the start must never disappear while arrays are swapped
+        while not stop.is_set():
+            for number in range(0, 1000, 50):
+                if ids.expiry(number) is None:
+                    errors.append(number)
+
+    readers = [threading.Thread(target=reader) for _ in range(2)]
+    writers = [threading.Thread(target=writer, args=(start,)) for start in range(1001, 1009)]
+    for thread in readers + writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    stop.set()
+    for thread in readers:
+        thread.join()
+
+    assert errors == []
+    assert all(ids.expiry(number) == number for number in range(1001, 9_000))
+    assert len(ids) == 500 + 9_000 - 1001
+
+
+def test_remove_marks_sorted_ids_expired():
+    ids = IdSet([(7, 0)])
+    ids.add(9)
+    ids.remove(7)
+    ids.remove(9)
+    assert ids.expiry(7) == 1
+    assert ids.expiry(9) is None
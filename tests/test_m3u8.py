@@ -0,0 +1,236 @@
+"""
+Property tests of the playlist rewriter over randomly generated playlists
+(fixed seeds, so failures reproduce).
+"""
+import random
+import re
+
+import pytest
+
+from app.m3u8 import rewrite_playlist
+
+BASE_URL = 'https://play.zephyrflick.top'
+LANGUAGES = ['hin', 'tam', 'tel', 'eng', 'jpn']
+SEEDS = range(200)
+
+
+def _audio_line(rng: random.Random, index: int) -> str:
+    attributes = ['TYPE=AUDIO', 'GROUP-ID="audio"', f'NAME="Track {index}"']
+    if rng.random() < 0.85:
+        attributes.append(f'LANGUAGE="{rng.choice(LANGUAGES)}"')
+    if rng.random() < 0.9:
+        attributes.append(f'DEFAULT={rng.choice(["YES", "NO"])}')
+    attributes.append('AUTOSELECT=YES')
+    if rng.random() < 0.8:
+        attributes.append(f'URI="/hls/{index}/audio.m3u8?t={rng.randint(0, 999)}"')
+    return '#EXT-X-MEDIA:' + ','.join(attributes)
+
+
+def master_playlist(rng: random.Random, version: bool = True) -> str:
+    lines = ['#EXTM3U']
+    if version:
+        lines.append(f'#EXT-X-VERSION:{rng.randint(3, 7)}')
+    if rng.random() < 0.5:
+        lines.append('#EXT-X-INDEPENDENT-SEGMENTS')
+    lines += [_audio_line(rng, i) for i in range(rng.randint(0, 5))]
+    if rng.random() < 0.3:
+        lines.append('#EXT-X-MEDIA:TYPE=SUBTITLES,GROUP-ID="subs",NAME="English",URI="/hls/subs.m3u8"')
+    for i in range(rng.randint(1, 5)):
+        bandwidth = rng.randint(200, 8000) * 1000
+        lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION=1280x720,AUDIO="audio"')
+        lines.append(f'/hls/{i}/index.m3u8' if rng.random() < 0.9 else f'https://cdn.example.com/{i}.m3u8')
+    if rng.random() < 0.5:
+        lines.append('#EXT-X-I-FRAME-STREAM-INF:BANDWIDTH=90000,URI="/hls/iframes.m3u8"')
+    return '\n'.join(lines) + '\n'
+
+
+def media_playlist(rng: random.Random) -> str:
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3', f'#EXT-X-TARGETDURATION:{rng.randint(2, 10)}']
+    if rng.random() < 0.5:
+        lines.append('#EXT-X-KEY:METHOD=AES-128,URI="/hls/key.bin",IV=0x1')
+    for i in range(rng.randint(1, 30)):
+        lines.append(f'#EXTINF:{rng.uniform(1, 10):.3f},')
+        lines.append(f'/hls/seg-{i}.ts')
+    lines.append('#EXT-X-ENDLIST')
+    return '\n'.join(lines)
+
+
+def _absolute(line: str) -> str:
+    """The expected rewrite of a single line"""
+    if line.startswith('/hls/'):
+        return BASE_URL + line
+    return line.replace('URI="/hls/', f'URI="{BASE_URL}/hls/')
+
+
+def _is_audio(line: str) -> bool:
+    return line.startswith('#EXT-X-MEDIA:TYPE=AUDIO')
+
+
+def _without_default(line: str) -> str:
+    return re.sub(r'DEFAULT=(?:YES|NO)', 'DEFAULT=', line)
+
+
+def _bandwidth(line: str) -> int:
+    return int(re.search(r'BANDWIDTH=(\d+)', line).group(1))
+
+
+def _reorder_audio_tracks(m3u8_content: str, preferred_lang: str) -> str:
+    """The rewriter this module replaced, kept as a reference implementation"""
+    audio_tracks = []
+    other_lines = []
+    preferred_track = None
+    for line in m3u8_content.split('\n'):
+        if line.startswith('#EXT-X-MEDIA:TYPE=AUDIO'):
+            lang_match = re.search(r'LANGUAGE="([^"]+)"', line)
+            if lang_match:
+                if lang_match.group(1) == preferred_lang:
+                    preferred_track = re.sub(r'DEFAULT=(YES|NO)', 'DEFAULT=YES', line)
+                else:
+                    audio_tracks.append(re.sub(r'DEFAULT=(YES|NO)', 'DEFAULT=NO', line))
+            else:
+                audio_tracks.append(line)
+        else:
+            other_lines.append(line)
+
+    result = []
+    audio_inserted = False
+    for line in other_lines:
+        result.append(line)
+        if line.startswith('#EXT-X-VERSION') and not audio_inserted:
+            if preferred_track:
+                result.append(preferred_track)
+            result.extend(audio_tracks)
+            audio_inserted = True
+    content = '\n'.join(result)
+    content = re.sub(r'URI="(/hls/[^"]+)"', rf'URI="{BASE_URL}\1"', content)
+    return re.sub(r'^(/hls/.+)$', rf'{BASE_URL}\1', content, flags=re.MULTILINE)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_uris_are_made_absolute(seed):
+    rng = random.Random(seed)
+    for content in (master_playlist(rng), media_playlist(rng)):
+        output = rewrite_playlist(content, BASE_URL, rng.choice(LANGUAGES + [None]))
+        assert not re.search(r'^/hls/', output, re.MULTILINE)
+        assert 'URI="/hls/' not in output
+        assert output.count(BASE_URL + '/hls/') == content.count('/hls/')
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_media_playlists_only_change_uris(seed):
+    content = media_playlist(random.Random(seed))
+    assert rewrite_playlist(content, BASE_URL, 'hin') == '\n'.join(map(_absolute, content.split('\n')))
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_preferred_language_goes_first(seed):
+    rng = random.Random(seed)
+    content = master_playlist(rng, version=rng.random() < 0.8)
+    lang = rng.choice(LANGUAGES)
+    lines = [_absolute(line) for line in content.split('\n')]
+    output = rewrite_playlist(content, BASE_URL, lang).split('\n')
+
+    # Everything but the audio renditions keeps its order
+    assert [line for line in output if not _is_audio(line)] == [line for line in lines if not _is_audio(line)]
+
+    audio_in = [line for line in lines if _is_audio(line)]
+    audio_out = [line for line in output if _is_audio(line)]
+    # Audio renditions are kept together, only their DEFAULT changes
+    assert sorted(map(_without_default, audio_out)) == sorted(map(_without_default, audio_in))
+    if audio_out:
+        start = output.index(audio_out[0])
+        assert output[start:start + len(audio_out)] == audio_out
+
+    preferred = [line for line in audio_in if f'LANGUAGE="{lang}"' in line]
+    if not preferred:
+        # Language not available, the playlist's own defaults stay
+        assert audio_out == audio_in
+        return
+    assert all(f'LANGUAGE="{lang}"' in line for line in audio_out[:len(preferred)])
+    for line in audio_out[:len(preferred)]:
+        assert 'DEFAULT=NO' not in line
+    for line in audio_out[len(preferred):]:
+        if 'LANGUAGE="' in line:
+            assert 'DEFAULT=YES' not in line
+        else:
+            # Renditions without a language are left alone
+            assert line in audio_in
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_max_bandwidth_drops_variants(seed):
+    rng = random.Random(seed)
+    content = master_playlist(rng)
+    max_bandwidth = rng.randint(100, 8000) * 1000
+    lines = [_absolute(line) for line in content.split('\n')]
+    output = rewrite_playlist(content, BASE_URL, max_bandwidth=max_bandwidth).split('\n')
+
+    def variants(playlist):
+        return [(line, playlist[i + 1]) for i, line in enumerate(playlist) if line.startswith('#EXT-X-STREAM-INF:')]
+
+    kept = variants(output)
+    allowed = [variant for variant in variants(lines) if _bandwidth(variant[0]) <= max_bandwidth]
+    if allowed:
+        assert kept == allowed
+    else:
+        # Nothing fits, the cheapest variant (with its URI) is kept instead of none
+        assert kept == [min(variants(lines), key=lambda variant: _bandwidth(variant[0]))]
+
+    kept_lines = {line for variant in kept for line in variant}
+    dropped_lines = {line for variant in variants(lines) for line in variant} - kept_lines
+    assert [line for line in output if line not in kept_lines] == \
+        [line for line in lines if line not in kept_lines and line not in dropped_lines]
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_matches_previous_rewriter(seed):
+    """
+    Same output as the previous implementation where it was correct: a version line
+    to insert after and at most one rendition in the preferred language
+    """
+    rng = random.Random(seed)
+    content = master_playlist(rng)
+    present = re.findall(r'LANGUAGE="([^"]+)"', content)
+    lang = rng.choice(present or LANGUAGES)
+    if present:
+        content = content.replace(f'LANGUAGE="{lang}"', 'LANGUAGE="und"')
+        content = content.replace('LANGUAGE="und"', f'LANGUAGE="{lang}"', 1)
+    assert rewrite_playlist(content, BASE_URL, lang) == _reorder_audio_tracks(content, lang)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_language_and_bandwidth_combined(seed):
+    rng = random.Random(seed)
+    content = master_playlist(rng)
+    lang = rng.choice(LANGUAGES)
+    # Often below every variant, so the fallback variant lands where the audio block goes
+    max_bandwidth = rng.choice([100_000, rng.randint(100, 8000) * 1000])
+    output = rewrite_playlist(content, BASE_URL, lang, max_bandwidth).split('\n')
+    by_bandwidth = rewrite_playlist(content, BASE_URL, max_bandwidth=max_bandwidth).split('\n')
+    by_language = rewrite_playlist(content, BASE_URL, lang).split('\n')
+
+    assert [line for line in output if not _is_audio(line)] == [line for line in by_bandwidth if not _is_audio(line)]
+    audio = [line for line in output if _is_audio(line)]
+    assert audio == [line for line in by_language if _is_audio(line)]
+    # Right after #EXT-X-VERSION, before any variant
+    version_at = next(i for i, line in enumerate(output) if line.startswith('#EXT-X-VERSION'))
+    assert output[version_at + 1:version_at + 1 + len(audio)] == audio
+
+
+def test_fallback_variant_goes_after_audio():
+    content = '\n'.join([
+        '#EXTM3U',
+        '#EXT-X-VERSION:3',
+        '#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="audio",LANGUAGE="eng",DEFAULT=YES',
+        '#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="audio",LANGUAGE="hin",DEFAULT=NO',
+        '#EXT-X-STREAM-INF:BANDWIDTH=5000000,AUDIO="audio"',
+        '/hls/high.m3u8',
+    ])
+    assert rewrite_playlist(content, BASE_URL, 'hin', max_bandwidth=1000).split('\n') == [
+        '#EXTM3U',
+        '#EXT-X-VERSION:3',
+        '#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="audio",LANGUAGE="hin",DEFAULT=YES',
+        '#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="audio",LANGUAGE="eng",DEFAULT=NO',
+        '#EXT-X-STREAM-INF:BANDWIDTH=5000000,AUDIO="audio"',
+        f'{BASE_URL}/hls/high.m3u8',
+    ]
@@ -0,0 +1,31 @@
+import asyncio
+import threading
+
+from app.routes import stream
+
+
+def test_late_sources_are_cached_off_the_loop(monkeypatch):
+    cached = {}
+
+    async def resolve_source(source, preferred_lang=None):
+        await asyncio.sleep(source['delay'])
+        return {'title': source['title'], 'url': 'https://example.com/master.m3u8'}
+
+    def cache_streams(cache_key, streams):
+        cached[cache_key] = ([s['title'] for s in streams], threading.current_thread())
+
+    monkeypatch.setattr(stream, 'resolve_source', resolve_source)
+    monkeypatch.setattr(stream, '_cache_streams', cache_streams)
+    monkeypatch.setattr(stream, 'STREAMS_DEADLINE', 0.05)
+
+    async def main():
+        sources = [{'title': 'fast', 'delay': 0}, {'title': 'slow', 'delay': 0.1}]
+        result = await stream.resolve_streams_async(sources, None, 'key')
+        await asyncio.sleep(0.2)
+        return result, threading.current_thread()
+
+    (streams, complete), loop_thread = asyncio.run(main())
+    assert ([s['title'] for s in streams], complete) == (['fast'], False)
+    titles, thread = cached['key']
+    assert titles == ['fast', 'slow']
+    assert thread is not loop_thread
@@ -0,0 +1,138 @@
+import gzip
+
+import pytest
+from flask import Flask
+
+from app.response_store import ResponseStore
+from app.routes import proxy
+from app.subtitles import srt_to_vtt
+
+SRT = (
+    '\ufeff1\r\n'
+    '00:00:01,000 --> 00:00:04,250\r\n'
+    'Hello, world: 00:00:05,000 stays as it is\r\n'
+    '\r\n'
+    '2\r\n'
+    '00:01:02,500 --> 01:00:03,000\r\n'
+    + '<i>Second</i> cue, and some more text so the file is worth compressing. ' * 10 + '\r\n'
+).encode()
+
+
+def test_srt_to_vtt():
+    vtt = srt_to_vtt(SRT).decode()
+    assert vtt.startswith('WEBVTT\n\n1\n00:00:01.000 --> 00:00:04.250\nHello, world: 00:00:05,000 stays as it is\n\n2\n')
+    assert '00:01:02.500 --> 01:00:03.000\n<i>Second</i> cue' in vtt
+    assert '\r' not in vtt and '\ufeff' not in vtt
+    assert vtt.endswith('compressing. \n')
+
+
+def test_srt_to_vtt_of_a_broken_file():
+    assert srt_to_vtt(b'\n\nnot a subtitle \xff\n') == 'WEBVTT\n\nnot a subtitle \ufffd\n'.encode()
+
+
+class _Upstream:
+    """Stand-in of the pooled session, serving one file"""
+
+    headers = {}
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.fetches = 0
+
+    def get(self, url, **kwargs):
+        self.fetches += 1
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    upstream = _Upstream(SRT)
+    monkeypatch.setattr(proxy, 'session', upstream)
+    monkeypatch.setattr(proxy, 'subtitle_store', ResponseStore(2 ** 20))
+    proxy.subtitle_mappings.set('abc.srt', 'https://example.com/subtitles/abc.srt')
+    app = Flask(__name__)
+    app.register_blueprint(proxy.proxy_bp)
+    client = app.test_client()
+    client.upstream = upstream
+    yield client
+    proxy.subtitle_mappings.clear()
+
+
+def test_srt_is_converted_once(client):
+    srt = client.get('/subtitles/abc.srt')
+    vtt = client.get('/subtitles/abc.vtt')
+    assert (srt.status_code, srt.mimetype, srt.data) == (200, 'application/x-subrip', SRT)
+    assert (vtt.status_code, vtt.mimetype, vtt.data) == (200, 'text/vtt', srt_to_vtt(SRT))
+    assert client.get('/subtitles/abc.vtt').data == vtt.data
+    assert client.upstream.fetches == 1
+    assert srt.headers['Cache-Control'].startswith('public')
+    assert srt.headers['Access-Control-Allow-Origin'] == '*'
+
+
+def test_unknown_subtitles(client):
+    assert client.get('/subtitles/unknown.srt').status_code == 404
+    assert client.get('/subtitles/unknown.vtt').status_code == 404
+    assert client.upstream.fetches == 0
+
+
+def test_not_modified(client):
+    etag = client.get('/subtitles/abc.vtt').headers['ETag']
+    assert not etag.startswith('W/')
+    resp = client.get('/subtitles/abc.vtt', headers={'If-None-Match': etag})
+    assert (resp.status_code, resp.data) == (304, b'')
+    assert resp.headers['ETag'] == etag
+    # Other subtitles of the same track have their own validator
+    assert client.get('/subtitles/abc.srt', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_compressed_variant(client):
+    resp = client.get('/subtitles/abc.vtt', headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(resp.data) == srt_to_vtt(SRT)
+    assert resp.headers['ETag'].endswith(':gzip"')
+    assert 'Accept-Encoding' in resp.headers['Vary']
+    resp = client.get('/subtitles/abc.vtt', headers={'Accept-Encoding': 'gzip', 'If-None-Match': resp.headers['ETag']})
+    assert resp.status_code == 304
+
+
+def test_range(client):
+    body = srt_to_vtt(SRT)
+    resp = client.get('/subtitles/abc.vtt', headers={'Range': 'bytes=0-5', 'Accept-Encoding': 'gzip'})
+    assert (resp.status_code, resp.data) == (206, b'WEBVTT')
+    assert resp.headers['Content-Range'] == f'bytes 0-5/{len(body)}'
+    assert 'Content-Encoding' not in resp.headers
+
+    resp = client.get('/subtitles/abc.vtt', headers={'Range': 'bytes=-10'})
+    assert (resp.status_code, resp.data) == (206, body[-10:])
+    assert client.get('/subtitles/abc.vtt').headers['Accept-Ranges'] == 'bytes'
+
+    resp = client.get('/subtitles/abc.vtt', headers={'Range': f'bytes={len(body)}-'})
+    assert resp.status_code == 416
+
+
+def test_oversized_subtitles_are_refused(client, monkeypatch):
+    monkeypatch.setattr(proxy, 'MAX_SUBTITLE_BYTES', 100)
+    assert client.get('/subtitles/abc.srt').status_code == 502
+    assert proxy.subtitle_store.get('abc.srt') is None
+
+
+def test_evicted_subtitles_are_read_back_from_disk(tmp_path):
+    store = ResponseStore(len(SRT) * 2, str(tmp_path))
+    first = store.put('first.srt', SRT, 'etag1', 60, 60, 'application/x-subrip')
+    store.put('second.srt', SRT, 'etag2', 60, 60, 'application/x-subrip')
+    assert store.spills == 1
+    assert store.get('first.srt') == first
+    assert store.disk_hits == 1
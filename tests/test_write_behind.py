@@ -0,0 +1,67 @@
+import threading
+
+from config import Config
+
+
+def test_batch_being_written_stays_readable(fresh_db, monkeypatch):
+    writing = threading.Event()
+    release = threading.Event()
+    set_mappings = fresh_db.set_mappings
+
+    def slow_set_mappings(rows):
+        rows = list(rows)
+        writing.set()
+        release.wait(5)
+        set_mappings(rows)
+
+    monkeypatch.setattr(fresh_db, 'set_mappings', slow_set_mappings)
+    monkeypatch.setattr(Config, 'DB_WRITE_BEHIND', True)
+    fresh_db.queue_mapping('title-name', '123', 'tt0000123')
+    fresh_db.queue_failed_mapping('tt0000999')
+
+    flusher = threading.Thread(target=fresh_db.writes.flush)
+    flusher.start()
+    try:
+        assert writing.wait(5)
+        # Neither queued nor committed yet
+        assert len(fresh_db.writes) == 0
+        assert fresh_db.get_mapping('title-name') == ('123', 'tt0000123')
+        assert fresh_db.get_slug_by_imdb('tt0000123') == 'title-name'
+        assert fresh_db.is_failed_mapping('tt0000999')
+    finally:
+        release.set()
+        flusher.join()
+
+    assert fresh_db.writes.get_mapping('title-name') is None
+    assert fresh_db.get_mapping('title-name') == ('123', 'tt0000123')
+    assert fresh_db.is_failed_mapping('tt0000999')
+
+
+def test_failed_flush_requeues(fresh_db, monkeypatch):
+    def broken(rows):
+        raise RuntimeError('database is gone')
+
+    monkeypatch.setattr(fresh_db, 'set_mappings', broken)
+    fresh_db.writes.add_mapping('title-name', '123', 'tt0000123')
+    fresh_db.writes.flush()
+    assert fresh_db.get_mapping('title-name') == ('123', 'tt0000123')
+    assert len(fresh_db.writes) == 1
+
+
+def test_synchronous_writes(fresh_db, monkeypatch):
+    monkeypatch.setattr(Config, 'DB_WRITE_BEHIND', False)
+    fresh_db.queue_mapping('title-name', '123', 'tt0000123')
+    fresh_db.queue_failed_mapping('tt0000999')
+    assert len(fresh_db.writes) == 0
+    assert fresh_db.writes._thread is None
+    assert fresh_db.get_all_mappings() == [('title-name', 'tt0000123')]
+    assert [imdb_id for imdb_id, _ in fresh_db.get_failed_mappings()] == ['tt0000999']
+
+
+def test_bulk_reads_include_queued_rows(fresh_db, monkeypatch):
+    monkeypatch.setattr(Config, 'DB_WRITE_BEHIND', True)
+    fresh_db.set_mappings([('stored', '1', 'tt0000001')])
+    fresh_db.queue_mapping('queued', '2', 'tt0000002')
+    assert fresh_db.get_mappings(['stored', 'queued', 'unknown']) == {'stored': ('1', 'tt0000001'), 'queued': ('2', 'tt0000002')}
+    assert fresh_db.get_slugs_by_imdb(['tt0000001', 'tt0000002', 'tt0000003']) == {'tt0000001': 'stored', 'tt0000002': 'queued'}
+    assert fresh_db.get_slug_by_imdb('tt0000002') == 'queued'
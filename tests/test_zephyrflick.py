@@ -0,0 +1,133 @@
+import asyncio
+import time
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app import aio
+from app.players import zephyrflick
+
+# Latency of each stub endpoint
+UPSTREAM_DELAY = 0.2
+PAGE = 'var playerjsSubtitle = "[English]https://subs.example/a.srt\n[Hindi]https://subs.example/b.vtt";'
+
+
+def _stub_app(calls: dict) -> web.Application:
+    async def api(request):
+        calls['api'] += 1
+        await asyncio.sleep(UPSTREAM_DELAY)
+        video_id = request.query['data']
+        return web.json_response({'videoSource': f'{zephyrflick.PLAYER_BASE_URL}/hls/{video_id}/master.m3u8'})
+
+    async def page(request):
+        calls['page'] += 1
+        await asyncio.sleep(UPSTREAM_DELAY)
+        if request.match_info['video_id'].startswith('bad'):
+            raise web.HTTPBadGateway()
+        return web.Response(text=PAGE, content_type='text/html')
+
+    app = web.Application()
+    app.router.add_post('/player/index.php', api)
+    app.router.add_get('/video/{video_id}', page)
+    return app
+
+
+def _run_with_stub(monkeypatch, scenario):
+    """Run `scenario(base_url, calls)` on a fresh loop against the stub player"""
+    calls = {'api': 0, 'page': 0}
+    zephyrflick.video_cache.clear()
+
+    async def main():
+        aio.use_loop(asyncio.get_running_loop())
+        server = TestServer(_stub_app(calls))
+        await server.start_server()
+        base_url = str(server.make_url('')).rstrip('/')
+        monkeypatch.setattr(zephyrflick, 'API_URL', f'{base_url}/player/index.php')
+        try:
+            return await scenario(base_url, calls)
+        finally:
+            await aio.close_session()
+            await server.close()
+
+    return asyncio.run(main())
+
+
+def test_extraction_result(monkeypatch):
+    async def scenario(base_url, calls):
+        return await zephyrflick.get_video_from_zephyrflick_player(f'{base_url}/video/abc123', 'hin', timeout=5)
+
+    video_url, quality, headers, subtitles = _run_with_stub(monkeypatch, scenario)
+    assert video_url.endswith('/hin/hls/abc123/master.m3u8')
+    assert quality == 'auto'
+    assert [sub['lang'] for sub in subtitles] == ['eng', 'hin']
+    # SRT tracks are advertised as WebVTT, converted by the subtitle proxy
+    assert all(sub['url'].endswith('.vtt') for sub in subtitles)
+
+
+def test_source_and_page_are_fetched_concurrently(monkeypatch):
+    async def scenario(base_url, calls):
+        started = time.perf_counter()
+        await zephyrflick.get_video_from_zephyrflick_player(f'{base_url}/video/abc123', timeout=5)
+        return time.perf_counter() - started
+
+    elapsed = _run_with_stub(monkeypatch, scenario)
+    # Both requests in flight together: about one upstream delay, not two
+    assert elapsed < UPSTREAM_DELAY * 1.8
+
+
+def test_many_videos_extract_in_parallel(monkeypatch):
+    videos = [f'{i:06x}' for i in range(20)]
+
+    async def scenario(base_url, calls):
+        started = time.perf_counter()
+        results = await asyncio.gather(*(
+            zephyrflick.get_video_from_zephyrflick_player(f'{base_url}/video/{video_id}', timeout=5)
+            for video_id in videos
+        ))
+        return time.perf_counter() - started, results
+
+    elapsed, results = _run_with_stub(monkeypatch, scenario)
+    assert all(video_url for video_url, _, _, _ in results)
+    # Sequential extraction would take 20 * 2 delays
+    assert elapsed < UPSTREAM_DELAY * 4
+
+
+def test_concurrent_requests_share_one_extraction(monkeypatch):
+    async def scenario(base_url, calls):
+        await asyncio.gather(*(
+            zephyrflick.get_video_from_zephyrflick_player(f'{base_url}/video/abc123', lang, timeout=5)
+            for lang in ('hin', 'eng', 'jpn', None) * 5
+        ))
+        # Later requests are answered from the cache
+        await zephyrflick.get_video_from_zephyrflick_player(f'{base_url}/video/abc123', timeout=5)
+        return dict(calls)
+
+    assert _run_with_stub(monkeypatch, scenario) == {'api': 1, 'page': 1}
+
+
+def test_timeout_gives_empty_result(monkeypatch):
+    async def scenario(base_url, calls):
+        return await zephyrflick.get_video_from_zephyrflick_player(
+            f'{base_url}/video/abc123', timeout=UPSTREAM_DELAY / 4
+        )
+
+    assert _run_with_stub(monkeypatch, scenario) == (None, None, None, [])
+
+
+def test_results_without_subtitles_are_cached_briefly(monkeypatch):
+    monkeypatch.setattr(zephyrflick, 'DEGRADED_CACHE_TTL', 0.1)
+
+    async def scenario(base_url, calls):
+        player_url = f'{base_url}/video/bad123'
+        first = await zephyrflick.get_video_from_zephyrflick_player(player_url, timeout=5)
+        await zephyrflick.get_video_from_zephyrflick_player(player_url, timeout=5)
+        assert calls['page'] == 1
+        await asyncio.sleep(0.15)
+        await zephyrflick.get_video_from_zephyrflick_player(player_url, timeout=5)
+        return first, calls['page']
+
+    (video_url, _, _, subtitles), page_calls = _run_with_stub(monkeypatch, scenario)
+    assert video_url.endswith('/hls/bad123/master.m3u8')
+    assert subtitles == []
+    # Retried once the short TTL passed
+    assert page_calls == 2